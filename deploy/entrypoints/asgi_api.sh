@@ -0,0 +1,10 @@
+#!/bin/bash
+export APP_NAME="Catho Role Normalization ASGI API (${DEPLOY_ENVIRONMENT})"
+
+echo "Starting ${APP_NAME}"
+
+export PYTHONPATH="/seek/role-normalization:$PYTHONPATH"
+
+cd /seek/role-normalization/role_normalization/api
+
+uvicorn --host 0.0.0.0 --port 8192 --timeout-keep-alive 75 $@ asgi_api:app
@@ -0,0 +1,7 @@
+#!/bin/bash
+export APP_NAME="Catho Role Normalization - compile model bundle (${DEPLOY_ENVIRONMENT})"
+
+echo "Starting ${APP_NAME}"
+
+export PYTHONPATH="/seek/role-normalization:$PYTHONPATH"
+python3 /seek/role-normalization/role_normalization/api/models/compile_model.py $@
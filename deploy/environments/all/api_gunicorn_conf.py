@@ -1,7 +1,60 @@
+import gc
 import multiprocessing
+import os
+import shutil
 
 bind = '0.0.0.0:8192'
-worker_class = 'sync'
-workers = multiprocessing.cpu_count()
+# Worker class: 'sync' serves one request at a time per process, 'gthread' serves up to `threads`
+# concurrent requests per process, all of them sharing a single, thread safe, RoleMatcher
+worker_class = os.getenv('ROLE_NORM_API_WORKER_CLASS', default='sync')
+workers = int(os.getenv('ROLE_NORM_API_WORKERS', default=multiprocessing.cpu_count()))
+threads = int(os.getenv('ROLE_NORM_API_THREADS', default=8)) if worker_class == 'gthread' else 1
 pidfile = '/seek/role-norm-gunicorn.pid'
 timeout = 450
+
+# Metrics of every worker are written to files in this directory and aggregated when /metrics is
+# requested, see api/metrics.py - set before the app, and prometheus_client, are imported. Files left
+# by a previous run are removed
+prometheus_multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/role-norm-metrics')
+shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+os.makedirs(prometheus_multiproc_dir)
+
+# Load models in a background thread of each worker, once it's listening, see api/component_loader.py
+background_loading = os.getenv('ROLE_NORM_BACKGROUND_LOADING', default='false').lower() == 'true'
+
+# Load models once, in the master process, and share them copy-on-write with forked workers
+preload_app = os.getenv('ROLE_NORM_PRELOAD_APP', default='true').lower() == 'true' \
+    and not background_loading
+
+# Garbage collection is paused while models are loaded: collections would write to the header of
+# every loaded object, and later to every page shared with workers, copying them
+if preload_app:
+    gc.disable()
+
+
+def when_ready(server):
+    # Called in the master process, after models are loaded and before workers are forked: move
+    # every loaded object to the permanent generation, so collections never touch them again
+    if preload_app:
+        gc.freeze()
+        gc.enable()
+        server.log.info(f'Model preloaded - {gc.get_freeze_count()} objects frozen in master process')
+
+
+def post_worker_init(worker):
+    # Called in each worker, after the app is loaded: load models, if not loaded yet, and fill caches
+    # in the background, reporting ready at /readiness once done - /healthcheck is answered meanwhile.
+    # Then check for model changes, reloading models when found
+    from role_normalization.api.cache_warmup import cache_warmup
+    from role_normalization.api.component_loader import component_loader
+    from role_normalization.api.model_reloader import model_reloader
+    component_loader.start()
+    cache_warmup.start()
+    model_reloader.start()
+
+
+def child_exit(server, worker):
+    # Called in the master process when a worker exits: metrics summed over live workers, like cache
+    # stats, no longer include it
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
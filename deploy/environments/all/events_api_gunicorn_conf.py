@@ -1,7 +1,31 @@
 import multiprocessing
+import os
+import shutil
 
 bind = '0.0.0.0:8192'
 worker_class = 'sync'
 workers = multiprocessing.cpu_count() * 2
 pidfile = '/seek/role-norm-gunicorn-events.pid'
 timeout = 450
+
+# Metrics of every worker are written to files in this directory and aggregated when /metrics is
+# requested, see api/metrics.py - set before the app, and prometheus_client, are imported. Files left
+# by a previous run are removed
+prometheus_multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/role-norm-events-metrics')
+shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+os.makedirs(prometheus_multiproc_dir)
+
+
+def post_worker_init(worker):
+    # Called in each worker, after the app is loaded: open database connections in the background,
+    # if ROLE_NORM_BACKGROUND_LOADING is enabled and not opened yet - see api/component_loader.py.
+    # Connections are pooled by each worker, see api/events/connection_pool.py
+    from role_normalization.api.component_loader import component_loader
+    component_loader.start()
+
+
+def child_exit(server, worker):
+    # Called in the master process when a worker exits: metrics summed over live workers, like open
+    # database connections, no longer include it
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -152,7 +152,7 @@ module "load_balancer" {
   sns_topic_arn                 = var.sns_topic_arn
   route53_public_zone_name      = var.route53_public_zone_name
   route53_public_dns_entry_name = "${terraform.workspace}.${var.region}.api.rolenormalization"
-  healthcheck_url               = "/healthcheck"
+  healthcheck_url               = "/readiness"
   default_tags = merge(
     var.default_tags,
     {
@@ -1,106 +1,93 @@
 import falcon
-import basicauth
-import os
 
 from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.cache_warmup import cache_warmup
+from role_normalization.api.component_loader import ComponentNotReadyError, component_loader, handle_not_ready
+from role_normalization.api.media import set_media_handlers
+from role_normalization.api.model_reloader import model_reloader
+from role_normalization.api.resources import AuthMiddleware, BuildInfo, HealthCheck, Metrics, RequireJSON
 from role_normalization.api.role_norm import RoleNormalization
+from role_normalization.api.role_norm_bulk import RoleNormalizationBulk
 
 
 spec = settings.spec
 
 
-class AuthMiddleware:
+class Readiness:
 
-    auth_user = settings.role_norm_api_user()
-    auth_password = settings.role_norm_api_password()
-
-    def process_request(self, req, resp):
-
-        if req.relative_uri == '/healthcheck' or \
-                req.relative_uri == '/buildinfo' or \
-                req.relative_uri.startswith('/v1/role_normalization/catho/doc/'):
-            return
-
-        auth = req.get_header('Authorization')
-
-        if not auth:
-            raise falcon.HTTPUnauthorized(
-                title='Unauthorized',
-                description='Missing authorization header')
-
-        if not self._auth_is_valid(auth):
-            raise falcon.HTTPUnauthorized(
-                title='Unauthorized',
-                description='Invalid authorization header')
-
-    def _auth_is_valid(self, auth):
-        try:
-
-            username, password = basicauth.decode(auth)
-            if username == self.auth_user and password == self.auth_password:
-                return True
-
-        except:
-            pass
-
-        return False
-
-
-class RequireJSON:
-
-    def process_request(self, req, resp):
-        if not req.client_accepts_json:
-            raise falcon.HTTPNotAcceptable(
-                description='Responses encoded as JSON not accepted by client')
-
-        if req.method in ('POST', 'PUT'):
-            if 'application/json' not in req.content_type:
-                raise falcon.HTTPUnsupportedMediaType(
-                    title='Request not encoded as JSON')
+    @spec.validate(tags=['meta'])
+    def on_get(self, req, resp):
+        """
+        Readiness endpoint, used by the load balancer - answered with 503 while the worker is still
+        loading models or warming up its caches, along with the state of each model, warm-up state,
+        duration and cache fill levels.
+        """
+        ready = component_loader.ready() and cache_warmup.ready()
+        resp.media = dict(cache_warmup.status(), ready=ready, components=component_loader.status())
+        resp.status = falcon.HTTP_200 if ready else falcon.HTTP_503
 
 
-class HealthCheck:
+class Lanes:
 
     @spec.validate(tags=['meta'])
     def on_get(self, req, resp):
         """
-        Health check endpoint, used to check if the API is running and can be reached.
+        Request lanes endpoint - returns limits, queue depth and wait times of each lane in the
+        worker process answering the request.
         """
-        resp.text = '{"status": "OK", "description": "Role Normalization API available"}'
+        resp.media = RoleNormalization.request_lanes.stats()
         resp.status = falcon.HTTP_200
 
 
-class BuildInfo:
+class ModelReload:
 
     @spec.validate(tags=['meta'])
     def on_get(self, req, resp):
         """
-        API info endpoint - returns build version, Git commit ID, etc.
+        Model reload endpoint - returns the models generation in use by the worker process answering
+        the request and its last reload stats.
         """
-        infopath = '/seek/build_info.json'
-        if os.path.isfile(infopath) and os.access(infopath, os.R_OK):
-            try:
-                file = open(infopath)
-                resp.text = file.read()
-                file.close()
-            except:
-                resp.text = '{"status": "ERROR", "description": "Error reading build_info.json file"}'
-                resp.status = falcon.HTTP_500
-            else:
-                resp.status = falcon.HTTP_200
-        else:
-            resp.text = '{"status": "Unknown", "description": "build_info.json file unavailable"}'
-            resp.status = falcon.HTTP_200
+        resp.media = model_reloader.status()
+        resp.status = falcon.HTTP_200
+
+    @spec.validate(tags=['meta'])
+    def on_post(self, req, resp):
+        """
+        Requests every worker process of this instance to reload models - catalog from database,
+        role IDs mapping and changed gazetteers - and swap them in, within
+        ROLE_NORM_MODEL_RELOAD_POLL_INTERVAL seconds. Progress is followed with GET.
+        """
+        if settings.model_reload_poll_interval <= 0:
+            raise falcon.HTTPConflict(
+                title='Conflict',
+                description='Model reloads are disabled')
+        model_reloader.request_reload()
+        resp.media = model_reloader.status()
+        resp.status = falcon.HTTP_202
+
 
+# Load models now, blocking, unless loaded in the background once the worker starts - see
+# post_worker_init in gunicorn_conf.py
+if not settings.background_loading:
+    component_loader.start(background=False)
 
 app = falcon.App(middleware=[
+    metrics.MetricsMiddleware(),
     AuthMiddleware(),
     RequireJSON()
 ])
 app.req_options.strip_url_path_trailing_slash = True
+set_media_handlers(app)
+app.add_error_handler(ComponentNotReadyError, handle_not_ready)
 
 app.add_route('/healthcheck', HealthCheck())
+app.add_route('/readiness', Readiness())
 app.add_route('/buildinfo', BuildInfo())
+app.add_route('/metrics', Metrics())
+app.add_route('/lanes', Lanes())
+app.add_route('/admin/reload', ModelReload())
 app.add_route('/v1/role_normalization/catho', RoleNormalization())
+app.add_route('/v1/role_normalization/catho/bulk', RoleNormalizationBulk())
 
 spec.register(app)
@@ -0,0 +1,90 @@
+import falcon.asgi
+
+from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.resources import AuthMiddleware, BuildInfo, HealthCheck, Metrics, RequireJSON
+from role_normalization.api.matcher_pool import MatcherPool
+from role_normalization.api.media import set_media_handlers
+from role_normalization.api.role_norm_asgi import RoleNormalizationAsync
+
+
+"""
+ASGI variant of the Role Normalization API, same contract as api.py. Run it with:
+uvicorn --host 0.0.0.0 --port 8192 asgi_api:app
+
+Connections are handled by an event loop and roles are normalized by a pool of processes forked
+with preloaded models, see MatcherPool.
+"""
+
+
+asgi_spec = settings.asgi_spec
+
+
+class MetricsMiddlewareAsync(metrics.MetricsMiddleware):
+
+    async def process_request(self, req, resp):
+        super().process_request(req, resp)
+
+    async def process_response(self, req, resp, resource, req_succeeded):
+        super().process_response(req, resp, resource, req_succeeded)
+
+
+class AuthMiddlewareAsync(AuthMiddleware):
+
+    async def process_request(self, req, resp):
+        super().process_request(req, resp)
+
+
+class RequireJSONAsync(RequireJSON):
+
+    async def process_request(self, req, resp):
+        super().process_request(req, resp)
+
+
+class HealthCheckAsync(HealthCheck):
+
+    @asgi_spec.validate(tags=['meta'])
+    async def on_get(self, req, resp):
+        """
+        Health check endpoint, used to check if the API is running and can be reached.
+        """
+        super().on_get(req, resp)
+
+
+class MetricsAsync(Metrics):
+
+    @asgi_spec.validate(tags=['meta'])
+    async def on_get(self, req, resp):
+        """
+        Metrics endpoint - returns metrics in Prometheus text format.
+        """
+        super().on_get(req, resp)
+
+
+class BuildInfoAsync(BuildInfo):
+
+    @asgi_spec.validate(tags=['meta'])
+    async def on_get(self, req, resp):
+        """
+        API info endpoint - returns build version, Git commit ID, etc.
+        """
+        super().on_get(req, resp)
+
+
+matcher_pool = MatcherPool()
+
+app = falcon.asgi.App(middleware=[
+    matcher_pool,
+    MetricsMiddlewareAsync(),
+    AuthMiddlewareAsync(),
+    RequireJSONAsync()
+])
+app.req_options.strip_url_path_trailing_slash = True
+set_media_handlers(app)
+
+app.add_route('/healthcheck', HealthCheckAsync())
+app.add_route('/buildinfo', BuildInfoAsync())
+app.add_route('/metrics', MetricsAsync())
+app.add_route('/v1/role_normalization/catho', RoleNormalizationAsync(matcher_pool))
+
+asgi_spec.register(app)
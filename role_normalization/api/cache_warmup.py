@@ -0,0 +1,143 @@
+import logbook
+import os
+import threading
+import time
+
+from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.component_loader import ComponentNotReadyError, component_loader
+from role_normalization.api.role_norm import RoleNormalization
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class CacheWarmup:
+
+    """
+    Replay the titles most often received, read from settings.warmup_titles_path, through
+    RoleMatcher.normalize_and_match() in a background thread, so the caches of a worker are filled
+    before it reports ready. Liveness (/healthcheck) is unaffected, readiness (/readiness) waits for
+    the warm-up to finish.
+    """
+
+    def __init__(self, titles_path: str = None, max_titles: int = None) -> None:
+        """
+        Parameters:
+        - titles_path : str : Titles file, one title per line, defaults to settings.warmup_titles_path
+        - max_titles  : int : Max titles replayed, defaults to settings.warmup_max_titles
+        """
+        self.titles_path = titles_path or settings.warmup_titles_path
+        self.max_titles = max_titles or settings.warmup_max_titles
+        # Either "pending", "running", "done" or "failed"
+        self.state = 'pending'
+        self.titles = 0
+        self.duration = None
+        self.thread = None
+
+    def start(self) -> None:
+        """
+        Start the warm-up in a background thread - or, if disabled, report ready right away.
+        """
+        if not settings.warmup_enabled:
+            self.state = 'done'
+            return
+        self.state = 'running'
+        self.thread = threading.Thread(target=self.run, name='cache-warmup', daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        """
+        Replay warm-up titles.
+        """
+        # Models may still be loading in the background
+        if not component_loader.wait():
+            logger.error(f'Components failed to load, caches won\'t be warmed up: {component_loader.failed()}')
+            self.state = 'failed'
+            return
+        start_time = time.perf_counter()
+        try:
+            self.titles = self.replay()
+            self.state = 'done'
+        except Exception as e:
+            logger.exception(f'Exception warming up caches: {e}')
+            self.state = 'failed'
+        self.duration = time.perf_counter() - start_time
+
+        metrics.warmup_duration.set(self.duration)
+        metrics.observe_caches(RoleNormalization.role_normalizer, RoleNormalization.response_fragments)
+        logger.info(f'Cache warm-up {self.state}: {self.titles} titles in {self.duration:.2f} s, '
+                    f'cache fill: {self.cache_fill()}')
+
+    def replay(self) -> int:
+        """
+        Replay warm-up titles through the models in use - also used to refill caches once reloaded
+        models are swapped in, see ModelReloader.
+
+        Returns:
+        - int : Titles replayed
+        """
+        titles = self._read_titles()
+        resource = RoleNormalization()
+        role_matcher = resource.role_normalizer
+        for roles in resource.split_titles(titles).values():
+            for role in roles:
+                # Same arguments normalization requests without filters use, so the same cache
+                # entries are filled - cache keys depend on how arguments are passed
+                role_matcher.normalize_and_match(role, None, 'full')
+        return len(titles)
+
+    def _read_titles(self) -> list:
+        # Read up to max_titles distinct titles, in file order - most frequent first. Spaces around
+        # titles are kept, as they are part of the roles cached
+        if not os.path.isfile(self.titles_path):
+            logger.warning(f'Warm-up titles not found, caches won\'t be warmed up: {self.titles_path}')
+            return []
+        titles = {}
+        with open(self.titles_path, encoding='utf-8') as f:
+            for line in f:
+                title = line.rstrip('\n')
+                if title.strip():
+                    titles[title] = None
+                    if len(titles) >= self.max_titles:
+                        break
+        return list(titles)
+
+    def ready(self) -> bool:
+        """
+        Return True if the warm-up finished, even if it failed.
+        """
+        return self.state in ('done', 'failed')
+
+    def cache_fill(self) -> dict:
+        """
+        Return the fill level, from 0.0 to 1.0, of each RoleMatcher cache - empty while models are loading.
+        """
+        try:
+            role_matcher = RoleNormalization.role_normalizer
+        except ComponentNotReadyError:
+            return {}
+        cache_fill = {}
+        for cache_name, cache_info in [
+            ('normalize_and_match', role_matcher.normalize_and_match.cache_info()),
+            ('normalize', role_matcher.normalizer.normalize.cache_info()),
+        ]:
+            cache_fill[cache_name] = round(cache_info.currsize / cache_info.maxsize, 4)
+        return cache_fill
+
+    def status(self) -> dict:
+        """
+        Return warm-up state, number of titles replayed, duration in seconds and cache fill levels.
+        """
+        return {
+            'ready': self.ready(),
+            'state': self.state,
+            'titles': self.titles,
+            'duration_s': round(self.duration, 3) if self.duration is not None else None,
+            'cache_fill': self.cache_fill(),
+        }
+
+
+# Warm-up of this worker process, started by the Gunicorn post_worker_init hook
+cache_warmup = CacheWarmup()
@@ -0,0 +1,206 @@
+import falcon
+import logbook
+import threading
+import time
+from collections import OrderedDict
+
+from role_normalization import settings
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class ComponentNotReadyError(Exception):
+
+    """
+    Raised when a component is requested before it's loaded.
+    """
+
+    def __init__(self, name: str, state: str) -> None:
+        super().__init__(f'Component {name} not ready: {state}')
+        self.name = name
+        self.state = state
+
+
+class ComponentLoader:
+
+    """
+    Load heavy components of an API - models, database connections - in the order they're
+    registered, either right away, blocking the caller, or in a background thread, so the worker
+    process starts listening right away (settings.background_loading).
+
+    Components are requested with get(): while still loading, requests wait up to
+    settings.component_wait seconds for them and are then refused with ComponentNotReadyError,
+    answered with 503 by handle_not_ready().
+    """
+
+    def __init__(self) -> None:
+        # Component names mapped to the functions creating them, in loading order
+        self.factories = OrderedDict()
+        self.components = {}
+        # Component names mapped to "pending", "loading", "ready" or "failed"
+        self.states = {}
+        self.durations = {}
+        self.loaded_events = {}
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory) -> None:
+        """
+        Register a component, loaded after the ones already registered.
+
+        Parameters:
+        - name    : str      : Component name
+        - factory : callable : Function creating the component, called without arguments
+        """
+        with self._lock:
+            if name in self.factories:
+                return
+            self.factories[name] = factory
+            self.states[name] = 'pending'
+            self.loaded_events[name] = threading.Event()
+
+    def start(self, background: bool = True) -> None:
+        """
+        Load registered components, once. Components failing to load are logged and reported as
+        failed if loaded in the background, and raise their exception otherwise.
+
+        Parameters:
+        - background : bool : Load components in a background thread, instead of blocking the caller
+        """
+        with self._lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._load_all, name='component-loader', daemon=True)
+            if background:
+                self.thread.start()
+        if not background:
+            self._load_all(raise_errors=True)
+
+    def _load_all(self, raise_errors: bool = False) -> None:
+        for name, factory in list(self.factories.items()):
+            if self.states[name] != 'pending':
+                continue
+            self.states[name] = 'loading'
+            start_time = time.perf_counter()
+            try:
+                self.components[name] = factory()
+                self.states[name] = 'ready'
+            except Exception as e:
+                self.states[name] = 'failed'
+                logger.exception(f'Exception loading {name}: {e}')
+                if raise_errors:
+                    raise
+            finally:
+                self.durations[name] = time.perf_counter() - start_time
+                self.loaded_events[name].set()
+            logger.info(f'Component {name} {self.states[name]} in {self.durations[name]:.2f} s')
+
+    def get(self, name: str, timeout: float = None):
+        """
+        Return a loaded component, starting background loading if not started yet.
+
+        Parameters:
+        - name    : str   : Component name
+        - timeout : float : Seconds to wait for the component if still loading, defaults to
+                            settings.component_wait
+
+        Returns:
+        - object : Component
+
+        Raises:
+        - ComponentNotReadyError : Component not loaded within timeout, or failed to load
+        """
+        if self.states.get(name) == 'ready':
+            return self.components[name]
+        if name not in self.factories:
+            raise KeyError(f'Component not registered: {name}')
+        self.start()
+        self.loaded_events[name].wait(settings.component_wait if timeout is None else timeout)
+        if self.states[name] != 'ready':
+            raise ComponentNotReadyError(name, self.states[name])
+        return self.components[name]
+
+    def replace(self, name: str, component) -> None:
+        """
+        Replace a loaded component, a reloaded model for example - requests already holding the
+        previous one keep using it.
+
+        Parameters:
+        - name      : str    : Component name
+        - component : object : New component
+        """
+        if self.states.get(name) != 'ready':
+            raise ComponentNotReadyError(name, self.states.get(name))
+        self.components[name] = component
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait for every registered component to be loaded, starting background loading if not
+        started yet.
+
+        Parameters:
+        - timeout : float : Seconds to wait, forever if None
+
+        Returns:
+        - bool : True if every component is ready
+        """
+        self.start()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for loaded_event in list(self.loaded_events.values()):
+            loaded_event.wait(max(deadline - time.monotonic(), 0) if deadline is not None else None)
+        return self.ready()
+
+    def ready(self) -> bool:
+        """
+        Return True if every registered component is loaded.
+        """
+        return all(state == 'ready' for state in self.states.values())
+
+    def failed(self) -> list:
+        """
+        Return names of components that failed to load.
+        """
+        return [name for name, state in self.states.items() if state == 'failed']
+
+    def status(self) -> dict:
+        """
+        Return the state and, once loaded, loading duration in seconds of each component, in loading order.
+        """
+        return OrderedDict(
+            (name, {
+                'state': self.states[name],
+                'duration_s': round(self.durations[name], 3) if name in self.durations else None,
+            })
+            for name in self.factories
+        )
+
+
+class Component:
+
+    """
+    Class attribute resolving to a component of component_loader, so resources can be defined, and
+    their module imported, before the component is loaded. Can be overridden per instance.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance, owner):
+        return component_loader.get(self.name)
+
+
+def handle_not_ready(req, resp, ex, params):
+    """
+    Falcon error handler answering requests refused with ComponentNotReadyError with 503.
+    """
+    logger.warning(f'Request refused: {ex}')
+    raise falcon.HTTPServiceUnavailable(
+        title='Service Unavailable',
+        description='API still starting, try again later',
+        retry_after=settings.component_retry_after)
+
+
+# Components of this process, loaded by the app module or by the Gunicorn post_worker_init hook
+component_loader = ComponentLoader()
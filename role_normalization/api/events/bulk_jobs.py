@@ -0,0 +1,374 @@
+import fcntl
+import json
+import logbook
+import os
+import re2 as re
+import shutil
+import threading
+import time
+import uuid
+
+from role_normalization import settings
+from role_normalization.api import metrics
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class BulkJobError(Exception):
+
+    """
+    Raised when a bulk job submitted is invalid.
+    """
+
+
+class BulkJobStore:
+
+    """
+    Bulk jobs of the events API, each a directory in settings.events_bulk_dir:
+
+    - ids.txt        : IDs submitted, one per line
+    - job.json       : Kind of IDs - "jobs" or "users" - origin, number of IDs and submission time
+    - progress.json  : State, IDs processed and bytes of results committed, written after each chunk,
+                       and failed attempts in a row, if any, with the time of the next one
+    - results.ndjson : Inferred role of each ID processed - {"id": "123", "role_id": 1104} - 0 if not inferred
+    - lock           : Locked by the runner processing the job
+
+    Results are only read up to the bytes committed in progress.json, so a chunk being written is
+    never read, and a job resumed by another runner continues from its last chunk committed.
+    """
+
+    kinds = ('jobs', 'users')
+
+    def __init__(self, path: str) -> None:
+        """
+        Parameters:
+        - path : str : Directory of bulk jobs, created if needed
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def job_file(self, bulk_id: str, name: str) -> str:
+        """
+        Return the path of a file of a bulk job.
+        """
+        return os.path.join(self.path, bulk_id, name)
+
+    def submit(self, kind: str, ids, origin: str) -> dict:
+        """
+        Submit a bulk job, written as IDs are read.
+
+        Parameters:
+        - kind   : str      : "jobs" or "users"
+        - ids    : iterable : Job or user IDs, int
+        - origin : str      : System submitting the job
+
+        Returns:
+        - dict : Job status, see status()
+
+        Raises:
+        - BulkJobError : No IDs, too many, or raised while reading them
+        """
+        bulk_id = uuid.uuid4().hex
+        # Written under a hidden name, so runners only see complete jobs
+        tmp_path = os.path.join(self.path, f'.{bulk_id}')
+        os.makedirs(tmp_path)
+        try:
+            total = 0
+            with open(os.path.join(tmp_path, 'ids.txt'), 'w') as f:
+                for id in ids:
+                    total += 1
+                    if total > settings.events_bulk_max_ids:
+                        raise BulkJobError(f'More than {settings.events_bulk_max_ids} IDs')
+                    f.write(f'{id}\n')
+            if not total:
+                raise BulkJobError('No IDs')
+            with open(os.path.join(tmp_path, 'job.json'), 'w') as f:
+                json.dump({'kind': kind, 'origin': origin, 'total': total, 'submitted_at': time.time()}, f)
+            os.rename(tmp_path, os.path.join(self.path, bulk_id))
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        metrics.bulk_jobs.labels(kind, 'submitted').inc()
+        logger.info(f'Bulk job {bulk_id} submitted by {origin}: {total} {kind}')
+        return self.status(bulk_id)
+
+    def status(self, bulk_id: str) -> dict:
+        """
+        Return the status of a bulk job, or None if not found.
+
+        Parameters:
+        - bulk_id : str : Bulk job ID
+
+        Returns:
+        - dict : Job and its progress - state ("queued", "running", "retrying", "done" or "failed"),
+                 IDs processed and inferred, results_size in bytes, IDs per second and estimated
+                 seconds left
+        """
+        if not re.fullmatch('[0-9a-f]{32}', bulk_id):
+            return None
+        try:
+            with open(self.job_file(bulk_id, 'job.json')) as f:
+                job = json.load(f)
+        except FileNotFoundError:
+            return None
+        progress = self.progress(bulk_id)
+        status = {'bulk_id': bulk_id, **job, **progress}
+        elapsed = (progress['updated_at'] or 0) - (progress['started_at'] or 0)
+        status['ids_per_second'] = round(progress['processed'] / elapsed, 1) if progress['processed'] and elapsed > 0 else None
+        status['eta_seconds'] = round((job['total'] - progress['processed']) / status['ids_per_second']) \
+            if status['ids_per_second'] and progress['state'] == 'running' else None
+        return status
+
+    def progress(self, bulk_id: str) -> dict:
+        """
+        Return the progress of a bulk job, written by its runner - queued if not started.
+        """
+        progress = {
+            'state': 'queued', 'processed': 0, 'inferred': 0, 'ids_offset': 0, 'results_size': 0,
+            'started_at': None, 'updated_at': None, 'finished_at': None, 'error': None,
+            'attempts': 0, 'retry_at': None,
+        }
+        try:
+            with open(self.job_file(bulk_id, 'progress.json')) as f:
+                progress.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        return progress
+
+    def write_progress(self, bulk_id: str, progress: dict) -> None:
+        """
+        Replace the progress of a bulk job, atomically.
+        """
+        tmp_path = self.job_file(bulk_id, 'progress.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, self.job_file(bulk_id, 'progress.json'))
+
+    def wait_results(self, bulk_id: str, offset: int, timeout: float) -> dict:
+        """
+        Wait up to timeout seconds for results after offset, unless the job is finished.
+
+        Returns:
+        - dict : Job status once results are available, finished or timed out, see status()
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self.status(bulk_id)
+            if status is None or status['results_size'] > offset or status['state'] in ('done', 'failed') or \
+                    time.monotonic() >= deadline:
+                return status
+            time.sleep(min(0.5, max(deadline - time.monotonic(), 0)))
+
+    def read_results(self, bulk_id: str, offset: int, size: int, block_size: int = 64 * 1024):
+        """
+        Read results of a bulk job, from byte offset up to size.
+
+        Returns:
+        - generator : Bytes of NDJSON results, by blocks
+        """
+        if offset >= size:
+            return
+        with open(self.job_file(bulk_id, 'results.ndjson'), 'rb') as f:
+            f.seek(offset)
+            while offset < size:
+                block = f.read(min(block_size, size - offset))
+                if not block:
+                    break
+                offset += len(block)
+                yield block
+
+    def claim(self) -> tuple:
+        """
+        Lock the oldest bulk job not finished, nor locked by another runner, nor waiting to be retried.
+
+        Returns:
+        - str  : Bulk job ID, None if none left
+        - file : Lock file, closed to release the job
+        """
+        jobs = []
+        for bulk_id in os.listdir(self.path):
+            if bulk_id.startswith('.') or not self._claimable(self.progress(bulk_id)):
+                continue
+            try:
+                jobs.append((os.stat(self.job_file(bulk_id, 'job.json')).st_mtime, bulk_id))
+            except FileNotFoundError:
+                continue
+        for _, bulk_id in sorted(jobs):
+            lock_file = open(self.job_file(bulk_id, 'lock'), 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue
+            # Run by another runner since listed
+            if not self._claimable(self.progress(bulk_id)):
+                lock_file.close()
+                continue
+            return bulk_id, lock_file
+        return None, None
+
+    def _claimable(self, progress: dict) -> bool:
+        # Not finished, and not waiting to be retried
+        if progress['state'] in ('done', 'failed'):
+            return False
+        return progress['state'] != 'retrying' or progress['retry_at'] <= time.time()
+
+    def remove_expired(self) -> None:
+        """
+        Remove bulk jobs finished more than settings.events_bulk_retention seconds ago, and
+        submissions interrupted more than that ago.
+        """
+        now = time.time()
+        for name in os.listdir(self.path):
+            if name.startswith('.'):
+                expired = now - os.stat(os.path.join(self.path, name)).st_mtime > settings.events_bulk_retention
+            else:
+                finished_at = self.progress(name)['finished_at']
+                expired = finished_at is not None and now - finished_at > settings.events_bulk_retention
+            if expired:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+                logger.info(f'Removed expired bulk job {name}')
+
+
+class BulkJobRunner:
+
+    """
+    Processes bulk jobs in a background thread, settings.events_bulk_chunk_size IDs at a time,
+    each chunk inferred like a request - sharing the connection pools of the worker process, which
+    bound its concurrency against the database and the Events API. At most
+    settings.events_bulk_runners worker processes run bulk jobs, those holding a runner slot lock in
+    the bulk jobs directory - if one exits, another one takes over, resuming its job. Jobs whose
+    chunks keep failing, the database or the Events API being unavailable, are retried from their
+    last chunk committed, backing off, and only failed after settings.events_bulk_job_attempts
+    attempts in a row without progress.
+    """
+
+    # Seconds between checks for new bulk jobs, or runner slots freed
+    check_interval = 5
+
+    def __init__(self, store: BulkJobStore, normalize: dict) -> None:
+        """
+        Parameters:
+        - store     : BulkJobStore : Bulk jobs
+        - normalize : dict         : Function inferring roles of a list of IDs, by kind - returning [[ID, role ID], ...]
+        """
+        self.store = store
+        self.normalize = normalize
+        self.thread = None
+        self.slot_file = None
+
+    def start(self) -> 'BulkJobRunner':
+        """
+        Run bulk jobs in a background thread, once holding a runner slot.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='events-bulk', daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if self.slot_file is None:
+                    self.slot_file = self._lock_slot()
+                if self.slot_file is not None:
+                    self.run_pending()
+                    self.store.remove_expired()
+            except Exception as e:
+                logger.exception(f'Exception running bulk jobs: {e}')
+            time.sleep(self.check_interval)
+
+    def _lock_slot(self):
+        for slot in range(settings.events_bulk_runners):
+            slot_file = open(os.path.join(self.store.path, f'.runner-{slot}.lock'), 'w')
+            try:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                logger.info(f'Running bulk jobs in this worker, slot {slot}')
+                return slot_file
+            except BlockingIOError:
+                slot_file.close()
+        return None
+
+    def run_pending(self) -> None:
+        """
+        Run bulk jobs not finished, nor locked by another runner, until none are left.
+        """
+        while True:
+            bulk_id, lock_file = self.store.claim()
+            if bulk_id is None:
+                return
+            with lock_file:
+                self.run(bulk_id)
+
+    def run(self, bulk_id: str) -> None:
+        """
+        Run a bulk job, from its last chunk committed.
+
+        Parameters:
+        - bulk_id : str : Bulk job ID, locked by the caller
+        """
+        status = self.store.status(bulk_id)
+        kind = status['kind']
+        progress = self.store.progress(bulk_id)
+        progress.update(state='running', error=None, started_at=progress['started_at'] or time.time())
+        self.store.write_progress(bulk_id, progress)
+        logger.info(f'Running bulk job {bulk_id}: {status["total"]} {kind}, {progress["processed"]} processed')
+        try:
+            with open(self.store.job_file(bulk_id, 'ids.txt'), 'rb') as ids_file, \
+                    open(self.store.job_file(bulk_id, 'results.ndjson'), 'ab') as results_file:
+                # Results of a chunk not committed are dropped, then written again
+                results_file.truncate(progress['results_size'])
+                results_file.seek(progress['results_size'])
+                ids_file.seek(progress['ids_offset'])
+                while True:
+                    chunk = [int(line) for line in (ids_file.readline() for _ in range(settings.events_bulk_chunk_size)) if line.strip()]
+                    if not chunk:
+                        break
+                    start_time = time.perf_counter()
+                    roles = self._normalize_chunk(kind, chunk)
+                    results_file.write(b''.join(
+                        json.dumps({'id': str(id), 'role_id': role_id}).encode() + b'\n' for id, role_id in roles))
+                    results_file.flush()
+                    progress.update(
+                        processed=progress['processed'] + len(chunk),
+                        inferred=progress['inferred'] + sum(1 for _, role_id in roles if role_id),
+                        ids_offset=ids_file.tell(),
+                        results_size=results_file.tell(),
+                        updated_at=time.time(),
+                        attempts=0)
+                    self.store.write_progress(bulk_id, progress)
+                    metrics.bulk_ids.labels(kind).inc(len(chunk))
+                    metrics.bulk_chunk_latency.labels(kind).observe(time.perf_counter() - start_time)
+            progress.update(state='done', finished_at=time.time())
+            metrics.bulk_jobs.labels(kind, 'done').inc()
+            logger.info(f'Bulk job {bulk_id} done: {progress["inferred"]} of {progress["processed"]} {kind} inferred')
+        except Exception as e:
+            attempts = progress['attempts'] + 1
+            if attempts >= settings.events_bulk_job_attempts:
+                progress.update(state='failed', finished_at=time.time(), error=str(e), attempts=attempts, retry_at=None)
+                metrics.bulk_jobs.labels(kind, 'failed').inc()
+                logger.exception(f'Bulk job {bulk_id} failed, attempt {attempts}: {e}')
+            else:
+                retry_interval = min(settings.events_bulk_retry_interval * 2 ** (attempts - 1), settings.events_bulk_max_retry_interval)
+                progress.update(state='retrying', error=str(e), attempts=attempts, retry_at=time.time() + retry_interval)
+                metrics.bulk_jobs.labels(kind, 'retrying').inc()
+                logger.exception(f'Bulk job {bulk_id} interrupted, attempt {attempts}, retried in {retry_interval} s: {e}')
+        finally:
+            self.store.write_progress(bulk_id, progress)
+
+    def _normalize_chunk(self, kind: str, chunk: list) -> list:
+        # Chunks failing are retried, backing off, before interrupting the job
+        for attempt in range(settings.events_bulk_attempts):
+            try:
+                return self.normalize[kind](chunk)
+            except Exception as e:
+                if attempt + 1 >= settings.events_bulk_attempts:
+                    raise
+                logger.warning(f'Exception inferring chunk of bulk {kind}, attempt {attempt + 1}: {e}')
+                time.sleep(2 ** attempt)
+
+
+# Bulk jobs of the events API, if enabled
+bulk_job_store = BulkJobStore(settings.events_bulk_dir) if settings.events_bulk_dir else None
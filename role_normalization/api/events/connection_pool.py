@@ -0,0 +1,174 @@
+import logbook
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from role_normalization import settings
+from role_normalization.api import metrics
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class ConnectionPoolTimeoutError(Exception):
+
+    """
+    Raised when no connection of a pool is freed within settings.events_db_pool_wait seconds.
+    """
+
+
+class ConnectionPool:
+
+    """
+    Bounded pool of database connections of a process. Connections are only opened when first
+    needed, so none is opened before Gunicorn forks workers - and a pool inherited by a forked
+    process starts over, leaving connections of its parent process alone.
+
+    Idle connections are reused, most recently used first: connections idle for longer than
+    settings.events_db_health_check_idle seconds are pinged before being used, and those idle for
+    longer than settings.events_db_max_idle seconds are closed. Connections whose query failed are
+    closed too, rather than reused.
+
+    Queries may run concurrently on the pool executor, one thread per connection.
+    """
+
+    def __init__(self, name: str, connect, max_size: int = None) -> None:
+        """
+        Parameters:
+        - name     : str      : Pool name, used in logs and metrics
+        - connect  : callable : Function opening a connection, called without arguments
+        - max_size : int      : Max connections open at once, defaults to settings.events_db_pool_size
+        """
+        self.name = name
+        self.connect = connect
+        self.max_size = max_size or settings.events_db_pool_size
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        # Connections inherited from the parent process are dropped without being closed, as closing
+        # them would end sessions the parent is still using
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._free_slots = threading.BoundedSemaphore(self.max_size)
+        # Idle connections, least recently used first: [(connection, monotonic time released), ...]
+        self._idle = []
+        self.size = 0
+        # Threads are only started once used, and never inherited by forked processes
+        self.executor = ThreadPoolExecutor(max_workers=self.max_size, thread_name_prefix=f'db-{self.name}')
+        self._observe()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection, returned to the pool once the block ends - or closed, if the block raised.
+
+        Raises:
+        - ConnectionPoolTimeoutError : Every connection busy for settings.events_db_pool_wait seconds
+        """
+        if self.pid != os.getpid():
+            self._reset()
+
+        start_time = time.perf_counter()
+        if not self._free_slots.acquire(timeout=settings.events_db_pool_wait):
+            metrics.db_pool_timeouts.labels(self.name).inc()
+            raise ConnectionPoolTimeoutError(f'No {self.name} connection freed in {settings.events_db_pool_wait} s')
+        metrics.db_pool_wait.labels(self.name).observe(time.perf_counter() - start_time)
+
+        try:
+            con = self._checkout()
+        except Exception:
+            self._free_slots.release()
+            raise
+        reusable = False
+        try:
+            yield con
+            reusable = True
+        finally:
+            self._checkin(con, reusable)
+            self._free_slots.release()
+
+    def _checkout(self):
+        # Reuse the most recently used idle connection, unless idle for too long or not responding
+        while True:
+            with self._lock:
+                self._close_expired()
+                if not self._idle:
+                    break
+                con, released_at = self._idle.pop()
+                self._observe()
+            if time.monotonic() - released_at < settings.events_db_health_check_idle:
+                return con
+            try:
+                con.ping(reconnect=False)
+                return con
+            except Exception as e:
+                logger.warning(f'{self.name} connection failed health check, closing it: {e}')
+                self._close(con, 'health_check')
+
+        con = self.connect()
+        with self._lock:
+            self.size += 1
+            self._observe()
+        metrics.db_pool_connections_opened.labels(self.name).inc()
+        return con
+
+    def _checkin(self, con, reusable: bool) -> None:
+        if not reusable:
+            self._close(con, 'failed')
+            return
+        with self._lock:
+            self._idle.append((con, time.monotonic()))
+            self._close_expired()
+            self._observe()
+
+    def _close_expired(self) -> None:
+        # Called holding the lock - idle connections are ordered by release time, oldest first
+        while self._idle and time.monotonic() - self._idle[0][1] > settings.events_db_max_idle:
+            con, _ = self._idle.pop(0)
+            self._close(con, 'idle', locked=True)
+
+    def _close(self, con, reason: str, locked: bool = False) -> None:
+        try:
+            con.close()
+        except Exception:
+            pass
+        if locked:
+            self.size -= 1
+        else:
+            with self._lock:
+                self.size -= 1
+                self._observe()
+        metrics.db_pool_connections_closed.labels(self.name, reason).inc()
+
+    def _observe(self) -> None:
+        metrics.db_pool_connections.labels(self.name, 'idle').set(len(self._idle))
+        metrics.db_pool_connections.labels(self.name, 'in_use').set(self.size - len(self._idle))
+
+
+# Pools of this process, by user, host and port, shared by every DbConnection
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def connection_pool(user: str, host: str, port: int, connect) -> ConnectionPool:
+    """
+    Return the connection pool of this process for a database user, host and port, created if needed.
+
+    Parameters:
+    - user    : str      : Database user
+    - host    : str      : Database host, also the pool name
+    - port    : int      : Database port
+    - connect : callable : Function opening a connection, used if the pool is created
+
+    Returns:
+    - ConnectionPool : Connection pool
+    """
+    with _pools_lock:
+        pool = _pools.get((user, host, port))
+        if pool is None:
+            pool = _pools[(user, host, port)] = ConnectionPool(host, connect)
+        return pool
@@ -0,0 +1,207 @@
+import codecs
+import json
+import logbook
+import os
+import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from role_normalization import settings
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+# Fields of each apply used to infer roles, others are skipped while parsing responses
+apply_fields = ('job_id', 'user_id', 'timestamp')
+
+
+class EventsApiClient:
+
+    """
+    Client of the Events API of a process. Requests go through a session kept alive between calls,
+    with at most settings.events_api_pool_size connections, created once first needed - never
+    inherited by forked processes. Requests failing to connect, or answered with 502, 503 or 504,
+    are retried settings.events_api_retries times, backing off exponentially.
+
+    Applies of many IDs are requested by sub-requests of settings.events_api_batch_size IDs, sent
+    concurrently, and responses are parsed as they're received, one ID at a time, keeping only the
+    fields in apply_fields.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self.pid = os.getpid()
+        self._session = None
+        # Threads are only started once used, and never inherited by forked processes
+        self.executor = ThreadPoolExecutor(max_workers=settings.events_api_pool_size, thread_name_prefix='events-api')
+
+    @property
+    def session(self) -> requests.Session:
+        if self.pid != os.getpid():
+            self._reset()
+        with self._lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def _create_session(self) -> requests.Session:
+        retry = Retry(
+            total=settings.events_api_retries,
+            read=0,
+            status_forcelist=(502, 503, 504),
+            # Lookups only, safe to retry
+            allowed_methods=frozenset(['POST']),
+            backoff_factor=settings.events_api_backoff,
+            raise_on_status=False)
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.events_api_pool_size,
+            max_retries=retry,
+            pool_block=True)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Content-type'] = 'application/json'
+        return session
+
+    def get_applies(self, url: str, ids_field: str, ids: list, limit_days: int, limit_applies: int) -> dict:
+        """
+        Get applies of users or jobs, by concurrent sub-requests.
+
+        Parameters:
+        - url           : str        : Events API endpoint
+        - ids_field     : str        : Request field of IDs - "user_ids" or "job_ids"
+        - ids           : [int, ...] : User or job IDs
+        - limit_days    : int        : Days applies are retrieved from, 0 for any
+        - limit_applies : int        : Max applies per ID
+
+        Returns:
+        - dict : Applies of each ID answered, only their apply_fields - {'id': {'applies': [{'job_id': 'string', 'user_id': 'string', 'timestamp': 0}, ...]}, ...}
+        """
+        batch_size = settings.events_api_batch_size
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        if len(batches) < 2:
+            return self._post_applies(url, ids_field, ids, limit_days, limit_applies)
+
+        applies = {}
+        for batch_applies in self.executor.map(
+                lambda batch_ids: self._post_applies(url, ids_field, batch_ids, limit_days, limit_applies), batches):
+            applies.update(batch_applies)
+        return applies
+
+    def _post_applies(self, url: str, ids_field: str, ids: list, limit_days: int, limit_applies: int) -> dict:
+        payload = {
+            'days': limit_days,
+            ids_field: [str(id) for id in ids],
+            'limit': limit_applies,
+            'origin': 'role_inference_by_event',
+        }
+        with self.session.post(
+                url,
+                data=json.dumps(payload),
+                timeout=(settings.events_api_connect_timeout, settings.events_lookup_timeout),
+                stream=True) as response:
+            if response.status_code != 200:
+                logger.warning(f'Events API answered {response.status_code} for {len(ids)} {ids_field}')
+                return {}
+            return {
+                id: {'applies': [{field: apply.get(field) for field in apply_fields} for apply in id_applies['applies']]}
+                for id, id_applies in iter_json_object(response.iter_content(chunk_size=65536))
+                if isinstance(id_applies, dict) and 'applies' in id_applies
+            }
+
+
+def iter_json_object(chunks):
+    """
+    Parse a JSON object received in chunks, yielding each of its items once received - so only
+    the item being parsed is held in memory, rather than the whole object.
+
+    Parameters:
+    - chunks : iterable : Bytes of the UTF-8 encoded JSON object
+
+    Returns:
+    - generator : Key and value of each item of the object
+    """
+    decoder = json.JSONDecoder()
+    utf8_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    ended = False
+
+    def skip(pos):
+        return json.decoder.WHITESPACE.match(buffer, pos).end()
+
+    def read():
+        # Append the next chunk to the buffer, dropping what's already parsed
+        nonlocal buffer, pos, ended
+        chunk = next(chunks, None)
+        if chunk is None:
+            if ended:
+                raise json.JSONDecodeError('Unexpected end of JSON object', buffer, len(buffer))
+            ended = True
+            chunk = b''
+        buffer = buffer[pos:] + utf8_decoder.decode(chunk, final=ended)
+        pos = 0
+
+    def expect(char):
+        # Skip whitespace and the expected delimiter, reading more if needed
+        nonlocal pos
+        while True:
+            pos = skip(pos)
+            if pos < len(buffer):
+                if buffer[pos] != char:
+                    raise json.JSONDecodeError(f'Expecting {char!r}', buffer, pos)
+                pos += 1
+                return
+            read()
+
+    def decode():
+        # Decode the next value, reading more until it's complete
+        nonlocal pos
+        while True:
+            pos = skip(pos)
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A number is only complete once followed by a delimiter, it may continue in the next chunk
+                if not isinstance(value, (int, float)) or ended or \
+                        (end < len(buffer) and buffer[end] in ' \t\n\r,}'):
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if ended:
+                    raise
+            read()
+
+    expect('{')
+    while True:
+        pos = skip(pos)
+        while pos >= len(buffer):
+            read()
+            pos = skip(pos)
+        if buffer[pos] == '}':
+            return
+        key = decode()
+        expect(':')
+        yield key, decode()
+        while True:
+            pos = skip(pos)
+            if pos < len(buffer):
+                break
+            read()
+        if buffer[pos] == ',':
+            pos += 1
+        elif buffer[pos] != '}':
+            raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+
+
+# Events API client of this process
+events_api_client = EventsApiClient()
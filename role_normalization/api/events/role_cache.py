@@ -0,0 +1,181 @@
+import logbook
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from role_normalization import settings
+from role_normalization.api import metrics
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class SharedRoleCache:
+
+    """
+    Roles by ID cached in a SQLite database shared by every worker process of a host - see
+    settings.events_shared_cache_path, ideally in memory backed /dev/shm. Each thread of each
+    process opens its own connection, once first used. Failures are logged and treated as misses,
+    so the database is only a cache, never needed to answer.
+    """
+
+    # Max query parameters of older SQLite versions is 999
+    batch_size = 500
+
+    def __init__(self, path: str) -> None:
+        """
+        Parameters:
+        - path : str : SQLite database file, created if needed
+        """
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        if getattr(self._local, 'pid', None) != os.getpid():
+            con = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=OFF')
+            con.execute('CREATE TABLE IF NOT EXISTS roles (cache TEXT, id TEXT, role INTEGER, expires REAL, PRIMARY KEY (cache, id))')
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return self._local.con
+
+    def get_many(self, cache: str, ids: list) -> dict:
+        """
+        Return cached roles of IDs, not expired - None for IDs known to have no role - with the
+        seconds they're still cached for: {'ID': (role ID or None, seconds), ...}
+        """
+        found = {}
+        now = time.time()
+        try:
+            con = self._connection()
+            for i in range(0, len(ids), self.batch_size):
+                batch_ids = ids[i:i + self.batch_size]
+                rows = con.execute(
+                    f'SELECT id, role, expires FROM roles WHERE cache = ? AND expires > ? AND id IN ({",".join(["?"] * len(batch_ids))})',
+                    [cache, now, *batch_ids])
+                found.update((id, (role, expires - now)) for id, role, expires in rows)
+        except sqlite3.Error as e:
+            logger.warning(f'Exception reading shared {cache} cache: {e}')
+        return found
+
+    def set_many(self, cache: str, roles: dict, ttl: float, negative_ttl: float) -> None:
+        """
+        Cache roles of IDs, None for IDs without role, expiring after their TTL.
+        """
+        now = time.time()
+        try:
+            con = self._connection()
+            con.executemany('INSERT OR REPLACE INTO roles VALUES (?, ?, ?, ?)', [
+                (cache, id, role, now + (ttl if role is not None else negative_ttl)) for id, role in roles.items()])
+            # Expired entries are removed now and then
+            if random.random() < 0.01:
+                con.execute('DELETE FROM roles WHERE expires <= ?', [now])
+        except sqlite3.Error as e:
+            logger.warning(f'Exception writing shared {cache} cache: {e}')
+
+
+class RoleCache:
+
+    """
+    Roles by ID - of jobs or users - cached by a process for settings.events_roles_cache_ttl seconds,
+    least recently used dropped once settings.events_roles_cache_max_size are cached. IDs without
+    role are cached too, for settings.events_roles_cache_negative_ttl seconds, so they aren't looked
+    up again by every request. Misses are looked up in the shared cache, if enabled, before the
+    database.
+    """
+
+    def __init__(self, name: str, shared: SharedRoleCache = None) -> None:
+        """
+        Parameters:
+        - name   : str             : Cache name, used in metrics
+        - shared : SharedRoleCache : Cache shared by every worker process, if any
+        """
+        self.name = name
+        self.shared = shared
+        # {'ID': (role ID or None, monotonic expiry time), ...}, least recently used first
+        self.roles = OrderedDict()
+        self._lock = threading.Lock()
+        # Cache lookups, for metrics
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def get_roles(self, ids: list, fetch) -> dict:
+        """
+        Return roles of IDs, cached or fetched.
+
+        Parameters:
+        - ids   : list     : Job or user IDs
+        - fetch : callable : Function fetching roles of IDs not cached, returning {'ID': role ID, ...}
+
+        Returns:
+        - dict : Role of each ID with role - {'ID': role ID, ...}
+        """
+        ids = {str(id): id for id in ids}
+        if settings.events_roles_cache_ttl <= 0:
+            return {id: role for id, role in fetch(list(ids.values())).items() if role is not None}
+
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for id in ids:
+                entry = self.roles.get(id)
+                if entry is not None and entry[1] > now:
+                    self.roles.move_to_end(id)
+                    found[id] = entry[0]
+        missing = [id for id in ids if id not in found]
+
+        if missing and self.shared is not None:
+            shared_found = self.shared.get_many(self.name, missing)
+            # Cached until they expire in the shared cache
+            self._set({id: role for id, (role, _) in shared_found.items()}, {id: ttl for id, (_, ttl) in shared_found.items()})
+            found.update((id, role) for id, (role, _) in shared_found.items())
+            self.shared_hits += len(shared_found)
+            missing = [id for id in missing if id not in shared_found]
+
+        if missing:
+            fetched = fetch([ids[id] for id in missing])
+            fetched = {id: fetched.get(id) for id in missing}
+            self._set(fetched)
+            if self.shared is not None:
+                self.shared.set_many(self.name, fetched, settings.events_roles_cache_ttl, settings.events_roles_cache_negative_ttl)
+            found.update(fetched)
+
+        self.hits += len(ids) - len(missing)
+        self.misses += len(missing)
+        self.observe()
+        return {id: role for id, role in found.items() if role is not None}
+
+    def _set(self, roles: dict, ttls: dict = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for id, role in roles.items():
+                if ttls is not None:
+                    ttl = ttls[id]
+                else:
+                    ttl = settings.events_roles_cache_ttl if role is not None else settings.events_roles_cache_negative_ttl
+                self.roles[id] = (role, now + ttl)
+                self.roles.move_to_end(id)
+            while len(self.roles) > settings.events_roles_cache_max_size:
+                self.roles.popitem(last=False)
+
+    def observe(self) -> None:
+        """
+        Copy cache stats of this process to their gauges.
+        """
+        metrics.cache_hits.labels(self.name).set(self.hits)
+        metrics.cache_misses.labels(self.name).set(self.misses)
+        metrics.cache_size.labels(self.name).set(len(self.roles))
+        if self.shared is not None:
+            metrics.cache_hits.labels(self.name + '_shared').set(self.shared_hits)
+
+
+# Roles caches of this process, shared by both events normalizers
+shared_role_cache = SharedRoleCache(settings.events_shared_cache_path) if settings.events_shared_cache_path else None
+job_roles_cache = RoleCache('events_job_roles', shared_role_cache)
+user_roles_cache = RoleCache('events_user_roles', shared_role_cache)
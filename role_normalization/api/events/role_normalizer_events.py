@@ -1,16 +1,31 @@
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone,timedelta
-import json
 import logbook
 import pymysql
-import requests
 import time
 
 from role_normalization import settings
+from role_normalization.api.events.connection_pool import ConnectionPoolTimeoutError, connection_pool
+from role_normalization.api.events.events_api_client import events_api_client
+from role_normalization.api.events.role_cache import job_roles_cache, user_roles_cache
+from role_normalization.api.events.role_snapshot import role_snapshots
+from role_normalization.api.events.role_voting import vote_roles
+from role_normalization.api.events.vote_counters import vote_counters, vote_events_consumer
 
 logger = logbook.Logger(__name__)
 settings.logger_group.add_logger(logger)
 
 class DbConnection:
+
+    """
+    Queries a MySQL host with connections drawn from the connection pool of this process for that
+    host - opened once first needed, after Gunicorn forks workers, and shared by every DbConnection
+    and lookup thread of the process.
+    """
+
+    # Query parameters placeholder of the database driver
+    placeholder = '%s'
+
     def __init__(self,
             user,
             password,
@@ -21,46 +36,79 @@ class DbConnection:
         self.password = password
         self.host = host
         self.port = port
-        self._connect()
+        self.pool = connection_pool(user, host, port, self._connect)
 
     def _connect(self):
-        self.con = pymysql.connect(
+        logger.info(f'Connecting to DB on {self.host}')
+        return pymysql.connect(
             user = self.user,
             password = self.password,
             host = self.host,
             port = self.port,
-            connect_timeout = 300)
+            connect_timeout = settings.events_db_connect_timeout,
+            read_timeout = settings.events_lookup_timeout)
 
     def check(self):
-        try:
-            self.con.ping(True)
-        except Exception:
-            logger.warning(f'Problem accessing connection at {self.host}. Creating new connection.')
-            self._connect()
-        
-    def fetch_all(self, query):
+        # Borrow a connection, opening the first one of the pool - fails if the host can't be reached
+        with self.pool.connection():
+            pass
 
-        self.check()
+    def fetch_all(self, query, args=None):
 
         attempts = 3
 
         while attempts > 0:
             attempts -= 1
             try:
-                cur = self.con.cursor()
-                cur.execute(query)
-                return cur.fetchall()
+                # A connection whose query failed is closed, the next attempt uses another one
+                with self.pool.connection() as con:
+                    cur = con.cursor()
+                    cur.execute(query, args)
+                    return cur.fetchall()
+            except ConnectionPoolTimeoutError:
+                raise
             except Exception as ex:
                 if attempts < 1:
                     raise ex
 
-    def batch_fetch_all(self, query, items, batch_size):
-        result = []
-        for i in range(0, len(items), batch_size):
-            batch_items = items[i:i+batch_size]
-            batch_query = query.format(",".join(map(str, batch_items)))
-            result.update(self.fetch_all(query))
-        return result
+    def batch_fetch(self, query, items, batch_size=None):
+        """
+        Run a query for chunks of items, concurrently over the connection pool, yielding rows of
+        each chunk as soon as it's fetched - rows of the same chunk in order, chunks in any order.
+
+        Parameters:
+        - query      : str   : Query with a single "{}" in place of the items of an IN list
+        - items      : list  : Items, passed as query parameters rather than formatted into the query
+        - batch_size : int   : Items per chunk, defaults to settings.events_db_batch_size
+
+        Returns:
+        - generator : Rows of every chunk
+        """
+        batch_size = batch_size or settings.events_db_batch_size
+        batches = [items[i:i+batch_size] for i in range(0, len(items), batch_size)]
+        if len(batches) < 2:
+            for batch_items in batches:
+                yield from self._fetch_batch(query, batch_items)
+            return
+
+        futures = [self.pool.executor.submit(self._fetch_batch, query, batch_items) for batch_items in batches]
+        try:
+            for future in as_completed(futures):
+                yield from future.result()
+        finally:
+            # Chunks not started yet are skipped if another failed or rows are no longer needed
+            for future in futures:
+                future.cancel()
+
+    def batch_fetch_all(self, query, items, batch_size=None):
+        """
+        Run a query for chunks of items, see batch_fetch(), returning rows of every chunk.
+        """
+        return list(self.batch_fetch(query, items, batch_size))
+
+    def _fetch_batch(self, query, batch_items):
+        batch_query = query.format(','.join([self.placeholder] * len(batch_items)))
+        return self.fetch_all(batch_query, batch_items)
 
 class RoleNormalizerEvents:
 
@@ -78,8 +126,6 @@ class RoleNormalizerEvents:
         """
         logger.info('Initializing RoleNormalizerEvents instance')
 
-        logger.info(f'Connecting to DB on {settings.mysql_read_host()}')
-
         self.db_con = DbConnection(
             user = settings.mysql_user(),
             password = settings.mysql_passwd(),
@@ -90,6 +136,21 @@ class RoleNormalizerEvents:
             password = settings.mysql_passwd(),
             host = settings.mysql_read_applies_host())
 
+        # Hosts checked while loading, so failures are reported at /healthcheck
+        self.db_con.check()
+        self.dw_con.check()
+
+        # Local role snapshots, if enabled, mapped and refreshed in the background
+        role_snapshots.start(self.db_con)
+
+        # Vote counters, if enabled, updated from events in the background
+        if vote_events_consumer is not None:
+            vote_events_consumer.start(self)
+
+        # Runs independent lookups concurrently, if settings.events_concurrent_lookups - threads are
+        # only started once used, so it's safe to create before Gunicorn forks workers
+        self.executor = ThreadPoolExecutor(max_workers=settings.events_lookup_threads, thread_name_prefix='events-lookup')
+
 #    def _get_applies_origin(self, usr_ids: list, job_ids: list) -> list:
 #        """
 #        Retrieve apply origin from database.
@@ -124,32 +185,43 @@ class RoleNormalizerEvents:
 #        """
 #        return self.dw_con.fetch_all(apply_origem_db_query)
     
-    def _get_jobs_contacts(self, job_ids: list, limit: int ) -> dict:
+    def _get_jobs_contacts(self, job_ids: list, limit: int) -> dict:
         """
-        Retrieve contacts from database.
+        Retrieve the most recent contacts of jobs from database.
+
+        Parameters:
+        - job_ids : [int, ...] : Job IDs
+        - limit   : int        : Max contacts per job, most recent first - ranked by the query itself
 
         Returns:
-        - [(int, str), ...] : List of tuples with role ID and title
+        - dict : Users contacted by each job with contacts, most recent first - {job_id: [usr_id, ...], ...}
         """
         logger.info('Recovering Contacts from db')
 
-        query = """
+        # Contacts ranked by date within each job, so at most limit rows per job are transferred
+        query = f"""
             SELECT
-                f.vag_id AS vag_id,
-                f.usr_id AS usr_id
-            FROM 
-                Data_Warehouse.f_contatos as f
-            LEFT JOIN 
-                Data_Warehouse.dim_data dd ON f.dim_data_contato_id = dd.dim_data_id
-            WHERE
-                f.vag_id IN ({})
+                c.vag_id AS vag_id,
+                c.usr_id AS usr_id
+            FROM (
+                SELECT
+                    f.vag_id AS vag_id,
+                    f.usr_id AS usr_id,
+                    ROW_NUMBER() OVER (PARTITION BY f.vag_id ORDER BY dd.dim_data_id DESC, f.usr_id) AS contact_rank
+                FROM
+                    Data_Warehouse.f_contatos as f
+                LEFT JOIN
+                    Data_Warehouse.dim_data dd ON f.dim_data_contato_id = dd.dim_data_id
+                WHERE
+                    f.vag_id IN ({{}})
+            ) AS c
+            WHERE c.contact_rank <= {int(limit)}
+            ORDER BY c.vag_id, c.contact_rank
         """
         if not job_ids:
             return {}
 
-        # LIMIT {limit_contacts}
-        batch_query = query.format(','.join(map(str,job_ids)))
-        rows = self.dw_con.fetch_all(batch_query)
+        rows = self.dw_con.batch_fetch(query, list(job_ids))
         r = {}
         for row in rows:
             job_id = row[0]
@@ -167,7 +239,7 @@ class RoleNormalizerEvents:
         - [int,...] : List of job IDs
 
         Returns:
-        - {'123123': 321, '234234': 234, ... } : Dict of (str)job_id: (int)role_num
+        - {'123123': 321, '234234': 234, ... } : Dict of (str)job_id: (int)role_num, only jobs with role
         """
         query = """
              SELECT
@@ -181,12 +253,19 @@ class RoleNormalizerEvents:
         if not job_ids:
             return {}
 
-        batch_query = query.format(','.join(map(str,job_ids)))
-        rows = self.db_con.fetch_all(batch_query)
-        r = {}
-        for row in rows:
-            r[str(row[0])] = row[1]
-        return r
+        def fetch(missing_ids):
+            r = {}
+            for row in self.db_con.batch_fetch(query, missing_ids):
+                r[str(row[0])] = row[1]
+            return r
+
+        # Roles in the local snapshot, if enabled, are resolved without querying - only newer IDs are
+        snapshot_roles = {}
+        if role_snapshots.job_roles is not None:
+            snapshot_roles, job_ids = role_snapshots.job_roles.lookup(job_ids)
+
+        # Only IDs not cached are fetched, IDs without role are cached too
+        return {**snapshot_roles, **job_roles_cache.get_roles(job_ids, fetch)}
     
     def _get_usrs_roles(self, usr_ids: list) -> dict:
         """
@@ -195,7 +274,7 @@ class RoleNormalizerEvents:
         - [int,...] : List of user ID
 
         Returns:
-        - [(int, int), ...] : List of tuples with user ID and role ID
+        - {'123123': 321, ... } : Dict of (str)usr_id: (int)role_num, only users with role
         """
         query = """
             SELECT
@@ -209,12 +288,19 @@ class RoleNormalizerEvents:
         if not usr_ids:
             return {}
 
-        batch_query = query.format(','.join(map(str,usr_ids)))
-        rows = self.db_con.fetch_all(batch_query)
-        r = {}
-        for row in rows:
-            r[str(row[0])] = row[1]
-        return r
+        def fetch(missing_ids):
+            r = {}
+            for row in self.db_con.batch_fetch(query, missing_ids):
+                r[str(row[0])] = row[1]
+            return r
+
+        # Roles in the local snapshot, if enabled, are resolved without querying - only newer IDs are
+        snapshot_roles = {}
+        if role_snapshots.user_roles is not None:
+            snapshot_roles, usr_ids = role_snapshots.user_roles.lookup(usr_ids)
+
+        # Only IDs not cached are fetched, IDs without role are cached too
+        return {**snapshot_roles, **user_roles_cache.get_roles(usr_ids, fetch)}
 
     def _get_last_users_applies_from_api(self, user_ids: list, limit_days=0, limit_applies=300) -> dict:
         """
@@ -229,16 +315,12 @@ class RoleNormalizerEvents:
         - int: max number of applies per ID
 
         Returns:
-        dict: List of applies from each id
+        dict: List of applies from each id, only the fields used to infer roles - see events_api_client.py
         {
             "{user_id/job_id}": {
                 "applies": [
                 {
-                    "company_id": "string",
-                    "cv_id": "string",
                     "job_id": "string",
-                    "profile_id": "string",
-                    "recruiter_id": "string",
                     "timestamp": 0,
                     "user_id": "string"
                 }, ...
@@ -248,41 +330,14 @@ class RoleNormalizerEvents:
         """
         if not user_ids:
             logger.info('No user_ids to infer role', 'error')
-            return []
-
-        events_url = settings.events_usr_applies_url()
-        
-        api_events_response = []
+            return {}
 
         try:
-
-            headers = {'Content-type': 'application/json'}
-            # if events_api_auth:
-            #     headers = {
-            #         'Authorization': settings.events_api_auth(),
-            #         }
-            
-            payload = {
-                "days": limit_days,
-                "limit": limit_applies,
-                "origin": "role_inference_by_event",
-                "user_ids": [str(id) for id in user_ids]
-                }
-            
-            response = requests.post(events_url, headers=headers, data=json.dumps(payload))
-
-            # logger.info(f'Events API response: {response.text}')
-            logger.info(f'Events API response: ok')
-
-            if response.status_code == 200:
-                api_events_response = response.json()
-
+            return events_api_client.get_applies(settings.events_usr_applies_url(), 'user_ids', list(user_ids), limit_days, limit_applies)
         except Exception:
             logger.info(f'Error recovering applies via Events API: {user_ids}')
             raise
 
-        return api_events_response
-
 #    def _get_last_users_applies_from_db(self, user_ids: list, limit_days=0, limit_applies=10) -> dict:
 #
 #        limit_clause = ""
@@ -321,16 +376,12 @@ class RoleNormalizerEvents:
         - int: max number of applies per ID
 
         Returns:
-        dict: List of applies from each id
+        dict: List of applies from each id, only the fields used to infer roles - see events_api_client.py
         {
             "{user_id/job_id}": {
                 "applies": [
                 {
-                    "company_id": "string",
-                    "cv_id": "string",
                     "job_id": "string",
-                    "profile_id": "string",
-                    "recruiter_id": "string",
                     "timestamp": 0,
                     "user_id": "string"
                 }, ...
@@ -340,63 +391,84 @@ class RoleNormalizerEvents:
         """
         if not job_ids:
             logger.info('No ids to infer role', 'error')
-            return []
-
-        events_url = settings.events_job_applies_url()
-        
-        api_events_response = []
+            return {}
 
         try:
+            return events_api_client.get_applies(settings.events_job_applies_url(), 'job_ids', list(job_ids), limit_days, limit_applies)
+        except Exception:
+            logger.info(f'Error recovering applies via Events API: {job_ids}')
+            raise
 
-            headers = {'Content-type': 'application/json'}
-            # if events_api_auth:
-            #     headers = {
-            #         'Authorization': settings.events_api_auth(),
-            #         }
-
-            payload = {
-                "days": limit_days,
-                "job_ids": [str(id) for id in job_ids],
-                "limit": limit_applies,
-                "origin":  "role_inference_by_event"               
-                }
-
-            response = requests.post(events_url, headers=headers, data=json.dumps(payload))
+    def _get_jobs_contacts_roles(self, job_ids: list, limit_contacts: int) -> tuple:
+        """
+        Retrieve contacts of jobs, then roles of the users contacted.
 
-            # logger.info(f'Events API response: {response.text}')
-            logger.info(f'Events API response: ok')
+        Returns:
+        - dict : Contacts of each job - {job_id: [usr_id, ...], ...}
+        - dict : Role of each user - {'usr_id': role_id, ...}
+        """
+        contacts = self._get_jobs_contacts(job_ids, limit_contacts)
+        usr_ids = [usr_id for job_usr_ids in contacts.values() for usr_id in job_usr_ids]
+        return contacts, self._get_usrs_roles(usr_ids)
 
-            if response.status_code == 200:
-                api_events_response = response.json()
+    def _get_jobs_applies_roles(self, job_ids: list, limit_days: int, limit_applies: int) -> tuple:
+        """
+        Retrieve applies to jobs from Events API, then roles of the users who applied.
 
-        except Exception:
-            logger.info(f'Error recovering applies via Events API: {job_ids}')
-            raise
+        Returns:
+        - dict : Applies to each job, see _get_last_job_applies()
+        - dict : Role of each user - {'usr_id': role_id, ...}
+        """
+        if not job_ids:
+            return {}, {}
+        jobs_applies = self._get_last_job_applies(job_ids, limit_days, limit_applies)
+        usr_ids = [
+            job_apply['user_id']
+            for job_id in jobs_applies.keys() if 'applies' in jobs_applies[job_id]
+            for job_apply in jobs_applies[job_id]['applies']
+        ]
+        logger.debug(f"Got {str(len(usr_ids))} applies for {str(len(jobs_applies))} jobs")
+        return jobs_applies, self._get_usrs_roles(usr_ids)
+
+    def _get_usrs_applies_roles(self, usr_ids: list, limit_days: int, limit_applies: int) -> tuple:
+        """
+        Retrieve applies of users from Events API, then roles of the jobs applied to.
 
-        return api_events_response
+        Returns:
+        - dict : Applies of each user, see _get_last_users_applies_from_api()
+        - dict : Role of each job - {'job_id': role_id, ...}
+        """
+        usrs_applies = self._get_last_users_applies_from_api(usr_ids, limit_days, limit_applies)
+        jobs_list = []
+        for usr_id in usrs_applies.keys():
+            if 'applies' in usrs_applies[usr_id]:
+                for usr_apply in usrs_applies[usr_id]['applies']:
+                    jobs_list.append(usr_apply["job_id"])
+        job_roles = {}
+        if len(jobs_list) > 0:
+            job_roles = self._get_jobs_roles(jobs_list)
+        return usrs_applies, job_roles
 
-    def _most_frequent(self, role_id_list: list):
+    def _lookup_result(self, lookup: Future, pending: list, deadline: float):
         """
-        Function that receive a list of role id and return the most frequent element
+        Wait for the result of a concurrent lookup until the deadline. If it fails or times out, the
+        pending lookups of the same request are cancelled - unless already running - and the error
+        raised, as sequential lookups do.
 
         Parameters:
-        - role_id_list: role id list 
+        - lookup   : Future        : Lookup waited for
+        - pending  : [Future, ...] : Other lookups of the request, still to be waited for
+        - deadline : float         : time.monotonic() by which every lookup of the request should end
 
         Returns:
-        - int: Most frequent role id
+        - object : Result of the lookup
         """
-        if not role_id_list:
-            return 0
-
-        counter = 0
-        num = 0
-        for i in role_id_list:
-            if i !=0 and not i is None: 
-                curr_frequency = role_id_list.count(i)
-                if(curr_frequency> counter):
-                    counter = curr_frequency
-                    num = i
-        return num
+        try:
+            return lookup.result(timeout=max(deadline - time.monotonic(), 0))
+        except BaseException:
+            for pending_lookup in [lookup] + pending:
+                pending_lookup.cancel()
+            raise
 
     def normalize_usr_ids(self, usr_ids: list):
 
@@ -407,51 +479,56 @@ class RoleNormalizerEvents:
         - usr_ids               : list : User ids with non normalized roles to be normalized
         
         Returns:
-        - list       : Inferred role
+        - list       : Inferred role of each user ID, once, in order - 0 if not inferred
         """
 
         if not usr_ids:
             return []
-        
-        # response variable
-        inferred_roles = []
-        
-        # events variables
-        limit_day = 0
-        limit_applies = 200
-        # retrieve last applies from api
-        usrs_applies = self._get_last_users_applies_from_api(usr_ids,limit_day,limit_applies)
 
-        a = time.time()
-        
-        jobs_list = []
-        for usr_id in usrs_applies.keys():
-            if 'applies' in usrs_applies[usr_id]:
-                for usr_apply in usrs_applies[usr_id]['applies']:
-                    jobs_list.append(usr_apply["job_id"])
-        job_roles = {}
-        if len(jobs_list) > 0:
-            job_roles = self._get_jobs_roles(jobs_list)
+        usr_ids = list(dict.fromkeys(usr_ids))
 
-        for usr_id in usr_ids:
-            usr_id = str(usr_id)
-            if usr_id in usrs_applies and 'applies' in usrs_applies[usr_id]:
-                usr_roles = []
-                for usr_apply in usrs_applies[usr_id]['applies']:
-                    job_id = usr_apply["job_id"]
-                    if job_id in job_roles:
-                        usr_roles.append(job_roles[job_id])
-                if len(usr_roles) > 0:
-                    # infer new role_id based on most_frequent applies
-                    inferred_roles.append([usr_id,self._most_frequent(usr_roles)])
-                else:
-                    logger.info(f'Role ID for usr {usr_id} not infered because we could get no role IDs for usr applies')
-                    inferred_roles.append([usr_id,0])
-            else:
-                inferred_roles.append([usr_id,0])
-                logger.info(f'Role ID for usr {usr_id} not infered because the apply list is empty')
+        # Roles of users counted are read from their vote counters, others inferred from scratch
+        counted_roles = vote_counters.get_roles('user', usr_ids) if vote_counters is not None else {}
+        infer_ids = [usr_id for usr_id in usr_ids if str(usr_id) not in counted_roles]
 
-        return inferred_roles
+        # events variables
+        limit_day = 0
+        limit_applies = 200
+        # retrieve last applies from api, then roles of the jobs applied to - concurrently, by chunks
+        # of users, each chunk's job roles retrieved as soon as its applies arrive
+        if settings.events_concurrent_lookups:
+            usrs_applies = {}
+            job_roles = {}
+            chunk_size = settings.events_users_chunk_size
+            lookups = [
+                self.executor.submit(self._get_usrs_applies_roles, infer_ids[i:i + chunk_size], limit_day, limit_applies)
+                for i in range(0, len(infer_ids), chunk_size)
+            ]
+            try:
+                for lookup in as_completed(lookups, timeout=settings.events_concurrent_lookups_timeout):
+                    chunk_usrs_applies, chunk_job_roles = lookup.result()
+                    usrs_applies.update(chunk_usrs_applies)
+                    job_roles.update(chunk_job_roles)
+            finally:
+                # Chunks not started yet are skipped if another failed or time ran out
+                for lookup in lookups:
+                    lookup.cancel()
+        else:
+            usrs_applies, job_roles = self._get_usrs_applies_roles(infer_ids, limit_day, limit_applies)
+
+        # infer new role_id based on weighted votes of the roles of jobs applied to
+        usr_votes = [
+            (usr_id, job_roles.get(usr_apply['job_id']), usr_apply.get('timestamp'), 'apply')
+            for usr_id, usr_applies in usrs_applies.items() if 'applies' in usr_applies
+            for usr_apply in usr_applies['applies']
+        ]
+        usr_roles = vote_roles(usr_votes)
+        if vote_counters is not None:
+            vote_counters.count('user', usr_votes)
+        logger.debug(f'Inferred roles of {len(usr_roles)} of {len(infer_ids)} users, {len(counted_roles)} counted')
+
+        usr_roles.update(counted_roles)
+        return [[str(usr_id), usr_roles.get(str(usr_id), 0)] for usr_id in usr_ids]
  
     def normalize_job_ids(self, job_ids: list):
 
@@ -462,81 +539,64 @@ class RoleNormalizerEvents:
         - job_ids               : list : Vag ids with non normalized roles to be normalized
 
         Returns:
-        - list                  : Inferred role id 
+        - list                  : Inferred role id of each job ID, once, in order - 0 if not inferred
         """
 
         if not job_ids:
             logger.info('No ids to infer role', 'error')
             return []
-        
-        # response variable
-        inferred_roles = []
-        jobs_found = []
+
+        job_ids = list(dict.fromkeys(job_ids))
+
+        # Roles of jobs counted are read from their vote counters, others inferred from scratch
+        counted_roles = vote_counters.get_roles('job', job_ids) if vote_counters is not None else {}
+        infer_ids = [job_id for job_id in job_ids if str(job_id) not in counted_roles]
 
         # events variables
         limit_day = 0
         limit_applies = 200
-        limit_contacts = 200
-
-        inference_type = ''
+        limit_contacts = settings.events_contacts_limit
+
+        # Contacts and applies of all jobs are retrieved concurrently, each followed by the roles of
+        # their users - applies of jobs inferred from contacts are left unused, unless combined with
+        # contacts. Sequentially, applies are only retrieved for jobs they're used for
+        if settings.events_concurrent_lookups:
+            deadline = time.monotonic() + settings.events_concurrent_lookups_timeout
+            contacts_lookup = self.executor.submit(self._get_jobs_contacts_roles, infer_ids, limit_contacts)
+            applies_lookup = self.executor.submit(self._get_jobs_applies_roles, infer_ids, limit_day, limit_applies)
+            contacts, usr_roles = self._lookup_result(contacts_lookup, [applies_lookup], deadline)
+        else:
+            contacts, usr_roles = self._get_jobs_contacts_roles(infer_ids, limit_contacts)
+
+        # Roles of users contacted are keyed by user ID string
+        contacts_votes = [
+            (job_id, usr_roles.get(str(usr_id)), None, 'contact')
+            for job_id in infer_ids for usr_id in contacts.get(job_id, [])
+        ]
+        if settings.events_combine_contacts_applies:
+            get_by_apply = infer_ids
+        else:
+            contacts_roles = vote_roles(contacts_votes)
+            get_by_apply = [job_id for job_id in infer_ids if job_id not in contacts_roles]
+
+        if settings.events_concurrent_lookups:
+            jobs_applies, applies_roles = self._lookup_result(applies_lookup, [], deadline)
+        else:
+            jobs_applies, applies_roles = self._get_jobs_applies_roles(get_by_apply, limit_day, limit_applies)
 
-        contacts = self._get_jobs_contacts(job_ids, limit_contacts)
-
-        usr_ids = []
-        for job_id in contacts.keys():
-            usr_ids.extend(contacts[job_id])
-
-        usr_roles = self._get_usrs_roles(usr_ids)
-
-        get_by_apply = []
-        for job_id in job_ids:
-            if job_id in contacts and len(contacts[job_id]) > 0:
-                roles = []
-                for usr_id in contacts[job_id]:
-                    if usr_id in usr_roles:
-                        roles.append(usr_roles[usr_id])
-                if len(roles) > 0:
-                    inferred_roles.append([job_id,self._most_frequent(roles)])
-                    jobs_found.append(job_id)
-                else:
-                    get_by_apply.append(job_id)
-            else:
-                get_by_apply.append(job_id)
-
-
-        jobs_applies = self._get_last_job_applies(get_by_apply,limit_day,limit_applies)
-        applies = []
-        ac = 0
-        for job_id in jobs_applies.keys():
-            if 'applies' in jobs_applies[job_id]:
-                for job_apply in jobs_applies[job_id]['applies']:
-                    applies.append(job_apply['user_id'])
-                    ac += 1
-        logger.debug(f"Got {str(ac)} applies for {str(len(jobs_applies))} jobs")
-        
-        applies_roles = self._get_usrs_roles(applies)
-        
         logger.debug(f"Got {str(len(applies_roles))} user roles")
 
-        for job_id in get_by_apply:
-            roles = []
-            if str(job_id) in jobs_applies and 'applies' in jobs_applies[str(job_id)]:
-                for job_apply in jobs_applies[str(job_id)]['applies']:
-                    usr_id = job_apply['user_id']
-                    if usr_id in applies_roles:
-                        roles.append(applies_roles[usr_id])
-                    else:
-                        logger.info(f"Got no roles for usr {str(usr_id)}")
-            else:
-                logger.debug(f"Got no applies for job {str(job_id)}")
-            if len(roles) > 0:
-                inferred_roles.append([job_id,self._most_frequent(roles)])
-                jobs_found.append(job_id)
-            else:
-                inferred_roles.append([job_id,0])
-        
-        for job_id in job_ids:
-            if job_id not in jobs_found:
-                inferred_roles.append([job_id,0])
-
-        return inferred_roles
+        applies_votes = [
+            (job_id, applies_roles.get(job_apply['user_id']), job_apply.get('timestamp'), 'apply')
+            for job_id in get_by_apply if 'applies' in jobs_applies.get(str(job_id), {})
+            for job_apply in jobs_applies[str(job_id)]['applies']
+        ]
+        if settings.events_combine_contacts_applies:
+            job_roles = vote_roles(contacts_votes + applies_votes)
+        else:
+            job_roles = {**contacts_roles, **vote_roles(applies_votes)}
+        if vote_counters is not None:
+            vote_counters.count('job', contacts_votes + applies_votes)
+        logger.debug(f'Inferred roles of {len(job_roles)} of {len(infer_ids)} jobs, {len(counted_roles)} counted')
+
+        return [[job_id, job_roles.get(job_id, counted_roles.get(str(job_id), 0))] for job_id in job_ids]
@@ -0,0 +1,275 @@
+import fcntl
+import json
+import logbook
+import numpy as np
+import os
+import threading
+import time
+
+from role_normalization import settings
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+job_roles_query = """
+    SELECT
+        v.vag_id as vag_id,
+        vc.cargo_id AS cargo_id,
+        NULL AS modified
+    FROM conline.vag AS v
+    LEFT JOIN conline.vag_cargo vc ON (v.vag_id=vc.vag_id)
+    WHERE {condition}
+    ORDER BY v.vag_id
+"""
+
+user_roles_query = """
+    SELECT
+        c.usr_id as usr_id,
+        vc.cargo_id AS cargo_id,
+        c.data_alteracao AS modified
+    FROM conline.cur AS c
+    LEFT JOIN conline.cur_cargo vc ON c.cur_id=vc.cur_id
+    WHERE {condition}
+    ORDER BY c.usr_id
+"""
+
+
+class RoleSnapshot:
+
+    """
+    Local snapshot of the roles of every job or user, in settings.events_snapshot_dir: a single
+    file with an array of sorted IDs and an array of their roles - 0 if without role - memory-mapped
+    by every worker process of the host, so roles are looked up by binary search, without querying
+    the database. Only IDs newer than the snapshot, greater than its last ID, are still looked up
+    in the database.
+
+    The snapshot is refreshed by one worker process, see RoleSnapshots: rows modified since the last
+    refresh, and rows of new IDs, are merged every settings.events_snapshot_refresh_interval seconds,
+    and it's rebuilt from scratch every settings.events_snapshot_rebuild_interval seconds.
+    """
+
+    def __init__(self, name: str, query: str, id_column: str, modified_column: str = None) -> None:
+        """
+        Parameters:
+        - name            : str : Snapshot name, also its file name
+        - query           : str : Query of IDs, roles and modification dates, with "{condition}" in its WHERE clause, ordered by ID
+        - id_column       : str : ID column
+        - modified_column : str : Modification date column, refreshing rows modified since, or None to only add new IDs
+        """
+        self.name = name
+        self.query = query
+        self.id_column = id_column
+        self.modified_column = modified_column
+        self.path = os.path.join(settings.events_snapshot_dir, f'{name}.npy')
+        self.meta_path = os.path.join(settings.events_snapshot_dir, f'{name}.json')
+        # Memory-mapped [[ID, ...], [role ID, ...]] and the modification time of its file
+        self.snapshot = None
+        self.mtime = None
+
+    def load(self) -> bool:
+        """
+        Map the snapshot file, if written since last mapped.
+
+        Returns:
+        - bool : Snapshot mapped
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime != self.mtime:
+            self.snapshot = np.load(self.path, mmap_mode='r')
+            self.mtime = mtime
+            logger.info(f'Mapped {self.name} snapshot: {self.snapshot.shape[1]} IDs')
+        return True
+
+    def lookup(self, ids: list) -> tuple:
+        """
+        Look up roles of IDs in the snapshot.
+
+        Parameters:
+        - ids : list : Job or user IDs
+
+        Returns:
+        - dict : Role of each ID with role - {'ID': role ID, ...}
+        - list : IDs newer than the snapshot, or every ID if not mapped yet
+        """
+        snapshot = self.snapshot
+        if snapshot is None or not snapshot.shape[1]:
+            return {}, list(ids)
+        snapshot_ids, snapshot_roles = snapshot[0], snapshot[1]
+        lookup_ids = np.array([int(id) for id in ids], dtype=np.int64)
+        positions = np.searchsorted(snapshot_ids, lookup_ids).clip(max=len(snapshot_ids) - 1)
+        found = snapshot_ids[positions] == lookup_ids
+        roles = np.where(found, snapshot_roles[positions], 0)
+        newer = lookup_ids > snapshot_ids[-1]
+        return (
+            {str(id): role for id, role in zip(lookup_ids[roles != 0].tolist(), roles[roles != 0].tolist())},
+            [id for id, is_newer in zip(ids, newer.tolist()) if is_newer],
+        )
+
+    def refresh(self, db_con, rebuild: bool = False) -> None:
+        """
+        Merge rows modified since the last refresh, and rows of new IDs, into the snapshot - or
+        rebuild it, if asked or not built yet - and write it.
+
+        Parameters:
+        - db_con  : DbConnection : Database connection
+        - rebuild : bool         : Rebuild from scratch
+        """
+        start_time = time.perf_counter()
+        meta = self._read_meta()
+        if rebuild or meta is None or not self.load():
+            ids, roles, modified = self._fetch(db_con, '1 = 1', [])
+            meta = {'built_at': time.time()}
+        else:
+            # New IDs, then rows modified since the last refresh - queried apart, each by its index
+            last_id = int(self.snapshot[0][-1]) if self.snapshot.shape[1] else 0
+            ids, roles, modified = self._fetch(db_con, f'{self.id_column} > {db_con.placeholder}', [last_id])
+            if self.modified_column and meta.get('modified'):
+                modified_ids, modified_roles, last_modified = self._fetch(
+                    db_con, f'{self.modified_column} >= {db_con.placeholder}', [meta['modified']])
+                ids, roles = self._last_rows(np.concatenate([ids, modified_ids]), np.concatenate([roles, modified_roles]))
+                modified = max(filter(None, [modified, last_modified]), default=None)
+            ids, roles = self._merge(ids, roles)
+
+        write_path = self.path + '.tmp'
+        with open(write_path, 'wb') as f:
+            np.save(f, np.stack([ids, roles]))
+        os.replace(write_path, self.path)
+        # Modification dates are those of the database, written once the snapshot including them is
+        meta['modified'] = max(filter(None, [modified, meta.get('modified')]), default=None)
+        with open(self.meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(self.meta_path + '.tmp', self.meta_path)
+        self.load()
+        logger.info(f'Refreshed {self.name} snapshot in {time.perf_counter() - start_time:.2f} s: {len(ids)} IDs')
+
+    def built_at(self) -> float:
+        """
+        Return when the snapshot was last rebuilt from scratch, in seconds since epoch, or None.
+        """
+        meta = self._read_meta()
+        return meta.get('built_at') if meta else None
+
+    def _fetch(self, db_con, condition: str, args: list) -> tuple:
+        # Rows read by pages of IDs - a page full of rows may end in the middle of an ID's rows, whose
+        # rows are read again with the next page
+        pages_ids = []
+        pages_roles = []
+        modified = None
+        last_id = -1
+        while True:
+            rows = db_con.fetch_all(
+                self.query.format(condition=f'({condition}) AND {self.id_column} > {db_con.placeholder}')
+                + f' LIMIT {int(settings.events_snapshot_page_size)}',
+                [*args, last_id])
+            if not rows:
+                break
+            if len(rows) == settings.events_snapshot_page_size:
+                page_last_id = rows[-1][0]
+                complete_rows = [row for row in rows if row[0] != page_last_id]
+                rows = complete_rows or rows
+            pages_ids.append(np.array([row[0] for row in rows], dtype=np.int64))
+            pages_roles.append(np.array([row[1] or 0 for row in rows], dtype=np.int64))
+            modified = max(filter(None, [modified, *(str(row[2]) for row in rows if row[2] is not None)]), default=None)
+            last_id = rows[-1][0]
+        if not pages_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), modified
+        return (*self._last_rows(np.concatenate(pages_ids), np.concatenate(pages_roles)), modified)
+
+    @staticmethod
+    def _last_rows(ids: np.ndarray, roles: np.ndarray) -> tuple:
+        # Rows sorted by ID, keeping the last row of each ID, as lookups in the database did
+        order = np.argsort(ids, kind='stable')
+        ids, roles = ids[order], roles[order]
+        last = np.r_[ids[1:] != ids[:-1], True] if len(ids) else np.empty(0, dtype=bool)
+        return ids[last], roles[last]
+
+    def _merge(self, ids: np.ndarray, roles: np.ndarray) -> tuple:
+        # Changed rows replace those of the snapshot, new rows are inserted in order
+        snapshot_ids, snapshot_roles = np.asarray(self.snapshot[0]), np.asarray(self.snapshot[1])
+        positions = np.searchsorted(snapshot_ids, ids).clip(max=max(len(snapshot_ids) - 1, 0))
+        changed = (snapshot_ids[positions] == ids) if len(snapshot_ids) else np.zeros(len(ids), dtype=bool)
+        snapshot_roles = snapshot_roles.copy()
+        snapshot_roles[positions[changed]] = roles[changed]
+        insert_positions = np.searchsorted(snapshot_ids, ids[~changed])
+        return (
+            np.insert(snapshot_ids, insert_positions, ids[~changed]),
+            np.insert(snapshot_roles, insert_positions, roles[~changed]),
+        )
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+class RoleSnapshots:
+
+    """
+    Job and user role snapshots of a worker process, enabled by settings.events_snapshot_dir: mapped
+    again whenever their files are written, checked every settings.events_snapshot_check_interval
+    seconds in a background thread. The worker process holding the snapshots directory lock also
+    refreshes them - if it exits, another one takes over.
+    """
+
+    def __init__(self) -> None:
+        self.job_roles = None
+        self.user_roles = None
+        self.thread = None
+        self.refreshing = False
+        self.last_error = None
+        if settings.events_snapshot_dir:
+            # Jobs have no known modification date: new jobs are added, changed roles caught by rebuilds
+            self.job_roles = RoleSnapshot('job_roles', job_roles_query, 'v.vag_id')
+            self.user_roles = RoleSnapshot('user_roles', user_roles_query, 'c.usr_id', 'c.data_alteracao')
+
+    def start(self, db_con) -> None:
+        """
+        Map snapshots and keep them refreshed, in a background thread.
+
+        Parameters:
+        - db_con : DbConnection : Connection to the database snapshots are read from
+        """
+        if self.job_roles is None or self.thread is not None:
+            return
+        os.makedirs(settings.events_snapshot_dir, exist_ok=True)
+        self.db_con = db_con
+        self.thread = threading.Thread(target=self._run, name='role-snapshots', daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        lock_file = open(os.path.join(settings.events_snapshot_dir, 'refresh.lock'), 'w')
+        last_refresh = 0.0
+        while True:
+            try:
+                if not self.refreshing:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        self.refreshing = True
+                        logger.info('Refreshing role snapshots in this worker')
+                    except BlockingIOError:
+                        pass
+                if self.refreshing and time.monotonic() - last_refresh >= settings.events_snapshot_refresh_interval:
+                    last_refresh = time.monotonic()
+                    for snapshot in [self.job_roles, self.user_roles]:
+                        built_at = snapshot.built_at()
+                        snapshot.refresh(
+                            self.db_con,
+                            rebuild=built_at is None or time.time() - built_at >= settings.events_snapshot_rebuild_interval)
+                for snapshot in [self.job_roles, self.user_roles]:
+                    snapshot.load()
+                self.last_error = None
+            except Exception as e:
+                logger.exception(f'Exception refreshing role snapshots: {e}')
+                self.last_error = str(e)
+            time.sleep(settings.events_snapshot_check_interval)
+
+
+# Role snapshots of this worker process, started once the events normalizers are loaded
+role_snapshots = RoleSnapshots()
@@ -0,0 +1,78 @@
+import numpy as np
+import time
+
+from role_normalization import settings
+
+
+def vote_roles(votes, now: float = None) -> dict:
+    """
+    Infer the role of each entity - job or user - as the role with the most weighted votes, for
+    every entity of a request at once. Each vote is weighted by the weight of its source, in
+    settings.events_vote_weights, and decays with its age, halving every
+    settings.events_vote_half_life_days days if set. Votes without role, or with role 0, are
+    ignored. Ties are won by the role voted first.
+
+    Parameters:
+    - votes : iterable : Votes - (entity, role ID, timestamp or None, source), timestamps in seconds or milliseconds since epoch
+    - now   : float    : Time votes decay until, in seconds since epoch, defaults to now
+
+    Returns:
+    - dict : Inferred role of each entity voted for - {entity: role_id, ...}
+    """
+    entity_codes = {}
+    role_codes = {}
+    entities = []
+    roles = []
+    source_weights = []
+    timestamps = []
+    for entity, role_id, timestamp, source in votes:
+        if not role_id:
+            continue
+        entities.append(entity_codes.setdefault(entity, len(entity_codes)))
+        roles.append(role_codes.setdefault(role_id, len(role_codes)))
+        source_weights.append(settings.events_vote_weights.get(source, 1.0))
+        timestamps.append(timestamp or np.nan)
+    if not entities:
+        return {}
+
+    entities = np.array(entities, dtype=np.int64)
+    weights = np.array(source_weights, dtype=np.float64) * vote_decay(timestamps, now)
+
+    # Weights summed by entity and role, each pair keeping the position of its first vote
+    pairs, first_votes, pair_of_vote = np.unique(
+        entities * len(role_codes) + np.array(roles, dtype=np.int64), return_index=True, return_inverse=True)
+    scores = np.bincount(pair_of_vote, weights=weights)
+    pair_entities = pairs // len(role_codes)
+
+    # Best pair of each entity: sorted by entity, highest score, then first vote
+    order = np.lexsort((first_votes, -scores, pair_entities))
+    best = order[np.r_[True, pair_entities[order][1:] != pair_entities[order][:-1]]]
+
+    entity_ids = list(entity_codes)
+    role_ids = list(role_codes)
+    return {
+        entity_ids[entity_code]: role_ids[role_code]
+        for entity_code, role_code in zip(pair_entities[best].tolist(), (pairs[best] % len(role_codes)).tolist())
+    }
+
+
+def vote_decay(timestamps: list, now: float = None) -> np.ndarray:
+    """
+    Decay factor of votes by age, halving every settings.events_vote_half_life_days days if set,
+    1.0 otherwise and for votes without timestamp.
+
+    Parameters:
+    - timestamps : list  : Timestamp of each vote, in seconds or milliseconds since epoch, or NaN
+    - now        : float : Time votes decay until, in seconds since epoch, defaults to now
+
+    Returns:
+    - np.ndarray : Decay factor of each vote
+    """
+    if settings.events_vote_half_life_days <= 0:
+        return np.ones(len(timestamps))
+    timestamps = np.array(timestamps, dtype=np.float64)
+    # Timestamps in milliseconds are told apart by their magnitude
+    timestamps = np.where(timestamps > 1e11, timestamps / 1000, timestamps)
+    age_days = np.clip(((now or time.time()) - timestamps) / 86400, 0, None)
+    # Votes without timestamp don't decay
+    return np.where(np.isnan(age_days), 1.0, 0.5 ** (age_days / settings.events_vote_half_life_days))
@@ -0,0 +1,391 @@
+import fcntl
+import json
+import logbook
+import numpy as np
+import os
+import pika
+import queue
+import sqlite3
+import threading
+import time
+
+from role_normalization import settings
+from role_normalization.api.events.role_voting import vote_decay
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+# Sources of votes, by their code in histograms
+vote_sources = ('contact', 'apply')
+
+# Histogram of votes of a job or user: weight of each source and role, in order of first vote
+histogram_dtype = np.dtype([('source', 'u1'), ('role', '<i4'), ('weight', '<f4')])
+
+
+def top_role(histogram: np.ndarray) -> int:
+    """
+    Role with the most weighted votes of a histogram, as inferred from scratch by vote_roles():
+    weighted by source, only from contacts if any, unless settings.events_combine_contacts_applies,
+    ties won by the role voted first.
+
+    Parameters:
+    - histogram : np.ndarray : Histogram of votes, of histogram_dtype
+
+    Returns:
+    - int : Role ID, 0 if without votes
+    """
+    contact = vote_sources.index('contact')
+    if not settings.events_combine_contacts_applies and (histogram['source'] == contact).any():
+        histogram = histogram[histogram['source'] == contact]
+    scores = {}
+    for source, role, weight in histogram.tolist():
+        scores[role] = scores.get(role, 0.0) + weight * settings.events_vote_weights.get(vote_sources[source], 1.0)
+    return max(scores, key=scores.get, default=0)
+
+
+class VoteCounters:
+
+    """
+    Votes for the role of each job and user, kept as a histogram per job or user in a SQLite
+    database shared by every worker process of the host - settings.events_vote_counters_path -
+    along with its top role, so inferring it is a lookup. Weights of a histogram are decayed until
+    the time it was last written, decayed_at, and decayed further before votes are added to it, so
+    they keep matching votes weighted from scratch. Jobs and users are counted once their
+    roles are inferred from scratch, from the votes they were inferred from, and their counters are
+    updated by events as they happen, see VoteEventsConsumer. Counters are only used for
+    settings.events_vote_counters_max_age seconds since counted, so jobs and users are inferred
+    from scratch again now and then, catching up with events missed.
+
+    Failures are logged and treated as jobs and users not counted.
+    """
+
+    # Max query parameters of older SQLite versions is 999
+    batch_size = 500
+
+    def __init__(self, path: str) -> None:
+        """
+        Parameters:
+        - path : str : SQLite database file, created if needed
+        """
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        if getattr(self._local, 'pid', None) != os.getpid():
+            con = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=OFF')
+            con.execute('CREATE TABLE IF NOT EXISTS counters (kind TEXT, id TEXT, histogram BLOB, role INTEGER, counted_at REAL, '
+                        'decayed_at REAL, PRIMARY KEY (kind, id))')
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return self._local.con
+
+    def get_roles(self, kind: str, ids: list) -> dict:
+        """
+        Return top roles of counted IDs.
+
+        Parameters:
+        - kind : str  : "job" or "user"
+        - ids  : list : Job or user IDs
+
+        Returns:
+        - dict : Top role of each ID counted - {'ID': role ID, ...}
+        """
+        ids = [str(id) for id in ids]
+        roles = {}
+        try:
+            con = self._connection()
+            for i in range(0, len(ids), self.batch_size):
+                batch_ids = ids[i:i + self.batch_size]
+                rows = con.execute(
+                    f'SELECT id, role FROM counters WHERE kind = ? AND counted_at > ? AND id IN ({",".join(["?"] * len(batch_ids))})',
+                    [kind, time.time() - settings.events_vote_counters_max_age, *batch_ids])
+                roles.update(rows)
+        except sqlite3.Error as e:
+            logger.warning(f'Exception reading {kind} vote counters: {e}')
+        return roles
+
+    def count(self, kind: str, votes: list, now: float = None) -> None:
+        """
+        Count IDs from the votes their roles were inferred from, replacing their counters if any.
+        IDs without votes with role aren't counted.
+
+        Parameters:
+        - kind  : str   : "job" or "user"
+        - votes : list  : Votes - (ID, role ID, timestamp or None, source), see vote_roles()
+        - now   : float : Time votes decay until, in seconds since epoch, defaults to now
+        """
+        decayed_at = now or time.time()
+        histograms = self._histograms(votes, decayed_at)
+        now = time.time()
+        try:
+            self._connection().executemany('INSERT OR REPLACE INTO counters VALUES (?, ?, ?, ?, ?, ?)', [
+                (kind, id, histogram.tobytes(), top_role(histogram), now, decayed_at) for id, histogram in histograms.items()])
+        except sqlite3.Error as e:
+            logger.warning(f'Exception writing {kind} vote counters: {e}')
+
+    def add(self, kind: str, votes: list) -> int:
+        """
+        Add votes to the counters of counted IDs, others are skipped.
+
+        Parameters:
+        - kind  : str  : "job" or "user"
+        - votes : list : Votes - (ID, role ID, timestamp or None, source), see vote_roles()
+
+        Returns:
+        - int : IDs whose counters were updated
+        """
+        now = time.time()
+        added = self._histograms(votes, now)
+        if not added:
+            return 0
+        ids = list(added)
+        updates = []
+        try:
+            con = self._connection()
+            # Counters read and written by a single writer at a time
+            con.execute('BEGIN IMMEDIATE')
+            try:
+                for i in range(0, len(ids), self.batch_size):
+                    batch_ids = ids[i:i + self.batch_size]
+                    rows = con.execute(
+                        f'SELECT id, histogram, decayed_at FROM counters WHERE kind = ? AND counted_at > ? AND id IN ({",".join(["?"] * len(batch_ids))})',
+                        [kind, now - settings.events_vote_counters_max_age, *batch_ids]).fetchall()
+                    # Stored weights decayed from the time they were decayed until to now, like added ones
+                    decays = vote_decay([decayed_at for _, _, decayed_at in rows], now).tolist()
+                    for (id, histogram, _), decay in zip(rows, decays):
+                        histogram = np.frombuffer(histogram, dtype=histogram_dtype).copy()
+                        histogram['weight'] *= decay
+                        histogram = self._merge(histogram, added[id])
+                        updates.append((histogram.tobytes(), top_role(histogram), now, kind, id))
+                con.executemany('UPDATE counters SET histogram = ?, role = ?, decayed_at = ? WHERE kind = ? AND id = ?', updates)
+                con.execute('COMMIT')
+            except BaseException:
+                con.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f'Exception updating {kind} vote counters: {e}')
+            return 0
+        return len(updates)
+
+    @staticmethod
+    def _histograms(votes: list, now: float = None) -> dict:
+        # Histogram of the votes with role of each ID
+        votes = [(str(id), role, timestamp, source) for id, role, timestamp, source in votes if role]
+        weights = vote_decay([timestamp or np.nan for _, _, timestamp, _ in votes], now).tolist()
+        entries = {}
+        for (id, role, _, source), weight in zip(votes, weights):
+            id_entries = entries.setdefault(id, {})
+            key = (vote_sources.index(source), role)
+            id_entries[key] = id_entries.get(key, 0.0) + weight
+        return {
+            id: np.array([(*key, weight) for key, weight in id_entries.items()], dtype=histogram_dtype)
+            for id, id_entries in entries.items()
+        }
+
+    @staticmethod
+    def _merge(histogram: np.ndarray, added: np.ndarray) -> np.ndarray:
+        # Weights added to existing entries, new entries appended, keeping the order of first votes
+        histogram = histogram.copy()
+        positions = {(source, role): i for i, (source, role, _) in enumerate(histogram.tolist())}
+        new_entries = []
+        for source, role, weight in added.tolist():
+            i = positions.get((source, role))
+            if i is None:
+                new_entries.append((source, role, weight))
+            else:
+                histogram['weight'][i] += weight
+        return np.concatenate([histogram, np.array(new_entries, dtype=histogram_dtype)])
+
+
+class LocalEventsQueue:
+
+    """
+    Events queue of this process, standing in for RabbitMQ in tests and local runs.
+    """
+
+    def __init__(self) -> None:
+        self.queue = queue.Queue()
+
+    def publish(self, events) -> None:
+        """
+        Publish an event, or a list of events, as published to the RabbitMQ exchange.
+        """
+        self.queue.put(json.dumps(events))
+
+    def close(self) -> None:
+        """
+        Stop consuming once every event published is handled.
+        """
+        self.queue.put(None)
+
+    def consume(self, handle) -> None:
+        """
+        Handle events by batches of up to settings.events_votes_batch_size, until closed.
+
+        Parameters:
+        - handle : callable : Function handling a list of events
+        """
+        while True:
+            bodies = [self.queue.get()]
+            while len(bodies) < settings.events_votes_batch_size and not self.queue.empty():
+                bodies.append(self.queue.get())
+            events = [event for body in bodies if body is not None for event in parse_events(body)]
+            if events:
+                handle(events)
+            if None in bodies:
+                return
+
+
+class RabbitMqEventsQueue:
+
+    """
+    Events published to the RabbitMQ fanout exchange settings.events_votes_exchange, consumed from
+    a queue of this process - deleted once disconnected, so events are only queued while consumed.
+    """
+
+    def consume(self, handle) -> None:
+        """
+        Handle events by batches of up to settings.events_votes_batch_size, acknowledged once
+        handled, until disconnected.
+
+        Parameters:
+        - handle : callable : Function handling a list of events
+        """
+        credentials = pika.PlainCredentials(settings.rabbitmq_username(), settings.rabbitmq_password())
+        parameters = pika.ConnectionParameters(
+            host=settings.rabbitmq_host(),
+            port=int(settings.rabbitmq_port()),
+            credentials=credentials,
+            heartbeat=600)
+        connection = pika.BlockingConnection(parameters)
+        try:
+            channel = connection.channel()
+            channel.exchange_declare(exchange=settings.events_votes_exchange, exchange_type='fanout', durable=True)
+            queue_name = channel.queue_declare(queue='', exclusive=True).method.queue
+            channel.queue_bind(queue=queue_name, exchange=settings.events_votes_exchange)
+            channel.basic_qos(prefetch_count=settings.events_votes_batch_size)
+            logger.info(f'Consuming events of {settings.events_votes_exchange} exchange')
+
+            events = []
+            last_delivery_tag = None
+            # Batches handled once full, or once no more events arrive for a second
+            for message in channel.consume(queue_name, inactivity_timeout=1):
+                if message[0] is not None:
+                    method, _, body = message
+                    events.extend(parse_events(body))
+                    last_delivery_tag = method.delivery_tag
+                if last_delivery_tag is not None and (message[0] is None or len(events) >= settings.events_votes_batch_size):
+                    if events:
+                        handle(events)
+                    channel.basic_ack(delivery_tag=last_delivery_tag, multiple=True)
+                    events = []
+                    last_delivery_tag = None
+        finally:
+            if connection.is_open:
+                connection.close()
+
+
+def parse_events(body) -> list:
+    """
+    Parse a message of events: a JSON apply or contact event, or a list of them -
+    {"type": "apply" or "contact", "job_id": ..., "user_id": ..., "timestamp": seconds or milliseconds since epoch}.
+    Malformed messages are logged and skipped.
+    """
+    try:
+        events = json.loads(body)
+    except ValueError as e:
+        logger.warning(f'Skipped malformed events message: {e}')
+        return []
+    events = events if isinstance(events, list) else [events]
+    return [
+        event for event in events
+        if isinstance(event, dict) and event.get('type') in vote_sources and event.get('job_id') and event.get('user_id')
+    ]
+
+
+class VoteEventsConsumer:
+
+    """
+    Updates vote counters from apply and contact events, in a background thread of the worker
+    process of the host holding the counters lock - if it exits, another one takes over. An apply
+    is a vote of the user's role for the job, and of the job's role for the user, a contact only a
+    vote of the user's role for the job.
+    """
+
+    # Seconds between attempts to take the counters lock, or to consume again once disconnected
+    retry_interval = 10
+
+    def __init__(self, counters: VoteCounters, events_queue) -> None:
+        """
+        Parameters:
+        - counters     : VoteCounters : Counters updated
+        - events_queue : object       : Queue of events consumed, RabbitMqEventsQueue or LocalEventsQueue
+        """
+        self.counters = counters
+        self.events_queue = events_queue
+        self.thread = None
+        self.consuming = False
+        self.last_error = None
+
+    def start(self, normalizer) -> None:
+        """
+        Consume events in a background thread, once holding the counters lock.
+
+        Parameters:
+        - normalizer : RoleNormalizerEvents : Normalizer looking up roles of the users and jobs of events
+        """
+        if self.thread is not None:
+            return
+        self.normalizer = normalizer
+        self.thread = threading.Thread(target=self._run, name='vote-events', daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        lock_file = open(self.counters.path + '.lock', 'w')
+        while True:
+            try:
+                if not self.consuming:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        self.consuming = True
+                        logger.info('Consuming vote events in this worker')
+                    except BlockingIOError:
+                        pass
+                if self.consuming:
+                    self.events_queue.consume(self.handle)
+                    self.last_error = None
+            except Exception as e:
+                logger.exception(f'Exception consuming vote events: {e}')
+                self.last_error = str(e)
+            time.sleep(self.retry_interval)
+
+    def handle(self, events: list) -> None:
+        """
+        Add votes of events to the counters of their jobs and users.
+
+        Parameters:
+        - events : list : Apply and contact events, see parse_events()
+        """
+        usr_roles = self.normalizer._get_usrs_roles(list(dict.fromkeys(event['user_id'] for event in events)))
+        job_roles = self.normalizer._get_jobs_roles(list(dict.fromkeys(
+            event['job_id'] for event in events if event['type'] == 'apply')))
+        job_votes = [
+            (event['job_id'], usr_roles.get(str(event['user_id'])), event.get('timestamp'), event['type'])
+            for event in events
+        ]
+        usr_votes = [
+            (event['user_id'], job_roles.get(str(event['job_id'])), event.get('timestamp'), 'apply')
+            for event in events if event['type'] == 'apply'
+        ]
+        jobs_updated = self.counters.add('job', job_votes)
+        usrs_updated = self.counters.add('user', usr_votes)
+        logger.debug(f'Counted {len(events)} events: {jobs_updated} jobs and {usrs_updated} users updated')
+
+
+# Vote counters of this process and the consumer of events updating them, if enabled
+vote_counters = VoteCounters(settings.events_vote_counters_path) if settings.events_vote_counters_path else None
+vote_events_consumer = VoteEventsConsumer(vote_counters, RabbitMqEventsQueue()) if vote_counters else None
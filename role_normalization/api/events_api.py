@@ -3,7 +3,10 @@ import basicauth
 import os
 
 from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.component_loader import ComponentNotReadyError, component_loader, handle_not_ready
 from role_normalization.api.role_norm_events import JobRoleNormalizer, UserRoleNormalizer
+from role_normalization.api.role_norm_events_bulk import EventsBulkResults, EventsBulkStatus, EventsBulkSubmit
 
 
 spec = settings.spec
@@ -17,7 +20,9 @@ class AuthMiddleware:
     def process_request(self, req, resp):
 
         if req.relative_uri == '/healthcheck' or \
+                req.relative_uri == '/readiness' or \
                 req.relative_uri == '/buildinfo' or \
+                req.relative_uri == '/metrics' or \
                 req.relative_uri.startswith('/v1/role_normalization/catho/doc/'):
             return
 
@@ -48,13 +53,16 @@ class AuthMiddleware:
 
 class RequireJSON:
 
+    # Newline delimited JSON, used by bulk jobs
+    ndjson_media_type = 'application/x-ndjson'
+
     def process_request(self, req, resp):
-        if not req.client_accepts_json:
+        if not req.client_accepts_json and not req.client_accepts(self.ndjson_media_type):
             raise falcon.HTTPNotAcceptable(
                 description='Responses encoded as JSON not accepted by client')
 
         if req.method in ('POST', 'PUT'):
-            if 'application/json' not in req.content_type:
+            if 'application/json' not in req.content_type and self.ndjson_media_type not in req.content_type:
                 raise falcon.HTTPUnsupportedMediaType(
                     title='Request not encoded as JSON')
 
@@ -64,12 +72,31 @@ class HealthCheck:
     @spec.validate(tags=['meta'])
     def on_get(self, req, resp):
         """
-        Health check endpoint, used to check if the API is running and can be reached.
+        Health check endpoint, used to check if the API is running and can be reached - answered
+        with 503 if database connections failed to open in the background.
         """
+        failed_components = component_loader.failed()
+        if failed_components:
+            resp.media = {'status': 'ERROR', 'description': f'Failed loading: {", ".join(failed_components)}'}
+            resp.status = falcon.HTTP_503
+            return
         resp.text = '{"status": "OK", "description": "Role Normalization API available"}'
         resp.status = falcon.HTTP_200
 
 
+class Readiness:
+
+    @spec.validate(tags=['meta'])
+    def on_get(self, req, resp):
+        """
+        Readiness endpoint - answered with 503 while database connections are still being opened,
+        along with the state of each events normalizer.
+        """
+        ready = component_loader.ready()
+        resp.media = {'ready': ready, 'components': component_loader.status()}
+        resp.status = falcon.HTTP_200 if ready else falcon.HTTP_503
+
+
 class BuildInfo:
 
     @spec.validate(tags=['meta'])
@@ -93,15 +120,40 @@ class BuildInfo:
             resp.status = falcon.HTTP_200
 
 
+class Metrics:
+
+    @spec.validate(tags=['meta'])
+    def on_get(self, req, resp):
+        """
+        Metrics endpoint - returns metrics of every worker process, database connection pools
+        included, in Prometheus text format.
+        """
+        resp.data, resp.content_type = metrics.render()
+        resp.status = falcon.HTTP_200
+
+
+# Open database connections now, blocking, unless opened in the background once the worker starts -
+# see post_worker_init in events_api_gunicorn_conf.py
+if not settings.background_loading:
+    component_loader.start(background=False)
+
 app = falcon.App(middleware=[
+    metrics.MetricsMiddleware(),
     AuthMiddleware(),
     RequireJSON()
 ])
 app.req_options.strip_url_path_trailing_slash = True
+app.add_error_handler(ComponentNotReadyError, handle_not_ready)
 
 app.add_route('/healthcheck', HealthCheck())
+app.add_route('/readiness', Readiness())
 app.add_route('/buildinfo', BuildInfo())
+app.add_route('/metrics', Metrics())
 app.add_route('/v1/role_normalization/events/jobs', JobRoleNormalizer())
 app.add_route('/v1/role_normalization/events/users', UserRoleNormalizer())
+app.add_route('/v1/role_normalization/events/bulk/jobs', EventsBulkSubmit('jobs'))
+app.add_route('/v1/role_normalization/events/bulk/users', EventsBulkSubmit('users'))
+app.add_route('/v1/role_normalization/events/bulk/{bulk_id}', EventsBulkStatus())
+app.add_route('/v1/role_normalization/events/bulk/{bulk_id}/results', EventsBulkResults())
 
 spec.register(app)
@@ -0,0 +1,75 @@
+import falcon
+import time
+
+from role_normalization import settings
+
+
+class LatencyBudget:
+
+    """
+    Time a normalization request may spend normalizing and matching roles. Checked before each
+    role's cascade to pick the RoleMatcher match quality level that still fits what is left of it:
+    expensive stages - typo correction with edit distance 2, Word2Vec - are downgraded or skipped
+    once the budget is nearly used up. Once it is used up, roles are still matched at minimal
+    quality - database and Aho-Corasick matches, without typo correction - never dropped.
+    """
+
+    def __init__(self, budget_ms: int = None) -> None:
+        """
+        Parameters:
+        - budget_ms : int : Budget in milliseconds, counted from now - None means unlimited
+        """
+        self.budget_ms = budget_ms
+        self.start_time = time.perf_counter()
+
+    @classmethod
+    def from_request(cls, req, budget_ms: int = None) -> 'LatencyBudget':
+        """
+        Create the budget of a request, from the latency_budget_ms query parameter or, if missing,
+        from the settings.latency_budget_header header.
+
+        Parameters:
+        - req       : falcon.Request : Received request
+        - budget_ms : int            : Budget received as query parameter, if any
+
+        Returns:
+        - LatencyBudget : Request budget
+        """
+        if budget_ms is None:
+            budget_header = req.get_header(settings.latency_budget_header)
+            if budget_header is not None:
+                try:
+                    budget_ms = int(budget_header)
+                except ValueError:
+                    budget_ms = 0
+                if budget_ms <= 0:
+                    raise falcon.HTTPInvalidHeader(
+                        'Expected a positive integer, in milliseconds',
+                        settings.latency_budget_header)
+        return cls(budget_ms)
+
+    def remaining_ms(self) -> float:
+        """
+        Return the remaining budget in milliseconds, infinite if unlimited.
+        """
+        if self.budget_ms is None:
+            return float('inf')
+        return self.budget_ms - (time.perf_counter() - self.start_time) * 1000
+
+    def exhausted(self) -> bool:
+        """
+        Return True if the budget is used up.
+        """
+        return self.remaining_ms() <= 0
+
+    def quality(self) -> str:
+        """
+        Return the match quality level, see RoleMatcher.match_quality_levels, affordable with the
+        remaining budget.
+        """
+        remaining_ms = self.remaining_ms()
+        if remaining_ms >= settings.latency_budget_full_min_ms:
+            return 'full'
+        if remaining_ms >= settings.latency_budget_reduced_min_ms:
+            return 'reduced'
+        return 'minimal'
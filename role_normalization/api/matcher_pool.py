@@ -0,0 +1,206 @@
+import asyncio
+import gc
+import logbook
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.models.role_matcher import RoleMatcher
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class MatcherPoolFullError(Exception):
+
+    """
+    Raised when too many roles are already waiting for, or being normalized by, the pool.
+    """
+
+
+def _init_pool_worker() -> None:
+    # Pool processes are forked after models are loaded, so RoleMatcher is already initialized
+    # and only shared with the parent process - freeze inherited objects so collections in this
+    # process never write to, and copy, their pages
+    RoleMatcher()
+    gc.freeze()
+
+
+def _normalize_and_match_batch(batch: list) -> list:
+    # Runs in a pool process: batch is [('ROLE', (PERFIL_ID, ...), 'QUALITY'), ...]
+    role_matcher = RoleMatcher()
+    return [
+        role_matcher.normalize_and_match(role, list(perfil_ids_filter) if perfil_ids_filter else None, quality)
+        for role, perfil_ids_filter, quality in batch
+    ]
+
+
+class MatcherPool:
+
+    """
+    Run RoleMatcher.normalize_and_match() in a bounded pool of processes holding preloaded models,
+    so the event loop of the ASGI API is never blocked by CPU-bound normalization.
+
+    Roles received by concurrent requests are coalesced into micro-batches: identical roles are
+    normalized only once and each batch is sent to the pool in a single call. If a pool process
+    dies - killed for lack of memory, for example - the pool is recreated, and only batches it was
+    normalizing fail. Models aren't reloaded, see ModelReloader: processes keep the models loaded
+    when the pool was first started. Also an ASGI lifespan component - add it to the app middleware
+    so the pool is started and shut down along with the server.
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        batch_max_size: int = None,
+        batch_max_delay: float = None,
+        max_pending_roles: int = None
+    ) -> None:
+        """
+        Parameters:
+        - workers           : int   : Pool processes, defaults to settings.asgi_pool_workers
+        - batch_max_size    : int   : Distinct roles per batch, defaults to settings.asgi_batch_max_size
+        - batch_max_delay   : float : Max wait, in seconds, before sending a batch, defaults to settings.asgi_batch_max_delay
+        - max_pending_roles : int   : Max roles waiting or being normalized, defaults to settings.asgi_max_pending_roles
+        """
+        self.workers = workers or settings.asgi_pool_workers
+        self.batch_max_size = batch_max_size or settings.asgi_batch_max_size
+        self.batch_max_delay = batch_max_delay if batch_max_delay is not None else settings.asgi_batch_max_delay
+        self.max_pending_roles = max_pending_roles or settings.asgi_max_pending_roles
+
+        self.executor = None
+        # Roles waiting to be sent to the pool: {('ROLE', (PERFIL_ID, ...), 'QUALITY'): asyncio.Future, ...}
+        self.pending = {}
+        self.pending_roles = 0
+        self.flush_handle = None
+        self.batch_tasks = set()
+        self.batch_semaphore = None
+
+    async def process_startup(self, scope, event) -> None:
+        self.start()
+
+    async def process_shutdown(self, scope, event) -> None:
+        await self.shutdown()
+
+    def start(self) -> None:
+        """
+        Create the process pool. Processes are forked, inheriting models already loaded by this one.
+        """
+        # Models are loaded before the first process is forked, so they are shared copy-on-write
+        RoleMatcher()
+        self.executor = self._create_executor()
+        # At most two batches per process are queued in the pool, the others wait in self.pending
+        # where they may still be merged with roles from other requests
+        self.batch_semaphore = asyncio.Semaphore(self.workers * 2)
+        logger.info(f'Matcher pool started with {self.workers} processes')
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_pool_worker)
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        # Replace a broken pool, once - batches failing along with it find it already replaced.
+        # Processes are forked again from this one, still holding loaded models
+        if self.executor is not executor:
+            return
+        executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = self._create_executor()
+        metrics.pool_restarts.inc()
+        logger.warning(f'Matcher pool recreated with {self.workers} processes')
+
+    async def shutdown(self) -> None:
+        """
+        Wait for batches being normalized and shut the process pool down.
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self._flush()
+        if self.batch_tasks:
+            await asyncio.gather(*self.batch_tasks, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        logger.info('Matcher pool shut down')
+
+    async def normalize_and_match(self, roles: list, perfil_ids_filter: list = None, quality: str = 'full') -> dict:
+        """
+        Normalize roles and match them against database roles, using the process pool.
+
+        Parameters:
+        - roles             : list : Single roles to be normalized
+        - perfil_ids_filter : list : List of perfil IDs to filter normalized roles
+        - quality           : str  : Match quality level, see RoleMatcher.match_quality_levels
+
+        Returns:
+        - dict : Roles mapped to RoleMatcher.normalize_and_match() results
+        """
+        loop = asyncio.get_running_loop()
+        perfil_ids_key = tuple(perfil_ids_filter) if perfil_ids_filter else ()
+        keys = list(dict.fromkeys((role, perfil_ids_key, quality) for role in roles))
+
+        # Refuse requests above capacity instead of queueing them indefinitely
+        new_keys = [key for key in keys if key not in self.pending]
+        if self.pending_roles + len(new_keys) > self.max_pending_roles:
+            raise MatcherPoolFullError(f'Matcher pool is full: {self.pending_roles} roles pending')
+
+        # Roles already pending, received by other requests, share the same future
+        for key in new_keys:
+            self.pending[key] = loop.create_future()
+        self.pending_roles += len(new_keys)
+        futures = [self.pending[key] for key in keys]
+
+        if len(self.pending) >= self.batch_max_size:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_max_delay, self._flush)
+
+        # Futures are shielded, as they may be shared: a cancelled request doesn't cancel the others
+        results = await asyncio.gather(*[asyncio.shield(future) for future in futures])
+        return {key[0]: result for key, result in zip(keys, results)}
+
+    def _flush(self) -> None:
+        # Send every pending role to the pool, in batches of at most batch_max_size roles
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending_items = list(self.pending.items())
+        self.pending = {}
+        for i in range(0, len(pending_items), self.batch_max_size):
+            metrics.pool_batch_roles.observe(len(pending_items[i:i + self.batch_max_size]))
+            batch_task = asyncio.ensure_future(self._run_batch(pending_items[i:i + self.batch_max_size]))
+            self.batch_tasks.add(batch_task)
+            batch_task.add_done_callback(self.batch_tasks.discard)
+
+    async def _run_batch(self, batch_items: list) -> None:
+        # Run a batch in the pool and resolve the futures of its roles
+        executor = None
+        try:
+            async with self.batch_semaphore:
+                loop = asyncio.get_running_loop()
+                executor = self.executor
+                results = await loop.run_in_executor(
+                    executor,
+                    _normalize_and_match_batch,
+                    [key for key, _ in batch_items])
+            for (_, future), result in zip(batch_items, results):
+                if not future.done():
+                    future.set_result(result)
+        except BrokenProcessPool as e:
+            logger.error(f'Matcher pool broken, a process died, normalizing batch of {len(batch_items)} roles: {e}')
+            self._restart(executor)
+            for _, future in batch_items:
+                if not future.done():
+                    future.set_exception(e)
+        except Exception as e:
+            logger.exception(f'Exception normalizing batch of {len(batch_items)} roles: {e}')
+            for _, future in batch_items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.pending_roles -= len(batch_items)
@@ -0,0 +1,92 @@
+import falcon
+import json
+import logbook
+from functools import partial
+
+from role_normalization import settings
+
+# orjson is optional: much faster than the json module, used if installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# msgpack is optional: if installed, requests and responses may also be encoded as MessagePack
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+def create_json_handler() -> falcon.media.JSONHandler:
+    """
+    Create the JSON media handler used by the Role Normalization API - based on orjson, if
+    installed, otherwise on the json module, as Falcon's default handler.
+
+    Returns:
+    - falcon.media.JSONHandler : JSON media handler
+    """
+    if orjson is not None:
+        logger.info('Using orjson to serialize and deserialize JSON')
+        return falcon.media.JSONHandler(dumps=orjson.dumps, loads=orjson.loads)
+    return falcon.media.JSONHandler(dumps=partial(json.dumps, ensure_ascii=False), loads=json.loads)
+
+
+def create_msgpack_handler() -> falcon.media.MessagePackHandler:
+    """
+    Create the MessagePack media handler used by the Role Normalization API, if msgpack is installed.
+
+    Returns:
+    - falcon.media.MessagePackHandler : MessagePack media handler, None if msgpack isn't installed
+    """
+    if msgpack is None:
+        logger.info('msgpack not installed, requests and responses encoded as MessagePack not supported')
+        return None
+    return falcon.media.MessagePackHandler()
+
+
+# Shared by requests, responses and resources that serialize responses themselves
+json_handler = create_json_handler()
+msgpack_handler = create_msgpack_handler()
+
+# Media types of MessagePack requests and responses - the registered one and the one in common use
+msgpack_media_types = (falcon.MEDIA_MSGPACK, 'application/x-msgpack')
+
+
+def set_media_handlers(app) -> None:
+    """
+    Use the Role Normalization API media handlers in a Falcon app, WSGI or ASGI: JSON and, if
+    msgpack is installed, MessagePack.
+
+    Parameters:
+    - app : falcon.App : App whose requests and responses use the handlers
+    """
+    app.req_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+    app.resp_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+    if msgpack_handler is not None:
+        for media_type in msgpack_media_types:
+            app.req_options.media_handlers[media_type] = msgpack_handler
+            app.resp_options.media_handlers[media_type] = msgpack_handler
+
+
+def response_media_type(req) -> str:
+    """
+    Choose the media type of a response: MessagePack if supported and accepted by the client with
+    a higher quality than JSON, or alone - JSON otherwise, the default.
+
+    Parameters:
+    - req : falcon.Request : Request answered
+
+    Returns:
+    - str : falcon.MEDIA_JSON or falcon.MEDIA_MSGPACK
+    """
+    accept = req.accept
+    if msgpack_handler is None or 'msgpack' not in accept:
+        return falcon.MEDIA_JSON
+    # Ties go to the last media type listed
+    preferred = req.client_prefers([*msgpack_media_types, falcon.MEDIA_JSON])
+    return falcon.MEDIA_MSGPACK if preferred in msgpack_media_types else falcon.MEDIA_JSON
@@ -0,0 +1,180 @@
+import falcon
+import os
+import time
+from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+
+"""
+Prometheus metrics of the Role Normalization API, served at /metrics.
+
+With many Gunicorn workers, PROMETHEUS_MULTIPROC_DIR must be set before this module is imported -
+see gunicorn_conf.py: each process writes its metrics to files in that directory, aggregated when
+/metrics is requested, whichever worker answers it.
+"""
+
+
+request_latency = Histogram(
+    'role_norm_request_duration_seconds',
+    'Request latency, until the response body starts being sent',
+    ['endpoint', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+title_latency = Histogram(
+    'role_norm_title_duration_seconds',
+    'Time spent normalizing and matching the roles of each received title',
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+request_titles = Histogram(
+    'role_norm_request_titles',
+    'Titles received per normalization request',
+    ['endpoint'],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+pool_batch_roles = Histogram(
+    'role_norm_pool_batch_roles',
+    'Distinct roles per micro-batch sent to the matcher pool of the ASGI API',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+pool_restarts = Counter(
+    'role_norm_pool_restarts',
+    'Matcher pools of the ASGI API recreated, as a pool process died')
+
+matches = Counter(
+    'role_norm_matches',
+    'Roles normalized, by match type - "none" if not matched',
+    ['match_type'])
+
+# Cache stats are copied from each worker's caches after each request, and summed over live workers
+cache_hits = Gauge('role_norm_cache_hits', 'Cache hits', ['cache'], multiprocess_mode='livesum')
+cache_misses = Gauge('role_norm_cache_misses', 'Cache misses', ['cache'], multiprocess_mode='livesum')
+cache_size = Gauge('role_norm_cache_size', 'Cache entries', ['cache'], multiprocess_mode='livesum')
+
+warmup_duration = Gauge(
+    'role_norm_warmup_seconds',
+    'Time spent warming up caches, by the slowest live worker',
+    multiprocess_mode='livemax')
+
+model_generation = Gauge(
+    'role_norm_model_generation',
+    'Models generation in use, incremented by each reload, by the live worker most behind',
+    multiprocess_mode='livemin')
+
+model_reloads = Counter(
+    'role_norm_model_reloads',
+    'Model reloads, by result - "swapped", "unchanged" or "failed"',
+    ['result'])
+
+model_load_time = Gauge(
+    'role_norm_model_load_seconds',
+    'Time spent loading or creating models',
+    multiprocess_mode='max')
+
+# Database connection pools of the events API, see events/connection_pool.py
+db_pool_connections = Gauge(
+    'role_norm_db_pool_connections',
+    'Open database connections, by pool and state - "idle" or "in_use"',
+    ['pool', 'state'],
+    multiprocess_mode='livesum')
+
+db_pool_wait = Histogram(
+    'role_norm_db_pool_wait_seconds',
+    'Time spent waiting for a free database connection, by pool',
+    ['pool'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+
+db_pool_timeouts = Counter(
+    'role_norm_db_pool_timeouts',
+    'Database connections not freed in time, by pool',
+    ['pool'])
+
+db_pool_connections_opened = Counter(
+    'role_norm_db_pool_connections_opened',
+    'Database connections opened, by pool',
+    ['pool'])
+
+db_pool_connections_closed = Counter(
+    'role_norm_db_pool_connections_closed',
+    'Database connections closed, by pool and reason - "idle", "health_check" or "failed"',
+    ['pool', 'reason'])
+
+# Bulk jobs of the events API, see events/bulk_jobs.py
+bulk_jobs = Counter(
+    'role_norm_events_bulk_jobs',
+    'Bulk jobs, by kind - "jobs" or "users" - and event - "submitted", "retrying", "done" or "failed"',
+    ['kind', 'event'])
+
+bulk_ids = Counter(
+    'role_norm_events_bulk_ids',
+    'IDs inferred by bulk jobs, by kind',
+    ['kind'])
+
+bulk_chunk_latency = Histogram(
+    'role_norm_events_bulk_chunk_seconds',
+    'Time spent inferring each chunk of IDs of bulk jobs, by kind',
+    ['kind'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+
+
+def observe_matches(match_results) -> None:
+    """
+    Count roles normalized by match type.
+
+    Parameters:
+    - match_results : iterable : RoleMatcher.normalize_and_match() results
+    """
+    match_type_counts = {}
+    for _, _, match_type in match_results:
+        match_type = match_type or 'none'
+        match_type_counts[match_type] = match_type_counts.get(match_type, 0) + 1
+    for match_type, count in match_type_counts.items():
+        matches.labels(match_type).inc(count)
+
+
+def observe_caches(role_matcher, response_fragments) -> None:
+    """
+    Copy cache stats of this process to their gauges.
+
+    Parameters:
+    - role_matcher       : RoleMatcher       : Role matcher, whose normalization lru caches are observed
+    - response_fragments : ResponseFragments : Encoded normalized roles cache
+    """
+    for cache_name, cache_info in [
+        ('normalize_and_match', role_matcher.normalize_and_match.cache_info()),
+        ('normalize', role_matcher.normalizer.normalize.cache_info()),
+    ]:
+        cache_hits.labels(cache_name).set(cache_info.hits)
+        cache_misses.labels(cache_name).set(cache_info.misses)
+        cache_size.labels(cache_name).set(cache_info.currsize)
+    cache_hits.labels('response_fragments').set(response_fragments.hits)
+    cache_misses.labels('response_fragments').set(response_fragments.misses)
+    cache_size.labels('response_fragments').set(len(response_fragments.roles))
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Return metrics of every process, in Prometheus text format, and their content type.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+
+    """
+    Observe the latency of every request, by route and status.
+    """
+
+    def process_request(self, req, resp):
+        req.context.start_time = time.perf_counter()
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        start_time = req.context.get('start_time')
+        if start_time is None:
+            return
+        request_latency.labels(req.uri_template or 'unmatched', str(falcon.http_status_to_code(resp.status))).observe(
+            time.perf_counter() - start_time)
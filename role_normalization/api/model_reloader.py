@@ -0,0 +1,251 @@
+import gc
+import logbook
+import os
+import threading
+import time
+
+from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.cache_warmup import cache_warmup
+from role_normalization.api.component_loader import component_loader
+from role_normalization.api.models.role_matcher import RoleMatcher
+from role_normalization.api.models.role_normalizer import RoleNormalizer
+from role_normalization.api.role_norm import RoleNormalization
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class ModelReloader:
+
+    """
+    Reload models of a worker process without restarting it: when the reload trigger file, gazetteer
+    files or, if checked, database catalog tables change, the next models generation is created in a
+    background thread, reusing whatever didn't change (see RoleMatcher.next_generation()), and swapped
+    in for the current one - requests already being normalized finish with the current generation.
+
+    Caches are keyed by generation, so results of the previous one are never returned for entries
+    its changes affect: entries they don't - matches of roles that didn't change, normalizations of
+    titles without changed words - are carried over to the new generation when swapped in, the
+    others dropped and warm-up titles replayed through the new generation to refill them. The role
+    normalizer, whose normalizations are the most expensive part of the cascade, is shared by both
+    generations when neither gazetteers nor the words of role titles changed.
+
+    Each worker builds its own generation: with preload_app, the models it replaces - the role
+    normalizer and its spell checker, copied when words change, mappings, the automaton - were
+    shared copy-on-write with every worker, and the new ones are private to it, so each reload
+    takes back part of the memory preloading saves, until workers are restarted. Swaps are
+    therefore at most one per settings.model_reload_min_interval seconds - changes found meanwhile
+    are reloaded once it has elapsed.
+    """
+
+    gazetteers_dir = os.path.dirname(os.path.realpath(__file__)) + '/models/gazetteers/ptbr'
+
+    def __init__(self) -> None:
+        self.thread = None
+        self._lock = threading.Lock()
+        self.trigger_mtime = None
+        self.gazetteers_signature = None
+        self.catalog_checksum = None
+        self.catalog_checked_at = 0.0
+        # Time of the last swap, reloads are at most one per settings.model_reload_min_interval
+        self.swapped_at = None
+        # Stats of the last reload, see RoleMatcher.next_generation(), with the number of changed role IDs
+        self.last_reload = None
+        self.last_error = None
+
+    def start(self) -> None:
+        """
+        Check for changes every settings.model_reload_poll_interval seconds, in a background thread,
+        once models are loaded.
+        """
+        if settings.model_reload_poll_interval <= 0 or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._poll, name='model-reloader', daemon=True)
+        self.thread.start()
+
+    def _poll(self) -> None:
+        if not component_loader.wait():
+            return
+        # Sources models were loaded from, changes are detected against - the trigger file isn't, so
+        # workers started after a reload, loading the model bundle, reload too
+        self.gazetteers_signature = self._gazetteers_signature()
+        if settings.model_reload_catalog_check_interval > 0:
+            try:
+                self.catalog_checksum = RoleMatcher().catalog_checksum()
+                self.catalog_checked_at = time.monotonic()
+            except Exception as e:
+                logger.exception(f'Exception checking database catalog tables: {e}')
+        while True:
+            time.sleep(settings.model_reload_poll_interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.exception(f'Exception checking for model changes: {e}')
+
+    def check(self) -> None:
+        """
+        Reload models if the reload trigger file, gazetteer files or database catalog tables changed,
+        unless models were swapped less than settings.model_reload_min_interval seconds ago - changes
+        are then checked for once it has elapsed.
+        """
+        if self.swapped_at is not None and time.monotonic() - self.swapped_at < settings.model_reload_min_interval:
+            return
+        trigger_mtime = self._trigger_mtime()
+        gazetteers_signature = self._gazetteers_signature()
+        catalog_changed = False
+        if settings.model_reload_catalog_check_interval > 0 and \
+                time.monotonic() - self.catalog_checked_at >= settings.model_reload_catalog_check_interval:
+            self.catalog_checked_at = time.monotonic()
+            catalog_checksum = RoleMatcher().catalog_checksum()
+            catalog_changed = self.catalog_checksum is not None and catalog_checksum != self.catalog_checksum
+            self.catalog_checksum = catalog_checksum
+
+        # Role IDs mapping is read again by every reload, other gazetteers only if they changed
+        reread_gazetteers = any(
+            signature != self.gazetteers_signature.get(name)
+            for name, signature in gazetteers_signature.items()
+            if name != 'mapping_cargo_id.json'
+        )
+        if trigger_mtime != self.trigger_mtime or gazetteers_signature != self.gazetteers_signature or catalog_changed:
+            logger.info(f'Models sources changed, reloading - trigger file: {trigger_mtime != self.trigger_mtime}, '
+                        f'gazetteers: {gazetteers_signature != self.gazetteers_signature}, catalog: {catalog_changed}')
+            self.trigger_mtime = trigger_mtime
+            self.gazetteers_signature = gazetteers_signature
+            self.reload(reread_gazetteers=reread_gazetteers)
+
+    def request_reload(self) -> None:
+        """
+        Touch the reload trigger file, so every worker of this instance reloads models when it next
+        checks for changes.
+        """
+        with open(settings.model_reload_trigger_path, 'a'):
+            os.utime(settings.model_reload_trigger_path)
+
+    def reload(self, db_main_roles: list = None, db_similar_roles: list = None, reread_gazetteers: bool = False) -> dict:
+        """
+        Create the next models generation and swap it in for the current one, one reload at a time.
+
+        Parameters:
+        - db_main_roles     : [(int, str), ...] : Main roles, read from database if not received
+        - db_similar_roles  : [(int, str), ...] : Similar roles, read from database if not received
+        - reread_gazetteers : bool              : Read gazetteers from files again, as they changed
+
+        Returns:
+        - dict : Reload stats, see RoleMatcher.next_generation()
+        """
+        with self._lock:
+            role_matcher = RoleMatcher()
+            try:
+                generation, stats = role_matcher.next_generation(db_main_roles, db_similar_roles, reread_gazetteers)
+            except Exception as e:
+                logger.exception(f'Exception reloading models: {e}')
+                self.last_error = str(e)
+                metrics.model_reloads.labels('failed').inc()
+                raise
+            self.last_error = None
+
+            if not stats['changed_titles'] and stats['normalizer_reused']:
+                logger.info('Models unchanged, current generation kept')
+                stats['generation'] = role_matcher.generation
+                self.last_reload = dict(stats, changed_role_ids=len(stats['changed_role_ids']), result='unchanged')
+                metrics.model_reloads.labels('unchanged').inc()
+                return self.last_reload
+
+            if gc.get_freeze_count():
+                logger.warning('Models reloaded in a worker forked with preloaded models: models replaced are '
+                               'no longer shared copy-on-write, this worker holds its own copy of them')
+            self.swap(role_matcher, generation, stats)
+            self.swapped_at = time.monotonic()
+            self.last_reload = dict(stats, changed_role_ids=len(stats['changed_role_ids']), result='swapped')
+            metrics.model_reloads.labels('swapped').inc()
+            return self.last_reload
+
+    def swap(self, role_matcher: RoleMatcher, generation: RoleMatcher, stats: dict) -> None:
+        """
+        Swap the next models generation in, carrying over to it the cache entries of the current one
+        its changes don't affect - the others are dropped and, if any, warm-up titles replayed.
+
+        Parameters:
+        - role_matcher : RoleMatcher : Current generation
+        - generation   : RoleMatcher : Next generation
+        - stats        : dict        : Reload stats, see RoleMatcher.next_generation()
+        """
+        normalizer = role_matcher.normalizer
+        next_normalizer = generation.normalizer
+        changed_words = normalizer.changed_words(next_normalizer) if next_normalizer is not normalizer else set()
+        changed_role_ids = set(stats['changed_role_ids'])
+
+        def keep_normalization(role_title: str, correct_typos: bool) -> bool:
+            # Normalized the same way by the next normalizer - see RoleNormalizer.changed_words()
+            if next_normalizer is normalizer:
+                return True
+            if changed_words is None:
+                return False
+            if isinstance(role_title, str) and normalizer.contains_words(role_title, changed_words):
+                return False
+            spell_checker_changed = next_normalizer.spell_checker is not normalizer.spell_checker
+            return not (correct_typos and spell_checker_changed and normalizer.corrects_typos(role_title))
+
+        def keep_match(arguments: dict, result: tuple) -> bool:
+            # Matched the same role by the next generation: a role that didn't change, matched by its
+            # title or, if no titles were added, by the cascade - titles without a match may match an
+            # added title, so they're dropped
+            _, norm_role, match_type = result
+            if norm_role is None or norm_role.role_id in changed_role_ids:
+                return False
+            if match_type != 'database' and stats['added_titles']:
+                return False
+            return keep_normalization(arguments['role_title'], arguments['quality'] != 'minimal')
+
+        # Carried over before the swap, so the next generation is never served with cold caches
+        normalizations = RoleNormalizer.normalize.carry_over(
+            normalizer, next_normalizer, lambda arguments, _: keep_normalization(arguments['role_title'], arguments['correct_typos']))
+        matches = RoleMatcher.normalize_and_match.carry_over(role_matcher, generation, keep_match)
+
+        RoleMatcher._instance = generation
+        component_loader.replace('role_matcher', generation)
+        RoleNormalization.response_fragments.invalidate(changed_role_ids)
+        metrics.model_generation.set(generation.generation)
+        logger.info(f'Models generation {generation.generation} swapped in - cache entries carried over: '
+                    f'{matches[0]} matches, {normalizations[0]} normalizations, dropped: {matches[1]} matches, '
+                    f'{normalizations[1]} normalizations')
+
+        if (matches[1] or normalizations[1]) and settings.warmup_enabled:
+            start_time = time.perf_counter()
+            titles = cache_warmup.replay()
+            logger.info(f'Caches refilled: {titles} titles in {time.perf_counter() - start_time:.2f} s')
+
+    def status(self) -> dict:
+        """
+        Return the models generation in use by this worker, the last reload stats and error, if any.
+        """
+        role_matcher = RoleNormalization.role_normalizer
+        return {
+            'generation': role_matcher.generation,
+            'model_version': role_matcher.model_version,
+            'last_reload': self.last_reload,
+            'last_error': self.last_error,
+        }
+
+    def _trigger_mtime(self) -> int:
+        try:
+            return os.stat(settings.model_reload_trigger_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _gazetteers_signature(self) -> dict:
+        # Gazetteer files mapped to their modification time and size
+        signature = {}
+        for name in settings.model_reload_gazetteers:
+            try:
+                stat = os.stat(self.gazetteers_dir + '/' + name)
+                signature[name] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                signature[name] = None
+        return signature
+
+
+# Model reloader of this worker process, started by the Gunicorn post_worker_init hook
+model_reloader = ModelReloader()
@@ -1,9 +1,11 @@
 import ahocorasick
 import logbook
+import pickle
 from itertools import combinations
 from collections import OrderedDict
 
 from role_normalization import settings
+from role_normalization.api.models.stage_timer import StageTimer
 
 
 logger = logbook.Logger(__name__)
@@ -18,25 +20,33 @@ class AhoCorasickMatcher(object):
 
     separator = None
 
-    def __init__(self, norm_main_roles : dict, norm_similar_roles : dict) -> None:
+    def __init__(self, norm_main_roles : dict, norm_similar_roles : dict, automaton: ahocorasick.Automaton = None) -> None:
         """
-        Create an Aho-Corasick automaton to be used for matching.
+        Create an Aho-Corasick automaton to be used for matching. If an automaton is received,
+        read from a model bundle for example, it's used as is.
         """
 
         try:
 
             logger.info('Initializing AhoCorasickMatcher instance')
 
-            # Add normalized main and similar roles to Aho-Corasick automaton
-            self.automaton = ahocorasick.Automaton()
             self.separator = ';'
-            for norm_role in norm_main_roles:
-                self.automaton.add_word(self.separator + norm_role + self.separator, self.separator + norm_role + self.separator)
-            logger.info(f'Added {len(norm_main_roles)} main roles to automaton')
-            for norm_role in norm_similar_roles:
-                self.automaton.add_word(self.separator + norm_role + self.separator, self.separator + norm_role + self.separator)
-            logger.info(f'Added {len(norm_similar_roles)} similar roles to automaton')
-            self.automaton.make_automaton()
+
+            # Use received automaton
+            if automaton is not None:
+                self.automaton = automaton
+                logger.info(f'Using received automaton with {len(self.automaton)} roles')
+
+            # Add normalized main and similar roles to Aho-Corasick automaton
+            else:
+                self.automaton = ahocorasick.Automaton()
+                for norm_role in norm_main_roles:
+                    self.automaton.add_word(self.separator + norm_role + self.separator, self.separator + norm_role + self.separator)
+                logger.info(f'Added {len(norm_main_roles)} main roles to automaton')
+                for norm_role in norm_similar_roles:
+                    self.automaton.add_word(self.separator + norm_role + self.separator, self.separator + norm_role + self.separator)
+                logger.info(f'Added {len(norm_similar_roles)} similar roles to automaton')
+                self.automaton.make_automaton()
 
             self.role_title_max_words = settings.aho_corasick_role_title_max_words
             logger.info(f'Max words used in matching: {self.role_title_max_words}')
@@ -46,7 +56,7 @@ class AhoCorasickMatcher(object):
             logger.info(f'Word sequence length used in matching: '
                         f'{self.word_combinations_min_length}-{self.word_combinations_max_length}')
 
-            self.single_word_titles_blocklist = set(settings.aho_corasick_single_word_titles_blocklist)
+            self.single_word_titles_blocklist = frozenset(settings.aho_corasick_single_word_titles_blocklist)
             logger.info(f'Single word titles blocklist ({len(self.single_word_titles_blocklist)}): {self.single_word_titles_blocklist}')
 
             logger.info('AhoCorasickMatcher instance initialized')
@@ -56,12 +66,13 @@ class AhoCorasickMatcher(object):
             logger.exception(f'Exception initializing AhoCorasickMatcher: {e}')
             raise e
 
-    def match(self, norm_title: str) -> str:
+    def match(self, norm_title: str, stage_timer: StageTimer = None) -> str:
         """
         Tries to match word sequences of a given role title to a role title found in
         the database, using the Aho-Corasick algorithm. Returns the database
         normalized role title that matched the longest word sequence in the received
-        role title.
+        role title. If a stage timer is received, the number of word sequences tried
+        is added to it.
         """
 
         logger.debug('Aho-Corasick matching for normalized title: ' + norm_title)
@@ -103,7 +114,9 @@ class AhoCorasickMatcher(object):
                      f'{norm_title_combinations}')
 
         # Check if any of the combinations match a normalized database role title
+        combinations_tried = 0
         for norm_title_combination in norm_title_combinations:
+            combinations_tried += 1
             norm_title_substr = ' '.join(map(str, norm_title_combination))
             needle = self.separator + norm_title_substr + self.separator
             if list(self.automaton.iter_long(needle)):
@@ -111,4 +124,28 @@ class AhoCorasickMatcher(object):
                 logger.debug(f'Match found ({len(norm_title_combination)} word(s)): {norm_title_substr}')
                 break
 
+        if stage_timer is not None:
+            stage_timer.count('ahocorasick_combinations', combinations_tried)
+
         return matched_role
+
+    def patched(self, added_roles: set, removed_roles: set) -> 'AhoCorasickMatcher':
+        """
+        Return a new matcher whose automaton is a copy of this one's, with normalized roles added
+        and removed - this matcher may be in use, so its automaton isn't changed.
+
+        Parameters:
+        - added_roles   : set : Normalized role titles to be added
+        - removed_roles : set : Normalized role titles to be removed
+
+        Returns:
+        - AhoCorasickMatcher : Patched matcher
+        """
+        automaton = pickle.loads(pickle.dumps(self.automaton))
+        for norm_role in removed_roles:
+            automaton.remove_word(self.separator + norm_role + self.separator)
+        for norm_role in added_roles:
+            automaton.add_word(self.separator + norm_role + self.separator, self.separator + norm_role + self.separator)
+        automaton.make_automaton()
+        logger.info(f'Patched automaton: {len(added_roles)} roles added, {len(removed_roles)} removed')
+        return AhoCorasickMatcher(None, None, automaton)
@@ -0,0 +1,48 @@
+import click
+import json
+import logbook
+import time
+
+from role_normalization import settings
+from role_normalization.api.models.model_bundle import ModelBundle
+from role_normalization.api.models.role_matcher import RoleMatcher
+
+
+"""
+Compile the Role Normalization API models into a single versioned bundle:
+python3 role_normalization/api/models/compile_model.py -o BUNDLE_FILE
+
+Models are created from gazetteers, pickles found in models/load/ and, if pickles are missing,
+database roles. The bundle is then loaded by RoleMatcher at startup.
+"""
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+@click.command()
+@click.option('-o', '--output', default=settings.model_bundle_path, show_default=True, help='Model bundle file to be written')
+@click.option('--embeddings/--no-embeddings', default=settings.w2v_matching_enabled, show_default=True,
+              help='Include Word2Vec embeddings in the bundle')
+@click.option('--check', is_flag=True, default=False, help='Only load and verify an existing bundle, printing its manifest')
+def main(output: str, embeddings: bool, check: bool) -> None:
+
+    if check:
+        model_bundle = ModelBundle.load(output)
+        click.echo(json.dumps(model_bundle.manifest, indent=2, sort_keys=True))
+        return
+
+    start_time = time.time()
+
+    # Create models from sources, ignoring any existing bundle
+    settings.w2v_matching_enabled = embeddings
+    role_matcher = RoleMatcher(use_model_bundle=False)
+    logger.info(f'Models created in {time.time() - start_time:.3f}s')
+
+    model_bundle = ModelBundle.write(output, role_matcher.model_parts())
+    logger.info(f'Model bundle {model_bundle.content_hash} compiled in {time.time() - start_time:.3f}s: {output}')
+
+
+if __name__ == '__main__':
+    main()
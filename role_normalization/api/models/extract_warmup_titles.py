@@ -0,0 +1,45 @@
+import click
+import logbook
+import re2 as re
+from collections import Counter
+
+from role_normalization import settings
+
+
+"""
+Create the cache warm-up titles file from Role Normalization API logs:
+python3 role_normalization/api/models/extract_warmup_titles.py -n 5000 LOG_FILE [LOG_FILE ...]
+
+Counts the roles logged as received by the API ("Received role: ...") and writes the most frequent
+ones, most frequent first, one per line. API workers replay them at startup, see CacheWarmup.
+"""
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+received_role_regex = re.compile(r'Received role: (.+)$')
+
+
+@click.command()
+@click.argument('log_files', nargs=-1, required=True, type=click.File('r', encoding='utf-8', errors='replace'))
+@click.option('-o', '--output', default=settings.warmup_titles_path, show_default=True, help='Warm-up titles file to be written')
+@click.option('-n', '--max-titles', default=settings.warmup_max_titles, show_default=True, help='Number of titles written')
+def main(log_files: tuple, output: str, max_titles: int) -> None:
+
+    role_counts = Counter()
+    for log_file in log_files:
+        for line in log_file:
+            match = received_role_regex.search(line.rstrip('\n'))
+            if match and match.group(1).strip():
+                role_counts[match.group(1)] += 1
+
+    with open(output, 'w', encoding='utf-8') as f:
+        for role, _ in role_counts.most_common(max_titles):
+            f.write(role + '\n')
+
+    logger.info(f'{min(len(role_counts), max_titles)} of {len(role_counts)} distinct roles written: {output}')
+
+
+if __name__ == '__main__':
+    main()
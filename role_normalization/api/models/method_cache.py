@@ -0,0 +1,100 @@
+import inspect
+import threading
+from collections import OrderedDict
+from functools import _CacheInfo, wraps
+
+
+def method_cache(maxsize: int = 128):
+    """
+    Least recently used cache of a method, like lru_cache, whose entries can be carried over from an
+    instance to another - see carry_over() - so a replacement instance, like the next models
+    generation, starts with the entries its changes don't affect. Thread safe, like lru_cache.
+    Entries are keyed by instance and arguments, as passed - positional and keyword arguments
+    make different entries, as with lru_cache.
+
+    Usage:
+      @lru_hash_mutable
+      @method_cache(maxsize=8192)
+      def method(self, ...):
+
+    Parameters:
+    - maxsize : int : Max entries, of every instance
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+        entries = OrderedDict()
+        lock = threading.Lock()
+        stats = {'hits': 0, 'misses': 0}
+
+        @wraps(method)
+        def wrapped(self, *args, **kwargs):
+            key = (self, args, tuple(kwargs.items()))
+            with lock:
+                if key in entries:
+                    entries.move_to_end(key)
+                    stats['hits'] += 1
+                    return entries[key]
+                stats['misses'] += 1
+            result = method(self, *args, **kwargs)
+            with lock:
+                entries[key] = result
+                if len(entries) > maxsize:
+                    entries.popitem(last=False)
+            return result
+
+        def cache_info() -> _CacheInfo:
+            with lock:
+                return _CacheInfo(stats['hits'], stats['misses'], maxsize, len(entries))
+
+        def cache_clear() -> None:
+            with lock:
+                entries.clear()
+                stats['hits'] = stats['misses'] = 0
+
+        def carry_over(source: object, target: object, keep) -> tuple[int, int]:
+            """
+            Move the entries of an instance to another, keeping their recency, except those keep()
+            rejects, which are dropped. Entries of the source instance added meanwhile are dropped
+            too, as well as entries the target already has.
+
+            Parameters:
+            - source : object   : Instance whose entries are carried over
+            - target : object   : Instance entries are carried over to
+            - keep   : callable : Called with the arguments of each entry, by name, defaults applied,
+                                  and its result - True if the entry is still valid for the target
+
+            Returns:
+            - int : Entries carried over
+            - int : Entries dropped
+            """
+            if source is target:
+                return 0, 0
+            with lock:
+                source_entries = [(key, result) for key, result in entries.items() if key[0] is source]
+            # Checked without holding the lock, as requests keep using the cache meanwhile
+            kept = set()
+            for key, result in source_entries:
+                arguments = signature.bind(source, *key[1], **dict(key[2]))
+                arguments.apply_defaults()
+                if keep(arguments.arguments, result):
+                    kept.add(key)
+
+            carried = 0
+            with lock:
+                items = list(entries.items())
+                target_keys = {key for key, _ in items if key[0] is target}
+                entries.clear()
+                for key, result in items:
+                    if key[0] is not source:
+                        entries[key] = result
+                    elif key in kept and (target, key[1], key[2]) not in target_keys:
+                        entries[(target, key[1], key[2])] = result
+                        carried += 1
+            return carried, len(source_entries) - carried
+
+        wrapped.cache_info = cache_info
+        wrapped.cache_clear = cache_clear
+        wrapped.carry_over = carry_over
+        return wrapped
+
+    return decorator
@@ -0,0 +1,262 @@
+import gc
+import hashlib
+import json
+import logbook
+import mmap
+import os
+import pickle
+import struct
+import time
+
+from role_normalization import settings
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class ModelBundleError(Exception):
+
+    """
+    Raised when a model bundle can't be read or doesn't match the running code and gazetteers.
+    """
+
+
+class ModelBundle:
+
+    """
+    Single versioned file holding every part needed to create a RoleMatcher: dictionary, spell
+    checker, gazetteers, catalog mappings, Aho-Corasick automaton and, optionally, embeddings.
+
+    File layout:
+    - 8 bytes  : magic string
+    - 8 bytes  : manifest length, unsigned big endian integer
+    - N bytes  : manifest, JSON - format version, source files hashes, parts offsets and hashes
+    - ...      : parts, uncompressed pickles stored back to back
+
+    Parts are kept uncompressed so the file can be memory-mapped and unpickled directly, without
+    copying or decompressing it first.
+    """
+
+    magic = b'RNMODEL\x00'
+    header_format = '>Q'
+
+    # Bump whenever parts' contents or the normalization code that produced them change in an
+    # incompatible way - bundles created by other versions are refused
+    format_version = 1
+
+    required_parts = ['gazetteers', 'dictionary', 'spell_checker', 'catalog', 'automaton']
+    optional_parts = ['embeddings']
+
+    def __init__(self, manifest: dict, parts: dict) -> None:
+        self.manifest = manifest
+        self.parts = parts
+
+    @property
+    def content_hash(self) -> str:
+        return self.manifest['content_hash']
+
+    def __contains__(self, part_name: str) -> bool:
+        return part_name in self.parts
+
+    def __getitem__(self, part_name: str) -> any:
+        return self.parts[part_name]
+
+    @classmethod
+    def source_hashes(cls) -> dict:
+        """
+        Hash gazetteer and mapping files the bundle is built from.
+
+        Returns:
+        - {'FILE_NAME': 'SHA256' or None, ...} : None for missing files
+        """
+        gazetteers_dir = os.path.dirname(os.path.realpath(__file__)) + '/gazetteers/ptbr'
+        source_files = [
+            'stopwords.txt',
+            'locations.txt',
+            'mapping_conjugation.txt',
+            'mapping_gender.txt',
+            'mapping_plural.txt',
+            'mapping_special_character_terms.txt',
+            'mapping_thesaurus.txt',
+            'mapping_cargo_id.json',
+            'mapping_perfil_id.json',
+        ]
+        hashes = {}
+        for source_file in source_files:
+            source_filepath = gazetteers_dir + '/' + source_file
+            if not os.path.isfile(source_filepath):
+                hashes[source_file] = None
+                continue
+            with open(source_filepath, 'rb') as f:
+                hashes[source_file] = hashlib.sha256(f.read()).hexdigest()
+        return hashes
+
+    @classmethod
+    def write(cls, bundle_filepath: str, parts: dict) -> 'ModelBundle':
+        """
+        Write model parts to a bundle file. The file is written to a temporary path and then renamed,
+        so readers never see a partially written bundle.
+
+        Parameters:
+        - bundle_filepath : str  : Path of the bundle file
+        - parts           : dict : {'PART_NAME': object, ...}, must include all required parts
+
+        Returns:
+        - ModelBundle : The bundle written
+        """
+        missing_parts = [part_name for part_name in cls.required_parts if part_name not in parts]
+        if missing_parts:
+            raise ModelBundleError(f'Missing required model parts: {missing_parts}')
+        unknown_parts = [part_name for part_name in parts if part_name not in cls.required_parts + cls.optional_parts]
+        if unknown_parts:
+            raise ModelBundleError(f'Unknown model parts: {unknown_parts}')
+
+        # Serialize parts and compute their offsets, relative to the end of the manifest, and hashes
+        parts_data = []
+        parts_manifest = {}
+        offset = 0
+        for part_name, part in parts.items():
+            part_data = pickle.dumps(part, protocol=pickle.HIGHEST_PROTOCOL)
+            parts_manifest[part_name] = {
+                'offset': offset,
+                'length': len(part_data),
+                'sha256': hashlib.sha256(part_data).hexdigest(),
+            }
+            parts_data.append(part_data)
+            offset += len(part_data)
+            logger.info(f'Serialized model part {part_name}: {len(part_data)} bytes')
+
+        source_hashes = cls.source_hashes()
+        manifest = {
+            'format_version': cls.format_version,
+            'created_at': int(time.time()),
+            'source_hashes': source_hashes,
+            'parts': parts_manifest,
+            'content_hash': cls._content_hash(cls.format_version, source_hashes, parts_manifest),
+        }
+        manifest_data = json.dumps(manifest, sort_keys=True).encode('utf-8')
+
+        temp_filepath = bundle_filepath + '.tmp'
+        with open(temp_filepath, 'wb') as f:
+            f.write(cls.magic)
+            f.write(struct.pack(cls.header_format, len(manifest_data)))
+            f.write(manifest_data)
+            for part_data in parts_data:
+                f.write(part_data)
+        os.replace(temp_filepath, bundle_filepath)
+
+        logger.info(f'Model bundle written to {bundle_filepath}, content hash {manifest["content_hash"]}')
+
+        return cls(manifest, parts)
+
+    @classmethod
+    def read_manifest(cls, bundle_filepath: str) -> dict:
+        """
+        Read only the manifest of a bundle file.
+
+        Parameters:
+        - bundle_filepath : str : Path of the bundle file
+
+        Returns:
+        - dict : Bundle manifest
+        """
+        with open(bundle_filepath, 'rb') as f:
+            manifest_length = cls._manifest_length(f.read(len(cls.magic) + struct.calcsize(cls.header_format)))
+            return cls._parse_manifest(f.read(manifest_length))
+
+    @classmethod
+    def load(cls, bundle_filepath: str, verify_hashes: bool = True) -> 'ModelBundle':
+        """
+        Memory-map a bundle file and unpickle its parts. Refuses bundles created by another format
+        version, from other gazetteer files or whose parts don't match the hashes in the manifest.
+
+        Parameters:
+        - bundle_filepath : str  : Path of the bundle file
+        - verify_hashes   : bool : Check each part's hash before unpickling it, default is True
+
+        Returns:
+        - ModelBundle : The bundle read
+        """
+        start_time = time.time()
+
+        # Unpickling creates millions of objects - mostly the spell checker index - so garbage
+        # collection is paused meanwhile, as it would repeatedly scan them for nothing
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(bundle_filepath, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as bundle_map:
+                    header_length = len(cls.magic) + struct.calcsize(cls.header_format)
+                    manifest_length = cls._manifest_length(bundle_map[:header_length])
+                    manifest = cls._parse_manifest(bundle_map[header_length:header_length + manifest_length])
+                    cls._check_manifest(manifest)
+
+                    parts_start = header_length + manifest_length
+                    parts = {}
+                    with memoryview(bundle_map) as bundle_view:
+                        for part_name, part_manifest in manifest['parts'].items():
+                            part_start = parts_start + part_manifest['offset']
+                            part_data = bundle_view[part_start:part_start + part_manifest['length']]
+                            try:
+                                if len(part_data) != part_manifest['length']:
+                                    raise ModelBundleError(f'Model bundle part {part_name} is truncated')
+                                if verify_hashes and hashlib.sha256(part_data).hexdigest() != part_manifest['sha256']:
+                                    raise ModelBundleError(f'Model bundle part {part_name} does not match its hash')
+                                parts[part_name] = pickle.loads(part_data)
+                            finally:
+                                part_data.release()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        logger.info(f'Model bundle {manifest["content_hash"]} loaded from {bundle_filepath} '
+                    f'in {time.time() - start_time:.3f}s')
+
+        return cls(manifest, parts)
+
+    @classmethod
+    def _manifest_length(cls, header: bytes) -> int:
+        # Check the magic string and read the manifest length that follows it
+        if len(header) < len(cls.magic) + struct.calcsize(cls.header_format) or not header.startswith(cls.magic):
+            raise ModelBundleError('Not a model bundle file')
+        manifest_length, = struct.unpack(cls.header_format, header[len(cls.magic):])
+        return manifest_length
+
+    @staticmethod
+    def _parse_manifest(manifest_data: bytes) -> dict:
+        try:
+            return json.loads(manifest_data)
+        except ValueError:
+            raise ModelBundleError('Model bundle manifest is corrupted')
+
+    @classmethod
+    def _check_manifest(cls, manifest: dict) -> None:
+        # Refuse bundles that don't match the running code or the gazetteers on disk
+        if manifest.get('format_version') != cls.format_version:
+            raise ModelBundleError(f'Model bundle format version {manifest.get("format_version")} '
+                                   f'does not match expected version {cls.format_version}')
+        missing_parts = [part_name for part_name in cls.required_parts if part_name not in manifest.get('parts', {})]
+        if missing_parts:
+            raise ModelBundleError(f'Model bundle is missing required parts: {missing_parts}')
+        source_hashes = cls.source_hashes()
+        mismatched_sources = sorted(
+            source_file
+            for source_file in set(source_hashes) | set(manifest.get('source_hashes', {}))
+            if source_hashes.get(source_file) != manifest.get('source_hashes', {}).get(source_file)
+        )
+        if mismatched_sources:
+            raise ModelBundleError(f'Model bundle was built from different gazetteers: {mismatched_sources}')
+        content_hash = cls._content_hash(manifest['format_version'], manifest['source_hashes'], manifest['parts'])
+        if content_hash != manifest.get('content_hash'):
+            raise ModelBundleError('Model bundle content hash does not match its manifest')
+
+    @staticmethod
+    def _content_hash(format_version: int, source_hashes: dict, parts_manifest: dict) -> str:
+        # Hash of everything that identifies a bundle: format version, sources and parts' hashes
+        content = json.dumps({
+            'format_version': format_version,
+            'source_hashes': source_hashes,
+            'parts': {part_name: part['sha256'] for part_name, part in parts_manifest.items()},
+        }, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
@@ -4,11 +4,15 @@ import logbook
 import os
 import pickle
 import pymysql
-from functools import lru_cache
+import threading
+import time
 
 from role_normalization import settings
+from role_normalization.api.models.method_cache import method_cache
 from role_normalization.api.models.role_normalizer import RoleNormalizer
 from role_normalization.api.models.aho_corasick_matcher import AhoCorasickMatcher
+from role_normalization.api.models.model_bundle import ModelBundle
+from role_normalization.api.models.stage_timer import StageTimer
 from role_normalization.api.models.w2v_matcher import W2vMatcher
 
 
@@ -21,6 +25,7 @@ class ProcessedRole:
     """
     Stores a database role (role ID and title), its normalized form (processed title,
     seniorities and hierarchies) and related IDs (areap IDs, nivelh IDs, and perfil IDs).
+    Lists are stored as tuples, as processed roles are shared by every thread serving requests.
     """
 
     # Mapping of perfil IDs to areap IDs and nivelh IDs
@@ -31,11 +36,17 @@ class ProcessedRole:
         self.role_id = role_id
         self.title = title
         self.processed_title = processed_title
-        self.seniorities = seniorities
-        self.hierarchies = hierarchies
-        self.areap_ids = areap_ids
-        self.nivelh_ids = nivelh_ids
-        self.perfil_ids = perfil_ids
+        self.seniorities = tuple(seniorities)
+        self.hierarchies = tuple(hierarchies)
+        self.areap_ids = tuple(areap_ids)
+        self.nivelh_ids = tuple(nivelh_ids)
+        self.perfil_ids = tuple(perfil_ids)
+
+    def __setstate__(self, state: dict) -> None:
+        # Roles pickled before lists were stored as tuples are converted when unpickled
+        self.__dict__.update(state)
+        for attr in ['seniorities', 'hierarchies', 'areap_ids', 'nivelh_ids', 'perfil_ids']:
+            setattr(self, attr, tuple(getattr(self, attr)))
 
     def filter_by_perfil_ids(self, perfil_ids_filter: list) -> 'ProcessedRole':
         """
@@ -91,160 +102,390 @@ class RoleMatcher:
 
     """
     Normalize roles and match them against roles found in database. Singleton class.
+
+    Thread safe: models are created once and are only read afterwards, so a single instance
+    serves every thread of a worker process (Gunicorn gthread workers, for example).
     """
 
     _instance = None
-
-    def __new__(cls) -> 'RoleMatcher':
-        if cls._instance is None:
-            cls._instance = super(RoleMatcher, cls).__new__(cls)
+    _initialized = False
+    _lock = threading.Lock()
+
+    # Match quality levels, from slowest to fastest, see normalize_and_match():
+    # - full    : typo correction with edit distance up to 2 and every enabled matching stage
+    # - reduced : typo correction with edit distance 1, no Word2Vec matching
+    # - minimal : no typo correction, no Word2Vec matching
+    match_quality_levels = ('full', 'reduced', 'minimal')
+
+    def __new__(cls, *args, **kwargs) -> 'RoleMatcher':
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(RoleMatcher, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self) -> None:
-        try:
+    def __init__(self, use_model_bundle: bool = None) -> None:
+        """
+        Load the model bundle, if enabled and available, or create models from gazetteers,
+        pickles and database roles.
 
-            logger.info('Initializing RoleMatcher instance')
+        Parameters:
+        - use_model_bundle : bool : Load models from the model bundle, defaults to settings.model_bundle_enabled
+        """
+        # Singleton instance is initialized only once, even if requested by many threads at once
+        with self._lock:
+            if self._initialized:
+                return
+            try:
+
+                logger.info('Initializing RoleMatcher instance')
+                start_time = time.perf_counter()
+
+                if use_model_bundle is None:
+                    use_model_bundle = settings.model_bundle_enabled
+
+                model_bundle = None
+                if use_model_bundle and os.path.isfile(settings.model_bundle_path):
+                    model_bundle = ModelBundle.load(settings.model_bundle_path, settings.model_bundle_verify_hashes)
+                    self.model_version = model_bundle.content_hash
+                    self._init_from_model_bundle(model_bundle)
+                else:
+                    if use_model_bundle:
+                        logger.warning(f'Model bundle not found, creating models from sources: {settings.model_bundle_path}')
+                    self.model_version = None
+                    self._init_from_sources()
+
+                self.aho_corasick_matching_enabled = settings.aho_corasick_matching_enabled
+                if self.aho_corasick_matching_enabled:
+                    self.aho_corasick_matcher = AhoCorasickMatcher(
+                        self.norm_main_roles_mapping,
+                        self.norm_similar_roles_mapping,
+                        model_bundle['automaton'] if model_bundle else None
+                    )
 
-            load_dir = os.path.dirname(os.path.realpath(__file__)) + '/load'
-            gazetteers_dir = os.path.dirname(os.path.realpath(__file__)) + '/gazetteers/ptbr'
+                self.w2v_matching_enabled = settings.w2v_matching_enabled
+                if self.w2v_matching_enabled:
+                    self.w2v_matcher = W2vMatcher(
+                        self.norm_main_roles_mapping,
+                        self.norm_similar_roles_mapping,
+                        model_bundle['embeddings'] if model_bundle and 'embeddings' in model_bundle else None
+                    )
 
-            # Load distinct database roles title from file, if it exists
-            db_role_titles_filepath = load_dir + '/distinct_db_roles.pickle.gz'
-            if os.path.isfile(db_role_titles_filepath):
+                # Models generation, incremented by each reload, and its catalog roles by database
+                # row, known once reloaded - see next_generation()
+                self.generation = 1
+                self.catalog_roles = {}
+                # Time spent loading or creating models, in seconds
+                self.load_time = time.perf_counter() - start_time
+                self._initialized = True
+                logger.info(f'RoleMatcher instance initialized in {self.load_time:.2f} s')
+
+            # Raise an exception if an error occurs
+            except Exception as e:
+                logger.exception(f'Exception initializing RoleMatcher: {e}')
+                raise e
+
+    def _init_from_model_bundle(self, model_bundle: ModelBundle) -> None:
+        """
+        Create the role normalizer and catalog mappings from a model bundle.
 
-                with gzip.open(db_role_titles_filepath, 'rb') as f:
-                    db_role_titles = pickle.load(f)
+        Parameters:
+        - model_bundle : ModelBundle : Loaded model bundle
+        """
+        catalog = model_bundle['catalog']
+        self.db_role_titles = catalog['db_role_titles']
+        self.normalizer = RoleNormalizer(self.db_role_titles, model_bundle.parts)
+        ProcessedRole.profile_id_mapping.update(catalog['profile_id_mapping'])
+        self.norm_main_roles_mapping = catalog['norm_main_roles_mapping']
+        self.norm_similar_roles_mapping = catalog['norm_similar_roles_mapping']
 
-                logger.info(f'Loaded {len(db_role_titles)} distinct role titles from file')
+        logger.info(f'Loaded main roles\' mapping with {len(self.norm_main_roles_mapping)} entries from model bundle')
+        logger.info(f'Loaded similar roles\' mapping with {len(self.norm_similar_roles_mapping)} entries from model bundle')
 
-            # Else, get main and similar roles from database and save them to file
-            else:
+    def _init_from_sources(self) -> None:
+        """
+        Create the role normalizer and catalog mappings from pickles, if they exist, or from
+        gazetteers and database roles.
+        """
+        load_dir = os.path.dirname(os.path.realpath(__file__)) + '/load'
+        gazetteers_dir = os.path.dirname(os.path.realpath(__file__)) + '/gazetteers/ptbr'
 
-                # Get main and similar roles from database
-                # db_*_roles: [(ROLE_ID, 'ROLE_TITLE'), ...]
-                db_main_roles = self._get_db_main_roles()
-                db_similar_roles = self._get_db_similar_roles()
-                logger.info(f'Read {len(db_main_roles)} main roles from database')
-                logger.info(f'Read {len(db_similar_roles)} similar roles from database')
-
-                # Create a list with all role titles, used to create a dictionary of valid role words
-                # db_role_titles: ['ROLE_TITLE', ...]
-                db_role_titles = list(set([db_role[1] for db_role in db_main_roles + db_similar_roles]))
-
-                # Save database role titles to file
-                with gzip.open(db_role_titles_filepath, 'wb') as f:
-                    pickle.dump(db_role_titles, f)
-
-                logger.info(f'Loaded {len(db_role_titles)} distinct role titles from database')
-
-            # Create a role processor, adding words found in role titles to its dictionary
-            self.normalizer = RoleNormalizer(db_role_titles)
-
-            # Create a mapping of role IDs to areap IDs, nivelh IDs and perfil IDs - fields in Catho's databases
-            # role_id_mapping where all IDs are ints: {
-            #   ROLE_ID: {
-            #       'areap_ids': [AREAP_ID, ...],
-            #       'nivelh_ids': [NIVELH_ID, ...],
-            #       'perfil_ids': [PERFIL_ID, ...]
-            #   }
-            role_id_mapping = self._load_mapping(gazetteers_dir + '/mapping_cargo_id.json')
-            # Create a mapping of perfil IDs to areap IDs and nivelh IDs, used for filtering based on perfil IDs
-            # profile_id_mapping where all IDs are ints: {
-            #   PERFIL_ID: {
-            #       'areap_ids': [AREAP_ID, ...],
-            #       'nivelh_ids': [NIVELH_ID, ...]
-            #       'perfil_ids': [PERFIL_ID]
-            #   }
-            ProcessedRole.profile_id_mapping.update(self._load_mapping(gazetteers_dir + '/mapping_perfil_id.json'))
-
-            # Load normalized main and similar role titles from files, if they exist
-            norm_main_roles_mapping_filepath = load_dir + '/norm_main_roles_mapping.pickle.gz'
-            norm_similar_roles_mapping_filepath = load_dir + '/norm_similar_roles_mapping.pickle.gz'
-            if os.path.isfile(norm_main_roles_mapping_filepath) and os.path.isfile(norm_similar_roles_mapping_filepath):
-
-                    with gzip.open(norm_main_roles_mapping_filepath, 'rb') as f:
-                        self.norm_main_roles_mapping = pickle.load(f)
-                    with gzip.open(norm_similar_roles_mapping_filepath, 'rb') as f:
-                        self.norm_similar_roles_mapping = pickle.load(f)
-
-                    logger.info(f'Loaded main roles\' mapping with {len(self.norm_main_roles_mapping)} entries from file')
-                    logger.info(f'Loaded similar roles\' mapping with {len(self.norm_similar_roles_mapping)} entries from file')
-
-            # Else, normalize main and similar role titles and save them to files
-            else:
+        # Load distinct database roles title from file, if it exists
+        db_role_titles_filepath = load_dir + '/distinct_db_roles.pickle.gz'
+        if os.path.isfile(db_role_titles_filepath):
 
-                # Normalize main and similar roles
-                # norm_*_roles: [ProcessedRole, ...]
-                norm_main_roles = []
-                for i, db_role in enumerate(db_main_roles):
-                    norm_role, seniorities, hierarchies = self.normalizer.normalize(db_role[1], correct_typos=False)
-                    norm_main_roles.append(
-                        ProcessedRole(
-                            db_role[0], db_role[1],
-                            norm_role, seniorities, hierarchies,
-                            role_id_mapping.get(db_role[0], {}).get('areap_ids', []),
-                            role_id_mapping.get(db_role[0], {}).get('nivelh_ids', []),
-                            role_id_mapping.get(db_role[0], {}).get('perfil_ids', [])
-                        )
+            with gzip.open(db_role_titles_filepath, 'rb') as f:
+                db_role_titles = pickle.load(f)
+
+            logger.info(f'Loaded {len(db_role_titles)} distinct role titles from file')
+
+        # Else, get main and similar roles from database and save them to file
+        else:
+
+            # Get main and similar roles from database
+            # db_*_roles: [(ROLE_ID, 'ROLE_TITLE'), ...]
+            db_main_roles = self._get_db_main_roles()
+            db_similar_roles = self._get_db_similar_roles()
+            logger.info(f'Read {len(db_main_roles)} main roles from database')
+            logger.info(f'Read {len(db_similar_roles)} similar roles from database')
+
+            # Create a list with all role titles, used to create a dictionary of valid role words
+            # db_role_titles: ['ROLE_TITLE', ...]
+            db_role_titles = list(set([db_role[1] for db_role in db_main_roles + db_similar_roles]))
+
+            # Save database role titles to file
+            with gzip.open(db_role_titles_filepath, 'wb') as f:
+                pickle.dump(db_role_titles, f)
+
+            logger.info(f'Loaded {len(db_role_titles)} distinct role titles from database')
+
+        # Create a role processor, adding words found in role titles to its dictionary
+        self.db_role_titles = db_role_titles
+        self.normalizer = RoleNormalizer(self.db_role_titles)
+
+        # Create a mapping of role IDs to areap IDs, nivelh IDs and perfil IDs - fields in Catho's databases
+        # role_id_mapping where all IDs are ints: {
+        #   ROLE_ID: {
+        #       'areap_ids': [AREAP_ID, ...],
+        #       'nivelh_ids': [NIVELH_ID, ...],
+        #       'perfil_ids': [PERFIL_ID, ...]
+        #   }
+        role_id_mapping = self._load_mapping(gazetteers_dir + '/mapping_cargo_id.json')
+        # Create a mapping of perfil IDs to areap IDs and nivelh IDs, used for filtering based on perfil IDs
+        # profile_id_mapping where all IDs are ints: {
+        #   PERFIL_ID: {
+        #       'areap_ids': [AREAP_ID, ...],
+        #       'nivelh_ids': [NIVELH_ID, ...]
+        #       'perfil_ids': [PERFIL_ID]
+        #   }
+        ProcessedRole.profile_id_mapping.update(self._load_mapping(gazetteers_dir + '/mapping_perfil_id.json'))
+
+        # Load normalized main and similar role titles from files, if they exist
+        norm_main_roles_mapping_filepath = load_dir + '/norm_main_roles_mapping.pickle.gz'
+        norm_similar_roles_mapping_filepath = load_dir + '/norm_similar_roles_mapping.pickle.gz'
+        if os.path.isfile(norm_main_roles_mapping_filepath) and os.path.isfile(norm_similar_roles_mapping_filepath):
+
+                with gzip.open(norm_main_roles_mapping_filepath, 'rb') as f:
+                    self.norm_main_roles_mapping = pickle.load(f)
+                with gzip.open(norm_similar_roles_mapping_filepath, 'rb') as f:
+                    self.norm_similar_roles_mapping = pickle.load(f)
+
+                logger.info(f'Loaded main roles\' mapping with {len(self.norm_main_roles_mapping)} entries from file')
+                logger.info(f'Loaded similar roles\' mapping with {len(self.norm_similar_roles_mapping)} entries from file')
+
+        # Else, normalize main and similar role titles and save them to files
+        else:
+
+            # Normalize main and similar roles
+            # norm_*_roles: [ProcessedRole, ...]
+            norm_main_roles = []
+            for i, db_role in enumerate(db_main_roles):
+                norm_role, seniorities, hierarchies = self.normalizer.normalize(db_role[1], correct_typos=False)
+                norm_main_roles.append(
+                    ProcessedRole(
+                        db_role[0], db_role[1],
+                        norm_role, seniorities, hierarchies,
+                        role_id_mapping.get(db_role[0], {}).get('areap_ids', []),
+                        role_id_mapping.get(db_role[0], {}).get('nivelh_ids', []),
+                        role_id_mapping.get(db_role[0], {}).get('perfil_ids', [])
                     )
-                    if i % 100 == 0:
-                        logger.debug(f'Normalized {i}/{len(db_main_roles)} main role titles')
-                norm_similar_roles = []
-                for i, db_role in enumerate(db_similar_roles):
-                    norm_role, seniorities, hierarchies = self.normalizer.normalize(db_role[1], correct_typos=False)
-                    norm_similar_roles.append(
-                        ProcessedRole(
-                            db_role[0], db_role[1],
-                            norm_role, seniorities, hierarchies,
-                            role_id_mapping.get(db_role[0], {}).get('areap_ids', []),
-                            role_id_mapping.get(db_role[0], {}).get('nivelh_ids', []),
-                            role_id_mapping.get(db_role[0], {}).get('perfil_ids', [])
-                        )
+                )
+                if i % 100 == 0:
+                    logger.debug(f'Normalized {i}/{len(db_main_roles)} main role titles')
+            norm_similar_roles = []
+            for i, db_role in enumerate(db_similar_roles):
+                norm_role, seniorities, hierarchies = self.normalizer.normalize(db_role[1], correct_typos=False)
+                norm_similar_roles.append(
+                    ProcessedRole(
+                        db_role[0], db_role[1],
+                        norm_role, seniorities, hierarchies,
+                        role_id_mapping.get(db_role[0], {}).get('areap_ids', []),
+                        role_id_mapping.get(db_role[0], {}).get('nivelh_ids', []),
+                        role_id_mapping.get(db_role[0], {}).get('perfil_ids', [])
                     )
-                    if i % 100 == 0:
-                        logger.debug(f'Normalized {i}/{len(db_similar_roles)} similar role titles')
-
-                logger.info(f'Normalized {len(norm_main_roles)} main roles')
-                logger.info(f'Normalized {len(norm_similar_roles)} similar roles')
-
-                # Create mappings of normalized titles to ProcessedRole objects, used to check if a
-                # given title matches a title found in the database
-                # self.norm_*_roles_mapping: {'ROLE_TITLE': ProcessedRole(ROLE_ID, 'ROLE_TITLE'), ...}
-                self.norm_main_roles_mapping = {}
-                for norm_role in norm_main_roles:
-                    if not self.norm_main_roles_mapping.get(norm_role.processed_title):
-                        self.norm_main_roles_mapping[norm_role.processed_title] = norm_role
-                self.norm_similar_roles_mapping = {}
-                for norm_role in norm_similar_roles:
-                    if (
-                        not self.norm_main_roles_mapping.get(norm_role.processed_title)
-                        and not self.norm_similar_roles_mapping.get(norm_role.processed_title)
-                    ):
-                        self.norm_similar_roles_mapping[norm_role.processed_title] = norm_role
-
-                # Save normalized main and similar role titles to files
-                with gzip.open(norm_main_roles_mapping_filepath, 'wb') as f:
-                    pickle.dump(self.norm_main_roles_mapping, f)
-                with gzip.open(norm_similar_roles_mapping_filepath, 'wb') as f:
-                    pickle.dump(self.norm_similar_roles_mapping, f)
-
-                logger.info(f'Created main roles\' mapping with {len(self.norm_main_roles_mapping)} entries')
-                logger.info(f'Created similar roles\' mapping with {len(self.norm_similar_roles_mapping)} entries')
-
-            self.aho_corasick_matching_enabled = settings.aho_corasick_matching_enabled
-            if self.aho_corasick_matching_enabled:
-                self.aho_corasick_matcher = AhoCorasickMatcher(self.norm_main_roles_mapping, self.norm_similar_roles_mapping)
-
-            self.w2v_matching_enabled = settings.w2v_matching_enabled
-            if self.w2v_matching_enabled:
-                self.w2v_matcher = W2vMatcher(self.norm_main_roles_mapping, self.norm_similar_roles_mapping)
-
-            logger.info('RoleMatcher instance initialized')
-
-        # Raise an exception if an error occurs
-        except Exception as e:
-            logger.exception(f'Exception initializing RoleMatcher: {e}')
-            raise e
+                )
+                if i % 100 == 0:
+                    logger.debug(f'Normalized {i}/{len(db_similar_roles)} similar role titles')
+
+            logger.info(f'Normalized {len(norm_main_roles)} main roles')
+            logger.info(f'Normalized {len(norm_similar_roles)} similar roles')
+
+            self.norm_main_roles_mapping, self.norm_similar_roles_mapping = \
+                self._create_mappings(norm_main_roles, norm_similar_roles)
+
+            # Save normalized main and similar role titles to files
+            with gzip.open(norm_main_roles_mapping_filepath, 'wb') as f:
+                pickle.dump(self.norm_main_roles_mapping, f)
+            with gzip.open(norm_similar_roles_mapping_filepath, 'wb') as f:
+                pickle.dump(self.norm_similar_roles_mapping, f)
+
+            logger.info(f'Created main roles\' mapping with {len(self.norm_main_roles_mapping)} entries')
+            logger.info(f'Created similar roles\' mapping with {len(self.norm_similar_roles_mapping)} entries')
+
+    def _create_mappings(self, norm_main_roles: list, norm_similar_roles: list) -> tuple[dict, dict]:
+        """
+        Create mappings of normalized titles to ProcessedRole objects, used to check if a given
+        title matches a title found in the database. The first role of each normalized title is
+        kept, main roles first.
+
+        Parameters:
+        - norm_main_roles    : [ProcessedRole, ...] : Normalized main roles
+        - norm_similar_roles : [ProcessedRole, ...] : Normalized similar roles
+
+        Returns:
+        - dict : Main roles mapping - {'ROLE_TITLE': ProcessedRole(ROLE_ID, 'ROLE_TITLE'), ...}
+        - dict : Similar roles mapping, without titles found in the main roles mapping
+        """
+        norm_main_roles_mapping = {}
+        for norm_role in norm_main_roles:
+            if not norm_main_roles_mapping.get(norm_role.processed_title):
+                norm_main_roles_mapping[norm_role.processed_title] = norm_role
+        norm_similar_roles_mapping = {}
+        for norm_role in norm_similar_roles:
+            if (
+                not norm_main_roles_mapping.get(norm_role.processed_title)
+                and not norm_similar_roles_mapping.get(norm_role.processed_title)
+            ):
+                norm_similar_roles_mapping[norm_role.processed_title] = norm_role
+        return norm_main_roles_mapping, norm_similar_roles_mapping
+
+    def next_generation(self, db_main_roles: list = None, db_similar_roles: list = None,
+                        reread_gazetteers: bool = False) -> tuple['RoleMatcher', dict]:
+        """
+        Create the next generation of models, from the current database catalog, role IDs mapping
+        and gazetteers, reusing whatever didn't change: the role normalizer, if neither gazetteers
+        nor the words of role titles changed, the normalization of catalog roles, unless gazetteers
+        changed, and the Aho-Corasick automaton, patched with added and removed titles. This
+        generation isn't changed, and keeps serving requests meanwhile.
+
+        Parameters:
+        - db_main_roles     : [(int, str), ...] : Main roles, read from database if not received
+        - db_similar_roles  : [(int, str), ...] : Similar roles, read from database if not received
+        - reread_gazetteers : bool              : Read gazetteers from files again, as they changed
+
+        Returns:
+        - RoleMatcher : Next generation, to be swapped in for this one
+        - dict        : Reload stats - catalog roles normalized again, titles changed, etc.
+        """
+        start_time = time.perf_counter()
+        gazetteers_dir = os.path.dirname(os.path.realpath(__file__)) + '/gazetteers/ptbr'
+
+        if db_main_roles is None:
+            db_main_roles = self._get_db_main_roles()
+        if db_similar_roles is None:
+            db_similar_roles = self._get_db_similar_roles()
+        role_id_mapping = self._load_mapping(gazetteers_dir + '/mapping_cargo_id.json')
+        db_role_titles = list(set([db_role[1] for db_role in db_main_roles + db_similar_roles]))
+
+        normalizer = self.normalizer.updated(db_role_titles, reread_gazetteers)
+        # Normalization of catalog roles doesn't correct typos, so it only changes along with
+        # gazetteers - every role is normalized again if mappings changed, only roles that may
+        # contain them if locations did
+        renormalize = any(
+            normalizer.gazetteers[name] != self.normalizer.gazetteers[name]
+            for name in normalizer.gazetteers
+            if name != 'sorted_locations'
+        )
+        changed_locations = set(normalizer.sorted_locations) ^ set(self.normalizer.sorted_locations)
+
+        # Current catalog roles, by database row, whose normalization is reused - roles whose
+        # normalized title was taken by another role are only known from the previous reload on
+        current_roles = {}
+        if not renormalize:
+            for mapping in [self.norm_similar_roles_mapping, self.norm_main_roles_mapping]:
+                for norm_role in mapping.values():
+                    current_roles[(norm_role.role_id, norm_role.title)] = norm_role
+            current_roles.update(self.catalog_roles)
+        catalog_roles = {}
+
+        normalized_roles = 0
+        def process(db_role: tuple) -> ProcessedRole:
+            nonlocal normalized_roles
+            ids = role_id_mapping.get(db_role[0], {})
+            areap_ids = tuple(ids.get('areap_ids', []))
+            nivelh_ids = tuple(ids.get('nivelh_ids', []))
+            perfil_ids = tuple(ids.get('perfil_ids', []))
+            norm_role = current_roles.get(tuple(db_role))
+            if norm_role is None or (changed_locations and normalizer.contains_words(db_role[1], changed_locations)):
+                normalized_roles += 1
+                norm_title, seniorities, hierarchies = normalizer.normalize(db_role[1], correct_typos=False)
+                norm_role = ProcessedRole(db_role[0], db_role[1], norm_title, seniorities, hierarchies, areap_ids, nivelh_ids, perfil_ids)
+            elif (norm_role.areap_ids, norm_role.nivelh_ids, norm_role.perfil_ids) != (areap_ids, nivelh_ids, perfil_ids):
+                norm_role = ProcessedRole(
+                    norm_role.role_id, norm_role.title,
+                    norm_role.processed_title, norm_role.seniorities, norm_role.hierarchies,
+                    areap_ids, nivelh_ids, perfil_ids)
+            catalog_roles[tuple(db_role)] = norm_role
+            return norm_role
+
+        norm_main_roles_mapping, norm_similar_roles_mapping = self._create_mappings(
+            [process(db_role) for db_role in db_main_roles],
+            [process(db_role) for db_role in db_similar_roles])
+
+        # Titles whose role was added, removed or changed, and their role IDs
+        current_titles = self.norm_main_roles_mapping.keys() | self.norm_similar_roles_mapping.keys()
+        titles = norm_main_roles_mapping.keys() | norm_similar_roles_mapping.keys()
+        changed_role_ids = set()
+        changed_titles = 0
+        for title in titles | current_titles:
+            current_role = self.norm_main_roles_mapping.get(title) or self.norm_similar_roles_mapping.get(title)
+            role = norm_main_roles_mapping.get(title) or norm_similar_roles_mapping.get(title)
+            if role is not current_role and (role is None or current_role is None or vars(role) != vars(current_role)):
+                changed_titles += 1
+                changed_role_ids.update(norm_role.role_id for norm_role in [current_role, role] if norm_role is not None)
+
+        # A new instance, bypassing the singleton, sharing every attribute not replaced below
+        generation = object.__new__(type(self))
+        generation.__dict__.update(self.__dict__)
+        generation.generation = self.generation + 1
+        generation.model_version = None
+        generation.db_role_titles = db_role_titles
+        generation.catalog_roles = catalog_roles
+        generation.normalizer = normalizer
+        generation.norm_main_roles_mapping = norm_main_roles_mapping
+        generation.norm_similar_roles_mapping = norm_similar_roles_mapping
+        if self.aho_corasick_matching_enabled and titles != current_titles:
+            generation.aho_corasick_matcher = self.aho_corasick_matcher.patched(titles - current_titles, current_titles - titles)
+        if self.w2v_matching_enabled and changed_titles:
+            generation.w2v_matcher = W2vMatcher(norm_main_roles_mapping, norm_similar_roles_mapping)
+        generation.load_time = time.perf_counter() - start_time
+
+        stats = {
+            'generation': generation.generation,
+            'duration_s': round(generation.load_time, 3),
+            'catalog_roles': len(db_main_roles) + len(db_similar_roles),
+            'normalized_roles': normalized_roles,
+            'changed_titles': changed_titles,
+            'changed_role_ids': sorted(changed_role_ids),
+            'added_titles': len(titles - current_titles),
+            'normalizer_reused': normalizer is self.normalizer,
+        }
+        logger.info(f'RoleMatcher generation {generation.generation} created in {generation.load_time:.2f} s: '
+                    f'{normalized_roles} of {stats["catalog_roles"]} catalog roles normalized, '
+                    f'{changed_titles} titles changed')
+        return generation, stats
+
+    def model_parts(self) -> dict:
+        """
+        Return every model part stored in a model bundle: dictionary, spell checker, gazetteers,
+        catalog mappings, Aho-Corasick automaton and, if Word2Vec matching is enabled, embeddings.
+
+        Returns:
+        - dict : {'PART_NAME': object, ...}
+        """
+        parts = self.normalizer.model_parts()
+        parts['catalog'] = {
+            'db_role_titles': self.db_role_titles,
+            'norm_main_roles_mapping': self.norm_main_roles_mapping,
+            'norm_similar_roles_mapping': self.norm_similar_roles_mapping,
+            'profile_id_mapping': ProcessedRole.profile_id_mapping,
+        }
+        if self.aho_corasick_matching_enabled:
+            parts['automaton'] = self.aho_corasick_matcher.automaton
+        else:
+            parts['automaton'] = AhoCorasickMatcher(self.norm_main_roles_mapping, self.norm_similar_roles_mapping).automaton
+        if self.w2v_matching_enabled:
+            parts['embeddings'] = self.w2v_matcher.model_parts()
+        return parts
 
     def _load_mapping(self, mapping_file: str) -> list:
         """
@@ -317,6 +558,15 @@ class RoleMatcher:
         """
         return self._get_db_roles(similar_roles_db_query)
 
+    def catalog_checksum(self) -> tuple:
+        """
+        Retrieve checksums of database catalog tables, which change along with their rows.
+
+        Returns:
+        - ((str, int), ...) : Tuples with table name and checksum
+        """
+        return tuple(self._get_db_roles('CHECKSUM TABLE conline.cargo, conline.cargo_titulo;'))
+
     def _get_db_roles(self, db_query: str) -> list:
         """
         Retrieve roles from database, using the received query.
@@ -380,21 +630,54 @@ class RoleMatcher:
         return self.normalizer.normalize(role_title)
 
     @lru_hash_mutable
-    @lru_cache(maxsize=8192)
-    def normalize_and_match(self, role_title: str, perfil_ids_filter: list = None) -> tuple[str, ProcessedRole, str]:
+    @method_cache(maxsize=8192)
+    def normalize_and_match(self, role_title: str, perfil_ids_filter: list = None, quality: str = 'full') -> tuple[str, ProcessedRole, str]:
         """
         Normalize a role title and match it against role titles found in database.
 
         Parameters:
         - role_title        : str  : Role title to be normalized and matched against database roles
         - perfil_ids_filter : list : List of perfil IDs to filter normalized roles
+        - quality           : str  : Match quality level, one of match_quality_levels - lower levels
+                                     skip the expensive stages of the cascade, default is "full"
 
         Returns:
         - str           : Normalized role title
         - ProcessedRole : Database role that matches this normalized role title, if any
         - str           : Match type, if any - either "database", "ahocorasick", or "word2vec"
         """
-        norm_title, _, _ = self.normalizer.normalize(role_title)
+        return self._normalize_and_match(role_title, perfil_ids_filter, quality)
+
+    def profile_normalize_and_match(self, role_title: str, perfil_ids_filter: list = None, quality: str = 'full') -> tuple[tuple, dict]:
+        """
+        Normalize a role title and match it against role titles found in database, like
+        normalize_and_match(), bypassing caches and timing each stage of the cascade.
+
+        Parameters:
+        - role_title        : str  : Role title to be normalized and matched against database roles
+        - perfil_ids_filter : list : List of perfil IDs to filter normalized roles
+        - quality           : str  : Match quality level, one of match_quality_levels
+
+        Returns:
+        - tuple : normalize_and_match() result
+        - dict  : Elapsed time of each stage and counters, see StageTimer.report()
+        """
+        stage_timer = StageTimer()
+        result = self._normalize_and_match(role_title, perfil_ids_filter, quality, stage_timer)
+        return result, stage_timer.report()
+
+    def _normalize_and_match(self, role_title: str, perfil_ids_filter: list = None, quality: str = 'full',
+                             stage_timer: StageTimer = None) -> tuple[str, ProcessedRole, str]:
+        # Uncached normalize_and_match(), timing each stage if a stage timer is received
+        normalize_args = {}
+        if quality == 'reduced':
+            normalize_args = {'max_edit_distance': 1}
+        elif quality != 'full':
+            normalize_args = {'correct_typos': False}
+        if stage_timer is None:
+            norm_title, _, _ = self.normalizer.normalize(role_title, **normalize_args)
+        else:
+            norm_title, _, _ = self.normalizer._normalize(role_title, stage_timer=stage_timer, **normalize_args)
         db_norm_role = None
         match_type = None
 
@@ -407,6 +690,8 @@ class RoleMatcher:
         logger.debug(f'Trying database match...')
         db_norm_role = self.norm_main_roles_mapping.get(norm_title) or \
             self.norm_similar_roles_mapping.get(norm_title)
+        if stage_timer is not None:
+            stage_timer.lap('database_match')
         if db_norm_role:
             if perfil_ids_filter:
                 if not set.intersection(set(perfil_ids_filter), set(db_norm_role.perfil_ids)):
@@ -421,7 +706,9 @@ class RoleMatcher:
         # Try to match word sequences of the role title using Aho-Corasick
         if self.aho_corasick_matching_enabled:
             logger.debug(f'Trying Aho-Corasick match...')
-            matched_role = self.aho_corasick_matcher.match(norm_title)
+            matched_role = self.aho_corasick_matcher.match(norm_title, stage_timer)
+            if stage_timer is not None:
+                stage_timer.lap('ahocorasick_match')
             if matched_role:
                 db_norm_role = self.norm_main_roles_mapping.get(matched_role) or \
                     self.norm_similar_roles_mapping.get(matched_role)
@@ -436,9 +723,11 @@ class RoleMatcher:
                     return norm_title, db_norm_role, match_type
 
         # Try to find a similar role using Word2Vec
-        if self.w2v_matching_enabled:
+        if self.w2v_matching_enabled and quality == 'full':
             logger.debug(f'Trying Word2Vec match...')
-            matched_role = self.w2v_matcher.match(norm_title)
+            matched_role = self.w2v_matcher.match(norm_title, stage_timer)
+            if stage_timer is not None:
+                stage_timer.lap('w2v_match')
             if matched_role:
                 db_norm_role = self.norm_main_roles_mapping.get(matched_role) or \
                     self.norm_similar_roles_mapping.get(matched_role)
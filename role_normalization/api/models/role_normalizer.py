@@ -1,4 +1,5 @@
 import bisect
+import copy
 import gzip
 import json
 import logbook
@@ -10,11 +11,13 @@ import re2 as re
 import tempfile
 import unicodedata
 from collections import OrderedDict
-from functools import lru_cache
+from types import MappingProxyType
 from symspellpy import SymSpell, Verbosity
 from unidecode import unidecode
 
 from role_normalization import settings
+from role_normalization.api.models.method_cache import method_cache
+from role_normalization.api.models.stage_timer import StageTimer
 
 
 logger = logbook.Logger(__name__)
@@ -27,38 +30,39 @@ class RoleNormalizer:
     Normalize a given role title - remove stopwords, correct spelling, apply gazetteers, etc.
     """
 
-    # Class attributes, shared by all instances
-    special_character_regexes = []
-    thesaurus_regexes = []
-    conjugation_mapping = {}
-    gender_regexes = []
-    plural_regexes = []
-    sorted_locations = []
-
-    space_characters = [":", ",", ";", ".", "-", "–", "\t", "\\t"]
+    # Class attributes, shared by all instances - immutable, as instances are used by many threads
+    space_characters = (":", ",", ";", ".", "-", "–", "\t", "\\t")
     special_characters = "\\()[]{}&#*+<>'\"/?!|^~@$%=`´¨_"
-    line_break_characters = ["\r", "\n", "\\r", "\\n"]
-    stop_words_to_keep = set(["sem"])
-    additional_stop_words = set(["in", "of", "on"])
+    line_break_characters = ("\r", "\n", "\\r", "\\n")
+    stop_words_to_keep = frozenset(["sem"])
+    additional_stop_words = frozenset(["in", "of", "on"])
 
     stemmer = nltk.stem.RSLPStemmer()
 
-    seniorities = set(["trainee", "junior", "pleno", "senior", "plena", "jr", "pl", "sr"])
-    hierarchies = set(["lider", "chefe", "gerente", "supervisor", "coordenador", "supervisora", "coordenadora"])
-    stopwords = set()
-
-    # Instance attributes, object specific
+    seniorities = frozenset(["trainee", "junior", "pleno", "senior", "plena", "jr", "pl", "sr"])
+    hierarchies = frozenset(["lider", "chefe", "gerente", "supervisor", "coordenador", "supervisora", "coordenadora"])
+    stopwords = frozenset()
+
+    # Instance attributes, object specific - set during initialization and read-only afterwards
+    # special_character_regexes
+    # thesaurus_regexes
+    # conjugation_mapping
+    # gender_regexes
+    # plural_regexes
+    # sorted_locations
     # dictionary
     # spell_checker
 
 
-    def __init__(self, role_titles: list) -> None:
+    def __init__(self, role_titles: list, model_parts: dict = None) -> None:
 
         """
         Initialize a role processor instance.
 
         Parameters:
         - role_titles : [str, ...] : Words extracted from these role titles will be added to the dictionary and to the spell checker
+        - model_parts : dict       : Dictionary, spell checker and gazetteers read from a model bundle, optional. If
+                                     received, gazetteer files and dictionary/spell checker pickles are not read
         """
 
         logger.info('Initializing RoleNormalizer instance')
@@ -66,13 +70,18 @@ class RoleNormalizer:
         load_dir = os.path.dirname(os.path.realpath(__file__)) + '/load'
         gazetteers_dir = os.path.dirname(os.path.realpath(__file__)) + '/gazetteers/ptbr'
 
-        self.stopwords.update(self._load_stopwords(gazetteers_dir + '/stopwords.txt'))
-        self.stopwords = self.stopwords - self.stop_words_to_keep | self.additional_stop_words
-        self.special_character_regexes.extend(self._load_mapping(gazetteers_dir + '/mapping_special_character_terms.txt'))
-        self.thesaurus_regexes.extend(self._load_mapping(gazetteers_dir + '/mapping_thesaurus.txt'))
-        self.conjugation_mapping.update(self._load_conjugation_mapping(gazetteers_dir + '/mapping_conjugation.txt'))
-        self.gender_regexes.extend(self._load_mapping(gazetteers_dir + '/mapping_gender.txt'))
-        self.plural_regexes.extend(self._load_plural_mapping(gazetteers_dir + '/mapping_plural.txt'))
+        # Gazetteers are kept uncompiled, so they can be stored in a model bundle, and compiled below
+        if model_parts:
+            self.gazetteers = model_parts['gazetteers']
+        else:
+            self.gazetteers = self._read_gazetteers(gazetteers_dir)
+
+        self.stopwords = self._stopwords(self.gazetteers)
+        self.special_character_regexes = self._compile_mapping(self.gazetteers['special_character_mapping'])
+        self.thesaurus_regexes = self._compile_mapping(self.gazetteers['thesaurus_mapping'])
+        self.conjugation_mapping = MappingProxyType(dict(self.gazetteers['conjugation_mapping']))
+        self.gender_regexes = self._compile_mapping(self.gazetteers['gender_mapping'])
+        self.plural_regexes = self._compile_mapping(self.gazetteers['plural_mapping'])
         logger.info(f"Stop words list contains {len(self.stopwords)} words")
         logger.info(f"Special character terms mapping contains {len(self.special_character_regexes)} entries")
         logger.info(f"Synonyms mapping contains {len(self.thesaurus_regexes)} entries")
@@ -80,14 +89,26 @@ class RoleNormalizer:
         logger.info(f"Gender inflection mapping contains {len(self.gender_regexes)} entries")
         logger.info(f"Plural inflection mapping contains {len(self.plural_regexes)} entries")
 
-        self.sorted_locations = sorted(self._load_locations(gazetteers_dir + '/locations.txt', role_titles))
+        # Locations depend on stop words, so they are read after these are loaded
+        if not model_parts:
+            self.gazetteers['sorted_locations'] = sorted(self._load_locations(gazetteers_dir + '/locations.txt', role_titles, self.stopwords))
+        self.sorted_locations = tuple(self.gazetteers['sorted_locations'])
         logger.info(f"Locations list contains {len(self.sorted_locations)} words")
 
         dictionary_filepath = load_dir + '/dictionary.pickle.gz'
         spell_checker_filepath = load_dir + '/spell_checker.pickle.gz'
 
-        # Load dictionary and spell checker from files, if they exist
-        if os.path.isfile(dictionary_filepath) and os.path.isfile(spell_checker_filepath):
+        # Use dictionary and spell checker from model bundle, if received
+        if model_parts:
+
+            self.dictionary = model_parts['dictionary']
+            self.spell_checker = model_parts['spell_checker']
+
+            logger.info(f"Loaded dictionary with {len(self.dictionary)} words from model bundle")
+            logger.info(f"Loaded spell checker with {len(self.spell_checker.words)} words from model bundle")
+
+        # Else, load dictionary and spell checker from files, if they exist
+        elif os.path.isfile(dictionary_filepath) and os.path.isfile(spell_checker_filepath):
 
             with gzip.open(dictionary_filepath, 'rb') as f:
                 self.dictionary = pickle.load(f)
@@ -112,17 +133,17 @@ class RoleNormalizer:
                 conjugation_ptbr +
                 list(self.stopwords) +
                 list(self.seniorities) + list(self.hierarchies) +
-                self.sorted_locations
+                list(self.sorted_locations)
             )
 
             self._create_spell_checker()
             logger.info(f'Spell checker created with {len(self.spell_checker.words)} words')
             if role_titles:
                 self._extract_and_add_to_dictioary(role_titles)
-            thesaurus_words = self._extract_words_from_mapping(gazetteers_dir + '/mapping_thesaurus.txt')
+            thesaurus_words = self._extract_words_from_mapping(gazetteers_dir + '/mapping_thesaurus.txt', self.stopwords)
             if thesaurus_words:
                 self._extract_and_add_to_dictioary(thesaurus_words)
-            special_character_words = self._extract_words_from_mapping(gazetteers_dir + '/mapping_special_character_terms.txt')
+            special_character_words = self._extract_words_from_mapping(gazetteers_dir + '/mapping_special_character_terms.txt', self.stopwords)
             if special_character_words:
                 self._extract_and_add_to_dictioary(special_character_words)
 
@@ -138,6 +159,135 @@ class RoleNormalizer:
         logger.info('RoleNormalizer instance initialized')
 
 
+    def model_parts(self) -> dict:
+        """
+        Return the parts of this normalizer that are stored in a model bundle.
+
+        Returns:
+        - dict : Dictionary, spell checker and uncompiled gazetteers
+        """
+        return {
+            'dictionary': self.dictionary,
+            'spell_checker': self.spell_checker,
+            'gazetteers': self.gazetteers,
+        }
+
+
+    def updated(self, role_titles: list, reread_gazetteers: bool = False) -> 'RoleNormalizer':
+        """
+        Return a normalizer for an updated catalog: this normalizer, if neither the words of role
+        titles nor gazetteers changed, or a new one, sharing what didn't change. Words of role titles
+        missing from the dictionary are added to a copy of the dictionary and spell checker.
+
+        Parameters:
+        - role_titles       : [str, ...] : Database role titles of the updated catalog
+        - reread_gazetteers : bool       : Read gazetteers from files again, as they changed
+
+        Returns:
+        - RoleNormalizer : Normalizer to be used with the updated catalog
+        """
+        gazetteers_dir = os.path.dirname(os.path.realpath(__file__)) + '/gazetteers/ptbr'
+
+        gazetteers = self._read_gazetteers(gazetteers_dir) if reread_gazetteers else dict(self.gazetteers)
+        # Locations depend on stop words, which may have changed too if gazetteers were read again
+        stopwords = self._stopwords(gazetteers)
+        sorted_locations = sorted(self._load_locations(gazetteers_dir + '/locations.txt', role_titles, stopwords))
+        words_freq_dict = self._extract_words(role_titles)
+        if reread_gazetteers:
+            for mapping_file in ['/mapping_thesaurus.txt', '/mapping_special_character_terms.txt']:
+                for word, count in self._extract_words(self._extract_words_from_mapping(gazetteers_dir + mapping_file, stopwords)).items():
+                    words_freq_dict[word] = words_freq_dict.get(word, 0) + count
+        new_words_freq_dict = {word: count for word, count in words_freq_dict.items() if word not in self.dictionary}
+
+        if not reread_gazetteers and sorted_locations == list(self.sorted_locations) and not new_words_freq_dict:
+            return self
+
+        gazetteers['sorted_locations'] = sorted_locations
+        spell_checker = copy.deepcopy(self.spell_checker) if new_words_freq_dict else self.spell_checker
+        normalizer = RoleNormalizer(role_titles, {
+            'gazetteers': gazetteers,
+            'dictionary': self.dictionary,
+            'spell_checker': spell_checker,
+        })
+        if new_words_freq_dict:
+            normalizer._add_to_dictionary(new_words_freq_dict)
+        logger.info(f'RoleNormalizer updated: {len(new_words_freq_dict)} new words, '
+                    f'{len(set(sorted_locations) ^ set(self.sorted_locations))} locations changed')
+        return normalizer
+
+
+    def contains_words(self, role_title: str, words: set) -> bool:
+        """
+        Check if a role title may contain any of the received words once folded - lower-cased,
+        special character terms normalized, special symbols and accents removed - as location words
+        are removed from titles. Used to find which titles a change of locations affects: it may
+        report titles that aren't affected, never the other way around.
+
+        Parameters:
+        - role_title : str        : Role title
+        - words      : {str, ...} : Words searched, as found in the locations list
+
+        Returns:
+        - bool : True if any word is found in the folded title
+        """
+        folded_title = self._normalize_by_mapping(role_title.lower(), self.special_character_regexes)
+        folded_title = self._transform_text(folded_title, list(self.special_characters), "")
+        folded_title = self._fix_encoding(unicodedata.normalize('NFKD', folded_title).encode("ASCII", "ignore"))
+        return any(word in folded_title for word in words)
+
+
+    def changed_words(self, updated: 'RoleNormalizer') -> set:
+        """
+        Return the words whose normalization may differ with an updated normalizer, see updated():
+        words added to the dictionary and locations added or removed. Titles that don't contain
+        them, see contains_words(), are normalized the same way by both, unless typos are corrected
+        and the spell checker changed - see corrects_typos().
+
+        Parameters:
+        - updated : RoleNormalizer : Updated normalizer
+
+        Returns:
+        - {str, ...} : Changed words, or None if gazetteers other than locations changed, as any
+                       title may then be normalized differently
+        """
+        if any(updated.gazetteers[name] != self.gazetteers[name] for name in updated.gazetteers if name != 'sorted_locations'):
+            return None
+        return (updated.dictionary - self.dictionary) | (set(updated.sorted_locations) ^ set(self.sorted_locations))
+
+
+    def corrects_typos(self, role_title: str) -> bool:
+        """
+        Check if typo correction looks up any word of a role title in the spell checker - words
+        missing from the dictionary, as found once the title is folded the way normalize() does
+        before correcting typos.
+
+        Parameters:
+        - role_title : str : Role title
+
+        Returns:
+        - bool : True if any word of the title is missing from the dictionary
+        """
+        if not role_title or not isinstance(role_title, str):
+            return False
+        folded_title = self._transform_text(role_title.lower(), self.line_break_characters, " ")
+        folded_title = self._normalize_by_mapping(folded_title, self.special_character_regexes)
+        folded_title = self._transform_text(folded_title, self.space_characters, " ")
+        folded_title = self._transform_text(folded_title, list(self.special_characters), "")
+        return any(word not in self.dictionary for word in folded_title.split())
+
+
+    def _read_gazetteers(self, gazetteers_dir: str) -> dict:
+        # gazetteers: {'GAZETTEER': [('PATTERN', 'REPLACEMENT'), ...] or {'WORD', ...} or ..., ...}
+        return {
+            'stopwords': self._load_stopwords(gazetteers_dir + '/stopwords.txt'),
+            'special_character_mapping': self._read_mapping(gazetteers_dir + '/mapping_special_character_terms.txt'),
+            'thesaurus_mapping': self._read_mapping(gazetteers_dir + '/mapping_thesaurus.txt'),
+            'conjugation_mapping': self._load_conjugation_mapping(gazetteers_dir + '/mapping_conjugation.txt'),
+            'gender_mapping': self._read_mapping(gazetteers_dir + '/mapping_gender.txt'),
+            'plural_mapping': self._read_plural_mapping(gazetteers_dir + '/mapping_plural.txt'),
+        }
+
+
     def _load_stopwords(self, stopwords_file: str) -> dict:
         # stopwords: {STOPWORD, ...}
         stopwords = set()
@@ -149,9 +299,9 @@ class RoleNormalizer:
         return stopwords
 
 
-    def _load_mapping(self, mapping_file: str) -> list:
-        # regexes: [('PATTERN', 'REPLACEMENT'), ...]
-        regexes = []
+    def _read_mapping(self, mapping_file: str) -> list:
+        # mapping_patterns: [('PATTERN', 'REPLACEMENT'), ...]
+        mapping_patterns = []
         with open(mapping_file) as f:
             # mapping: {'BASE_WORD': ['VARIATION', ...], ...}
             mapping = OrderedDict()
@@ -169,15 +319,22 @@ class RoleNormalizer:
             for k, v in mapping.items():
                 pattern = "|".join([re.escape(i) for i in v])
                 pattern = r"( |^)+({})( |$)+".format(pattern)
-                pattern = re.compile(pattern)
                 replacement = r"\1{}\3".format(k)
-                regexes.append((pattern, replacement))
-        return regexes
+                mapping_patterns.append((pattern, replacement))
+        return mapping_patterns
+
+
+    def _compile_mapping(self, mapping_patterns: list) -> tuple:
+        # regexes: ((re.Pattern, 'REPLACEMENT'), ...)
+        return tuple((re.compile(pattern), replacement) for pattern, replacement in mapping_patterns)
 
 
     def _load_conjugation_mapping(self, conjugation_file: str) -> dict:
         # conjugation_mapping: {'CONJUGATED_VERB': 'BASE_VERB', ...}
         conjugation_mapping = {}
+        if not os.path.isfile(conjugation_file):
+            logger.warning(f'Verb conjugation mapping not found, skipping it: {os.path.basename(conjugation_file)}')
+            return conjugation_mapping
         with open(conjugation_file) as f:
             for line in f:
                 if line.startswith('#'):
@@ -192,13 +349,12 @@ class RoleNormalizer:
         return conjugation_mapping
 
 
-    def _load_plural_mapping(self, plural_file: str) -> list:
-        # plural_regexes: [('PATTERN', 'REPLACEMENT'), ...]
-        plural_regexes = []
+    def _read_plural_mapping(self, plural_file: str) -> list:
+        # plural_patterns: [('PATTERN', 'REPLACEMENT'), ...]
+        plural_patterns = []
         add_skip_mark_pattern = r"^(empregada|ingles|frances|leis|americanas|fisica|fisicas|educacaofisica|educadorafisica|instrutorafisica|fabrica|fabricas|bebida|bebidas|vida|vidas)$"
-        add_skip_mark_pattern = re.compile(add_skip_mark_pattern)
         add_skip_mark_replacement = r"\1--"
-        plural_regexes.append((add_skip_mark_pattern, add_skip_mark_replacement))
+        plural_patterns.append((add_skip_mark_pattern, add_skip_mark_replacement))
         with open(plural_file) as f:
             for line in f:
                 if line.startswith('#'):
@@ -208,35 +364,37 @@ class RoleNormalizer:
                     logger.warning(f'Invalid line in {os.path.basename(plural_file)}: {line.strip()}')
                     continue
                 pattern = r"(\D+)({})$".format(tokens[0])
-                pattern = re.compile(pattern)
                 replacement = r"\1{}".format(tokens[1])
-                plural_regexes.append((pattern, replacement))
+                plural_patterns.append((pattern, replacement))
         remove_skip_mark_pattern = r"--"
-        remove_skip_mark_pattern = re.compile(remove_skip_mark_pattern)
         remove_skip_mark_replacement = r""
-        plural_regexes.append((remove_skip_mark_pattern, remove_skip_mark_replacement))
-        return plural_regexes
+        plural_patterns.append((remove_skip_mark_pattern, remove_skip_mark_replacement))
+        return plural_patterns
+
 
+    def _stopwords(self, gazetteers: dict) -> frozenset:
+        return frozenset(gazetteers['stopwords']) - self.stop_words_to_keep | self.additional_stop_words
 
-    def _load_locations(self, locations_file: str, role_titles: list) -> list:
+
+    def _load_locations(self, locations_file: str, role_titles: list, stopwords: frozenset) -> list:
         # TODO: Don't include words that appear in normalized role titles
         # TODO: Don't include words that appear in the thesaurus
         # TODO: Don't include words that appear in the gender inflection list
         # TODO: Troublesome words present in location names: condominio, lider, quimica, and possibly many others
         # location_words: ['WORD', ...]
-        location_words = self._extract_words_from_mapping(locations_file)
+        location_words = self._extract_words_from_mapping(locations_file, stopwords)
         # Don't include location words that are present in role tittles
         role_words = []
         separators = [
             re.escape(separator)
             for separator in list(set(
-                [' '] + self.space_characters + [char for char in self.special_characters]
+                [' '] + list(self.space_characters) + [char for char in self.special_characters]
             ))
         ]
         for role_title in role_titles:
             for word in re.split('|'.join(separators), role_title):
                 word = word.strip().lower()
-                if word and len(word) >= 2 and word not in self.stopwords:
+                if word and len(word) >= 2 and word not in stopwords:
                     role_words.append(word)
         location_words = list(set(location_words) - set(role_words))
         return location_words
@@ -273,27 +431,33 @@ class RoleNormalizer:
 
 
     def _extract_and_add_to_dictioary(self, phrases: list) -> None:
+        self._add_to_dictionary(self._extract_words(phrases))
+
+
+    def _extract_words(self, phrases: list) -> dict:
         # Extract words and their frequency from phrases received, skipping stop words
-        words = set()
         # words_freq_dict: {'WORD': FREQUENCY, ...]
         words_freq_dict = {}
         separators = [
             re.escape(separator)
             for separator in list(set(
-                [' '] + self.space_characters + [char for char in self.special_characters]
+                [' '] + list(self.space_characters) + [char for char in self.special_characters]
             ))
         ]
         for phrase in phrases:
             for word in re.split('|'.join(separators), phrase):
                 word = word.strip().lower()
                 if word and len(word) >= 2 and word not in self.stopwords:
-                    words.add(word)
                     words_freq_dict[word] = words_freq_dict.get(word, 0) + 1
+        return words_freq_dict
+
+
+    def _add_to_dictionary(self, words_freq_dict: dict) -> None:
         # words_freq: [('WORD', FREQUENCY), ...], sorted by FREQUENCY
         words_freq = sorted(words_freq_dict.items(), key=lambda kv: kv[1], reverse=True)
 
         # Add extracted words to dictionary
-        self.dictionary = self.dictionary | words
+        self.dictionary = self.dictionary | set(words_freq_dict)
 
         # Load words and their frequency into spell checker
         # If a word already exists in the spell checker's dictionary, it's frequency is updated not replaced
@@ -311,7 +475,7 @@ class RoleNormalizer:
         logger.info(f'Spell checker updated with {len(words_freq)} words: {len(self.spell_checker.words)} words')
 
 
-    def _extract_words_from_mapping(self, mapping_file: str) -> list:
+    def _extract_words_from_mapping(self, mapping_file: str, stopwords: frozenset) -> list:
         # mapping_words: {'WORD', ...}
         mapping_words = set()
         with open(mapping_file) as f:
@@ -322,13 +486,14 @@ class RoleNormalizer:
                 for token in tokens:
                     words = token.split()
                     mapping_words.update(words)
-        return list(mapping_words - self.stopwords)
+        return list(mapping_words - stopwords)
 
 
     @lru_hash_mutable
-    @lru_cache(maxsize=8192)
+    @method_cache(maxsize=8192)
     def normalize(self, role_title: str,
                         correct_typos: bool = True,
+                        max_edit_distance: int = 2,
                         stemming: bool = False,
                         remove_locations: bool = False,
                         normalize_conjugation: bool = True,
@@ -344,6 +509,7 @@ class RoleNormalizer:
         Parameters:
         - role_title                        : str  : Role title to be normalized
         - correct_typos                     : bool : Correct typos, default is True
+        - max_edit_distance                 : int  : Max edit distance of typo corrections, either 1 or 2, default is 2
         - stemming                          : bool : Stem words, default is False
         - remove_locations                  : bool : Remove location words, default is False
         - normalize_conjugation             : bool : Normalize verb conjugation, default is True
@@ -357,6 +523,34 @@ class RoleNormalizer:
         - [str, ...] : Extracted seniorities, if any
         - [str, ...] : Extracted hierarchies, if any
         """
+        return self._normalize(
+            role_title,
+            correct_typos,
+            max_edit_distance,
+            stemming,
+            remove_locations,
+            normalize_conjugation,
+            normalize_plural,
+            normalize_gender,
+            normalize_thesaurus,
+            normalize_special_character_terms)
+
+
+    def _normalize(self, role_title: str,
+                         correct_typos: bool = True,
+                         max_edit_distance: int = 2,
+                         stemming: bool = False,
+                         remove_locations: bool = False,
+                         normalize_conjugation: bool = True,
+                         normalize_plural: bool = True,
+                         normalize_gender: bool = True,
+                         normalize_thesaurus: bool = True,
+                         normalize_special_character_terms = True,
+                         stage_timer: StageTimer = None) -> tuple[str, list, list]:
+        """
+        Uncached normalize(), see it. If a stage timer is received, the time spent in each stage
+        of the normalization and the number of spell checker lookups are added to it.
+        """
 
         if not role_title or not isinstance(role_title, str):
             logger.warning(f'Invalid role title - empty or not a string: {role_title}')
@@ -371,11 +565,15 @@ class RoleNormalizer:
         # Remove line breaks
         norm_role_title = self._transform_text(norm_role_title, self.line_break_characters, " ")
         logger.trace(f"normalize(): line breaks replaced: {norm_role_title}")
+        if stage_timer is not None:
+            stage_timer.lap('fold')
 
         # Normalize terms containing special characters
         if normalize_special_character_terms:
             norm_role_title = self._normalize_by_mapping(norm_role_title, self.special_character_regexes)
             logger.trace(f"normalize(): normalized terms containing special characters: {norm_role_title}")
+            if stage_timer is not None:
+                stage_timer.lap('special_character_mapping')
 
         # Replace space symbols
         norm_role_title = self._transform_text(norm_role_title, self.space_characters, " ")
@@ -386,11 +584,15 @@ class RoleNormalizer:
         # Remove special symbols
         norm_role_title = self._transform_text(norm_role_title, list(self.special_characters), "")
         logger.trace(f"normalize(): special symbols removed: {norm_role_title}")
+        if stage_timer is not None:
+            stage_timer.lap('fold')
 
         # Correct typos
         if correct_typos:
-            norm_role_title = self._correct_typos(norm_role_title)
+            norm_role_title = self._correct_typos(norm_role_title, max_edit_distance, stage_timer)
             logger.trace(f"normalize(): typos corrected: {norm_role_title}")
+            if stage_timer is not None:
+                stage_timer.lap('typo_correction')
 
         # Remove stop words
         norm_role_title = ' '.join([
@@ -399,11 +601,15 @@ class RoleNormalizer:
             if token not in self.stopwords
         ])
         logger.trace(f"normalize(): stop words removed: {norm_role_title}")
+        if stage_timer is not None:
+            stage_timer.lap('stopwords')
 
         # Remove Accents
         norm_role_title = unicodedata.normalize('NFKD', norm_role_title).encode("ASCII", "ignore")
         norm_role_title = self._fix_encoding(norm_role_title)
         logger.trace(f"normalize(): accents removed: {norm_role_title}")
+        if stage_timer is not None:
+            stage_timer.lap('fold')
 
         # Get seniorities and hierarchies
         seniorities = []
@@ -413,6 +619,8 @@ class RoleNormalizer:
                 seniorities.append(token)
             if token in self.hierarchies:
                 hierarchies.append(token)
+        if stage_timer is not None:
+            stage_timer.lap('seniorities')
 
         # Remove location words
         if remove_locations:
@@ -422,11 +630,15 @@ class RoleNormalizer:
                 if not self._in_sorted_list(token, self.sorted_locations)
             ])
             logger.trace(f"normalize(): locations removed: {norm_role_title}")
+            if stage_timer is not None:
+                stage_timer.lap('locations')
 
         # Normalize verb conjugation, plural, gender and synonyms
         if normalize_conjugation:
             norm_role_title = self._normalize_by_replace(norm_role_title, self.conjugation_mapping)
             logger.trace(f"normalize(): normalized verb conjugation: {norm_role_title}")
+            if stage_timer is not None:
+                stage_timer.lap('conjugation_mapping')
 
         if normalize_plural:
             norm_role_title = ' '.join([
@@ -434,14 +646,20 @@ class RoleNormalizer:
                 for token in norm_role_title.split()
             ]).strip()
             logger.trace(f"normalize(): normalized plural inflection: {norm_role_title}")
+            if stage_timer is not None:
+                stage_timer.lap('plural_mapping')
 
         if normalize_gender:
             norm_role_title = self._normalize_by_mapping(norm_role_title, self.gender_regexes)
             logger.trace(f"normalize(): normalized gender inflection: {norm_role_title}")
+            if stage_timer is not None:
+                stage_timer.lap('gender_mapping')
 
         if normalize_thesaurus:
             norm_role_title = self._normalize_by_mapping(norm_role_title, self.thesaurus_regexes)
             logger.trace(f"normalize(): normalized based on thesaurus: {norm_role_title}")
+            if stage_timer is not None:
+                stage_timer.lap('thesaurus_mapping')
 
         # Stemming
         if stemming:
@@ -450,11 +668,13 @@ class RoleNormalizer:
                 for token in norm_role_title.split()
             ]).strip()
             logger.trace(f"normalize(): stemming applied: {norm_role_title}")
+            if stage_timer is not None:
+                stage_timer.lap('stemming')
 
         return norm_role_title, seniorities, hierarchies
 
 
-    def _correct_typos(self, text: str) -> str:
+    def _correct_typos(self, text: str, max_edit_distance: int = 2, stage_timer: StageTimer = None) -> str:
 
         text_words = text.split()
         logger.trace(f'_correct_typos(): text split: {text_words}')
@@ -466,7 +686,9 @@ class RoleNormalizer:
             # Skip if word is present in the dictionary
             if word not in self.dictionary:
                 # Get the most likely correction - smallest edit distance and highest term frequency
-                correction = self.spell_checker.lookup(word, Verbosity.TOP, max_edit_distance=2)
+                correction = self.spell_checker.lookup(word, Verbosity.TOP, max_edit_distance=max_edit_distance)
+                if stage_timer is not None:
+                    stage_timer.count('symspell_lookups')
                 corrected_word = correction[0].term if correction else word
                 logger.trace(f'_correct_typos(): spell correction, if any: {word} > {corrected_word}')
             corrected_text += corrected_word
@@ -0,0 +1,47 @@
+import time
+
+
+class StageTimer:
+
+    """
+    Elapsed time of each stage, and counters, of a single role normalization - used to profile
+    requests in debug mode. Not thread safe, create one per role.
+    """
+
+    def __init__(self) -> None:
+        # Elapsed times in seconds, in the order stages were first timed: {'STAGE': seconds, ...}
+        self.stages = {}
+        self.counters = {}
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+
+    def lap(self, stage: str) -> None:
+        """
+        Add the time elapsed since the previous lap, or since the timer was created, to a stage.
+
+        Parameters:
+        - stage : str : Stage name
+        """
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last_time
+        self.last_time = now
+
+    def count(self, counter: str, value: int = 1) -> None:
+        """
+        Add a value to a counter.
+
+        Parameters:
+        - counter : str : Counter name
+        - value   : int : Value added
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def report(self) -> dict:
+        """
+        Return total and per stage elapsed times, in milliseconds, and counters.
+        """
+        return {
+            'total_ms': round((self.last_time - self.start_time) * 1000, 3),
+            'stages_ms': {stage: round(elapsed * 1000, 3) for stage, elapsed in self.stages.items()},
+            'counters': dict(self.counters),
+        }
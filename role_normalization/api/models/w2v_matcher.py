@@ -8,6 +8,7 @@ from gensim.models import KeyedVectors
 from itertools import combinations
 
 from role_normalization import settings
+from role_normalization.api.models.stage_timer import StageTimer
 
 
 logger = logbook.Logger(__name__)
@@ -17,87 +18,48 @@ settings.logger_group.add_logger(logger)
 class W2vMatcher(object):
 
     """
-    Match a given role to a database role using a Word2Vec model.
+    Match a given role to a database role using a Word2Vec model. Models are read-only
+    after initialization, so an instance can be shared by many threads.
     """
 
     words_idf: dict = None
     words_w2v_model: KeyedVectors = None
     titles_w2v_model: KeyedVectors = None
-    set_words_idf: set = None
-    set_words_w2v_model: set = None
+    set_words_idf: frozenset = None
+    set_words_w2v_model: frozenset = None
 
-    def __init__(self, norm_main_roles : dict, norm_similar_roles : dict):
+    def __init__(self, norm_main_roles : dict, norm_similar_roles : dict, embeddings: dict = None):
         """
         Load the Word2Vec words' model and IDF weights, both used to calculate
         embeddings. Also, create a Word2Vec roles' model with all database roles.
+        If embeddings are received, read from a model bundle for example, models
+        and IDF weights are taken from them instead.
         """
 
         try:
 
             logger.info('Initializing W2vMatcher instance')
 
-            # Load IDF weights dict
-            words_idf_file_path = os.path.dirname(os.path.realpath(__file__)) + '/w2v/role_words_idf.pickle.gz'
-            with gzip.open(words_idf_file_path, 'rb') as pickle_file:
-                self.words_idf = pickle.load(pickle_file)
-            self.words_idf = self.words_idf or {}
-
-            logger.info(f"Role title words' IDF loaded - {len(self.words_idf)} words")
-
-            # Load Word2Vec labels list, created using role title words
-            words_w2v_labels_file_path = os.path.dirname(os.path.realpath(__file__)) + '/w2v/role_words_w2v_labels_30d.pickle.gz'
-            with gzip.open(words_w2v_labels_file_path, 'rb') as pickle_file:
-                words_w2v_labels = pickle.load(pickle_file)
-
-            # Load Word2Vec embeddings numpy array, created using role title words
-            words_w2v_embeddings_file_path = os.path.dirname(os.path.realpath(__file__)) + '/w2v/role_words_w2v_embeddings_30d.pickle.gz'
-            with gzip.open(words_w2v_embeddings_file_path, 'rb') as pickle_file:
-                words_w2v_embeddings = pickle.load(pickle_file)
-
-            # Create Word2Vec words' model
-            words_w2v_dimensions = words_w2v_embeddings.shape[1]
-            self.words_w2v_model = KeyedVectors(words_w2v_dimensions)
-            self.words_w2v_model.add_vectors(words_w2v_labels, words_w2v_embeddings)
-
-            logger.info(f"Role title words' Word2Vec model loaded"
-                f' - {len(self.words_w2v_model.vectors)} role vectors'
-                f' with {self.words_w2v_model.vector_size} dimensions'
-            )
-
-            # Create sets to make it easier to check if a given word is
-            # present in IDF and in Word2Vec words' model
-            self.set_words_idf = set([
-                word
-                for word in self.words_idf
-            ])
-            self.set_words_w2v_model = set([
-                word
-                for word in self.words_w2v_model.index_to_key
-            ])
-
-            logger.info(f'Sets with Word2Vec and IDF words populated')
-
-            # Add all database roles, main and similar, to a Word2Vec titles' model
-            # Used to find the most similar role to the one received
-            logger.info(f"Creating role titles' Word2Vec model...")
-            self.titles_w2v_model = KeyedVectors(words_w2v_dimensions)
-            for i, norm_role in enumerate(norm_main_roles):
-                embedding, _ = self._calculate_embedding(norm_role)
-                if embedding is not None:
-                    self.titles_w2v_model.add_vectors(norm_role, embedding)
-                if i % 100 == 0:
-                    logger.debug(f'Added {i}/{len(norm_main_roles)} main roles')
-            for i, norm_role in enumerate(norm_similar_roles):
-                embedding, _ = self._calculate_embedding(norm_role)
-                if embedding is not None:
-                    self.titles_w2v_model.add_vectors(norm_role, embedding)
-                if i % 100 == 0:
-                    logger.debug(f'Added {i}/{len(norm_similar_roles)} similar roles')
-
-            logger.info(f"Role titles' Word2Vec model created"
-                f' - {len(self.titles_w2v_model.vectors)} role vectors'
-                f' with {self.titles_w2v_model.vector_size} dimensions'
-            )
+            if embeddings:
+
+                self.words_idf = embeddings['words_idf']
+                self.words_w2v_model = embeddings['words_w2v_model']
+                self.titles_w2v_model = embeddings['titles_w2v_model']
+                self.set_words_idf = frozenset(self.words_idf)
+                self.set_words_w2v_model = frozenset(self.words_w2v_model.index_to_key)
+
+                logger.info(f"Word2Vec models and IDF loaded from model bundle"
+                    f' - {len(self.words_w2v_model.vectors)} word vectors'
+                    f' and {len(self.titles_w2v_model.vectors)} role vectors'
+                )
+
+            else:
+
+                self._create_models(norm_main_roles, norm_similar_roles)
+
+            # Vector norms are otherwise computed lazily, by the first similarity search - compute
+            # them now, so models are only read while matching, even by concurrent threads
+            self.titles_w2v_model.fill_norms()
 
             self.w2v_min_role_similarity = settings.w2v_min_role_similarity
             logger.info(f'Min Word2Vec role similarity: {self.w2v_min_role_similarity}')
@@ -115,6 +77,86 @@ class W2vMatcher(object):
             logger.exception(f'Exception initializing W2vMatcher: {e}')
             raise e
 
+    def _create_models(self, norm_main_roles : dict, norm_similar_roles : dict) -> None:
+        """
+        Load Word2Vec words' model and IDF weights from files and create the Word2Vec roles' model.
+        """
+
+        # Load IDF weights dict
+        words_idf_file_path = os.path.dirname(os.path.realpath(__file__)) + '/w2v/role_words_idf.pickle.gz'
+        with gzip.open(words_idf_file_path, 'rb') as pickle_file:
+            self.words_idf = pickle.load(pickle_file)
+        self.words_idf = self.words_idf or {}
+
+        logger.info(f"Role title words' IDF loaded - {len(self.words_idf)} words")
+
+        # Load Word2Vec labels list, created using role title words
+        words_w2v_labels_file_path = os.path.dirname(os.path.realpath(__file__)) + '/w2v/role_words_w2v_labels_30d.pickle.gz'
+        with gzip.open(words_w2v_labels_file_path, 'rb') as pickle_file:
+            words_w2v_labels = pickle.load(pickle_file)
+
+        # Load Word2Vec embeddings numpy array, created using role title words
+        words_w2v_embeddings_file_path = os.path.dirname(os.path.realpath(__file__)) + '/w2v/role_words_w2v_embeddings_30d.pickle.gz'
+        with gzip.open(words_w2v_embeddings_file_path, 'rb') as pickle_file:
+            words_w2v_embeddings = pickle.load(pickle_file)
+
+        # Create Word2Vec words' model
+        words_w2v_dimensions = words_w2v_embeddings.shape[1]
+        self.words_w2v_model = KeyedVectors(words_w2v_dimensions)
+        self.words_w2v_model.add_vectors(words_w2v_labels, words_w2v_embeddings)
+
+        logger.info(f"Role title words' Word2Vec model loaded"
+            f' - {len(self.words_w2v_model.vectors)} role vectors'
+            f' with {self.words_w2v_model.vector_size} dimensions'
+        )
+
+        # Create sets to make it easier to check if a given word is
+        # present in IDF and in Word2Vec words' model
+        self.set_words_idf = frozenset([
+            word
+            for word in self.words_idf
+        ])
+        self.set_words_w2v_model = frozenset([
+            word
+            for word in self.words_w2v_model.index_to_key
+        ])
+
+        logger.info(f'Sets with Word2Vec and IDF words populated')
+
+        # Add all database roles, main and similar, to a Word2Vec titles' model
+        # Used to find the most similar role to the one received
+        logger.info(f"Creating role titles' Word2Vec model...")
+        self.titles_w2v_model = KeyedVectors(words_w2v_dimensions)
+        for i, norm_role in enumerate(norm_main_roles):
+            embedding, _ = self._calculate_embedding(norm_role)
+            if embedding is not None:
+                self.titles_w2v_model.add_vectors(norm_role, embedding)
+            if i % 100 == 0:
+                logger.debug(f'Added {i}/{len(norm_main_roles)} main roles')
+        for i, norm_role in enumerate(norm_similar_roles):
+            embedding, _ = self._calculate_embedding(norm_role)
+            if embedding is not None:
+                self.titles_w2v_model.add_vectors(norm_role, embedding)
+            if i % 100 == 0:
+                logger.debug(f'Added {i}/{len(norm_similar_roles)} similar roles')
+
+        logger.info(f"Role titles' Word2Vec model created"
+            f' - {len(self.titles_w2v_model.vectors)} role vectors'
+            f' with {self.titles_w2v_model.vector_size} dimensions'
+        )
+
+
+    def model_parts(self) -> dict:
+        """
+        Return Word2Vec models and IDF weights, to be stored in a model bundle.
+        """
+        return {
+            'words_idf': self.words_idf,
+            'words_w2v_model': self.words_w2v_model,
+            'titles_w2v_model': self.titles_w2v_model,
+        }
+
+
     def _calculate_embedding(self, norm_title: str) -> list:
         """
         Given a role title, calculate and return it's embedding: sum of it's words'
@@ -187,10 +229,11 @@ class W2vMatcher(object):
         return not norm_title_words.isdisjoint(self.w2v_starting_role_words)
 
 
-    def match(self, norm_title: str) -> str:
+    def match(self, norm_title: str, stage_timer: StageTimer = None) -> str:
         """
         Try to match a normalized role with database roles, using a Word2Vec model.
-        Returns the most similar database normalized role title or None.
+        Returns the most similar database normalized role title or None. If a stage
+        timer is received, the number of similarity searches is added to it.
         """
         matched_role_title = None
         highest_similarity = 0
@@ -243,6 +286,8 @@ class W2vMatcher(object):
 
             # Find closest match in Word2Vec role titles model
             matches = self.titles_w2v_model.similar_by_vector(embedding, topn=5)
+            if stage_timer is not None:
+                stage_timer.count('w2v_similarity_calls')
             for match_title, match_similarity in matches:
                 logger.debug(f'Role title word sequence: {norm_title_combination}')
                 logger.debug(f'Match found: {match_title}')
@@ -0,0 +1,159 @@
+import logbook
+import threading
+import time
+from contextlib import contextmanager
+
+from role_normalization import settings
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class LaneFullError(Exception):
+
+    """
+    Raised when a request can't be admitted to its lane - too many requests waiting, or waiting
+    too long, or a higher priority lane is waiting.
+    """
+
+
+class RequestLane:
+
+    """
+    Bounded number of concurrent normalization requests of one kind of traffic, within a worker
+    process, with a bounded queue of requests waiting for a slot. Thread safe.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queued: int, max_wait: float, priority: int) -> None:
+        """
+        Parameters:
+        - name            : str   : Lane name
+        - max_concurrency : int   : Max requests being normalized at once
+        - max_queued      : int   : Max requests waiting for a slot, others are refused
+        - max_wait        : float : Max time, in seconds, a request waits for a slot before being refused
+        - priority        : int   : Lane priority, lower is higher - lanes are refused new requests while
+                                    a higher priority lane has requests waiting
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.priority = priority
+
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    @contextmanager
+    def admit(self, higher_priority_lanes: list = ()):
+        """
+        Wait for a slot in this lane and hold it while the context is active.
+
+        Parameters:
+        - higher_priority_lanes : list : Lanes whose waiting requests make this one refuse new requests
+
+        Raises:
+        - LaneFullError : Request not admitted
+        """
+        with self.lock:
+            if self.queued >= self.max_queued or any(lane.queued for lane in higher_priority_lanes):
+                self.rejected += 1
+                raise LaneFullError(f'Lane {self.name} is full: {self.active} active and {self.queued} queued requests')
+            self.queued += 1
+
+        start_time = time.perf_counter()
+        acquired = self.slots.acquire(timeout=self.max_wait)
+        wait_time = time.perf_counter() - start_time
+
+        with self.lock:
+            self.queued -= 1
+            if not acquired:
+                self.rejected += 1
+                raise LaneFullError(f'Lane {self.name} is full: waited {wait_time:.3f} s for a slot')
+            self.active += 1
+            self.admitted += 1
+            self.total_wait += wait_time
+            self.max_wait_seen = max(self.max_wait_seen, wait_time)
+
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.active -= 1
+            self.slots.release()
+
+    def stats(self) -> dict:
+        """
+        Return this lane's limits, queue depth and wait times since the worker started.
+        """
+        with self.lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'max_queued': self.max_queued,
+                'active': self.active,
+                'queued': self.queued,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'mean_wait_ms': round(self.total_wait / self.admitted * 1000, 3) if self.admitted else 0.0,
+                'max_wait_ms': round(self.max_wait_seen * 1000, 3),
+            }
+
+
+class RequestLanes:
+
+    """
+    Separate lanes for interactive and batch normalization requests, see settings.request_lanes, so
+    batch routines sending large requests don't hold every thread of a worker. Batch requests are
+    refused first under load: while interactive requests are waiting for a slot.
+    """
+
+    def __init__(self, lanes_settings: dict = None, batch_origins: tuple = None) -> None:
+        """
+        Parameters:
+        - lanes_settings : dict  : {'LANE': {RequestLane parameters}, ...}, defaults to settings.request_lanes
+        - batch_origins  : tuple : Request origins sent to the batch lane, defaults to settings.request_lane_batch_origins
+        """
+        lanes_settings = lanes_settings or settings.request_lanes
+        self.batch_origins = frozenset(batch_origins or settings.request_lane_batch_origins)
+        self.lanes = {
+            name: RequestLane(name, **lane_settings)
+            for name, lane_settings in lanes_settings.items()
+        }
+
+    def lane(self, lane_name: str = None, origin: str = None) -> RequestLane:
+        """
+        Return the lane of a request: the one it asked for, if any, or the one of its origin.
+
+        Parameters:
+        - lane_name : str : Lane requested, in the settings.request_lane_header header
+        - origin    : str : Request origin, sent in the request payload
+
+        Returns:
+        - RequestLane : Request lane
+        """
+        if lane_name in self.lanes:
+            return self.lanes[lane_name]
+        if origin in self.batch_origins:
+            return self.lanes['batch']
+        return self.lanes['interactive']
+
+    @contextmanager
+    def admit(self, lane: RequestLane):
+        """
+        Hold a slot of a lane while the context is active, see RequestLane.admit().
+        """
+        higher_priority_lanes = [other for other in self.lanes.values() if other.priority < lane.priority]
+        with lane.admit(higher_priority_lanes):
+            yield lane
+
+    def stats(self) -> dict:
+        """
+        Return the stats of every lane: {'LANE': {...}, ...}
+        """
+        return {name: lane.stats() for name, lane in self.lanes.items()}
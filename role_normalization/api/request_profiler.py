@@ -0,0 +1,89 @@
+import falcon
+import hmac
+import json
+import logbook
+import uuid
+from collections import OrderedDict
+
+from role_normalization import settings
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+
+class RequestProfiler:
+
+    """
+    Debug mode of normalization requests: requests with the settings.profile_header header, set to
+    the API debug token, are normalized bypassing caches, timing each stage of the normalization
+    of each role - see RoleMatcher.profile_normalize_and_match(). Requests without the header are
+    normalized as usual.
+
+    Profiles are logged under an ID, returned in the X-Profile-Id response header, and also returned
+    in the X-Profile response header if small enough.
+    """
+
+    def __init__(self) -> None:
+        # Read from the secrets the first time a request asks to be profiled
+        self.debug_token = None
+
+    def requested(self, req) -> bool:
+        """
+        Return True if a request asks to be profiled.
+
+        Parameters:
+        - req : falcon.Request : Received request
+
+        Raises:
+        - falcon.HTTPForbidden : Request asks to be profiled, with an invalid debug token
+        """
+        token = req.get_header(settings.profile_header)
+        if token is None:
+            return False
+        if not self._token_is_valid(token):
+            raise falcon.HTTPForbidden(
+                title='Forbidden',
+                description='Invalid debug token')
+        return True
+
+    def _token_is_valid(self, token: str) -> bool:
+        if self.debug_token is None:
+            try:
+                self.debug_token = settings.role_norm_api_debug_token() or ''
+            except Exception:
+                logger.warning('Debug token unavailable, requests won\'t be profiled')
+                self.debug_token = ''
+        return bool(self.debug_token) and hmac.compare_digest(token.encode('utf-8'), self.debug_token.encode('utf-8'))
+
+    def report(self, resp, title_roles: OrderedDict, matches: dict, role_profiles: dict) -> dict:
+        """
+        Log the profile of a request and return it in response headers.
+
+        Parameters:
+        - resp          : falcon.Response : Response to be returned
+        - title_roles   : OrderedDict     : Received role titles mapped to their single roles
+        - matches       : dict            : Single roles mapped to normalize_and_match() results
+        - role_profiles : dict            : Single roles mapped to their StageTimer reports - roles not
+                                            normalized, as the latency budget was used up, are missing
+
+        Returns:
+        - dict : Request profile
+        """
+        titles_profile = {}
+        for role_title, roles in title_roles.items():
+            roles_profile = {
+                role: dict(role_profiles.get(role, {'total_ms': 0.0}), match_type=matches[role][2])
+                for role in roles
+            }
+            titles_profile[role_title] = {
+                'total_ms': round(sum(role_profile['total_ms'] for role_profile in roles_profile.values()), 3),
+                'roles': roles_profile,
+            }
+        profile = {'profile_id': uuid.uuid4().hex, 'titles': titles_profile}
+        encoded_profile = json.dumps(profile, separators=(',', ':'))
+        logger.notice(f'Request profile: {encoded_profile}')
+        resp.set_header('X-Profile-Id', profile['profile_id'])
+        if len(encoded_profile) <= settings.profile_response_header_max_size:
+            resp.set_header('X-Profile', encoded_profile)
+        return profile
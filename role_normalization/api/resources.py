@@ -0,0 +1,128 @@
+import falcon
+import basicauth
+import os
+
+from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.component_loader import component_loader
+from role_normalization.api.media import msgpack_handler, msgpack_media_types
+
+
+"""
+Middleware and meta endpoints shared by the WSGI API (api.py) and the ASGI API (asgi_api.py).
+Importing this module neither creates an app nor loads models.
+"""
+
+
+spec = settings.spec
+
+
+class AuthMiddleware:
+
+    auth_user = settings.role_norm_api_user()
+    auth_password = settings.role_norm_api_password()
+
+    def process_request(self, req, resp):
+
+        if req.relative_uri == '/healthcheck' or \
+                req.relative_uri == '/readiness' or \
+                req.relative_uri == '/buildinfo' or \
+                req.relative_uri == '/metrics' or \
+                req.relative_uri.startswith('/v1/role_normalization/catho/doc/'):
+            return
+
+        auth = req.get_header('Authorization')
+
+        if not auth:
+            raise falcon.HTTPUnauthorized(
+                title='Unauthorized',
+                description='Missing authorization header')
+
+        if not self._auth_is_valid(auth):
+            raise falcon.HTTPUnauthorized(
+                title='Unauthorized',
+                description='Invalid authorization header')
+
+    def _auth_is_valid(self, auth):
+        try:
+
+            username, password = basicauth.decode(auth)
+            if username == self.auth_user and password == self.auth_password:
+                return True
+
+        except:
+            pass
+
+        return False
+
+
+class RequireJSON:
+
+    # Newline delimited JSON, used by the bulk endpoint
+    ndjson_media_type = 'application/x-ndjson'
+
+    # Also accepted, if msgpack is installed - see media.py
+    msgpack_media_types = msgpack_media_types if msgpack_handler is not None else ()
+
+    def process_request(self, req, resp):
+        if not req.client_accepts_json and not req.client_accepts(self.ndjson_media_type) and \
+                not any(req.client_accepts(media_type) for media_type in self.msgpack_media_types):
+            raise falcon.HTTPNotAcceptable(
+                description='Responses encoded as JSON not accepted by client')
+
+        if req.method in ('POST', 'PUT'):
+            if 'application/json' not in req.content_type and self.ndjson_media_type not in req.content_type and \
+                    not any(media_type in req.content_type for media_type in self.msgpack_media_types):
+                raise falcon.HTTPUnsupportedMediaType(
+                    title='Request not encoded as JSON')
+
+
+class HealthCheck:
+
+    @spec.validate(tags=['meta'])
+    def on_get(self, req, resp):
+        """
+        Health check endpoint, used to check if the API is running and can be reached - answered
+        with 503 if models failed to load in the background.
+        """
+        failed_components = component_loader.failed()
+        if failed_components:
+            resp.media = {'status': 'ERROR', 'description': f'Failed loading: {", ".join(failed_components)}'}
+            resp.status = falcon.HTTP_503
+            return
+        resp.text = '{"status": "OK", "description": "Role Normalization API available"}'
+        resp.status = falcon.HTTP_200
+
+
+class BuildInfo:
+
+    @spec.validate(tags=['meta'])
+    def on_get(self, req, resp):
+        """
+        API info endpoint - returns build version, Git commit ID, etc.
+        """
+        infopath = '/seek/build_info.json'
+        if os.path.isfile(infopath) and os.access(infopath, os.R_OK):
+            try:
+                file = open(infopath)
+                resp.text = file.read()
+                file.close()
+            except:
+                resp.text = '{"status": "ERROR", "description": "Error reading build_info.json file"}'
+                resp.status = falcon.HTTP_500
+            else:
+                resp.status = falcon.HTTP_200
+        else:
+            resp.text = '{"status": "Unknown", "description": "build_info.json file unavailable"}'
+            resp.status = falcon.HTTP_200
+
+
+class Metrics:
+
+    @spec.validate(tags=['meta'])
+    def on_get(self, req, resp):
+        """
+        Metrics endpoint - returns metrics of every worker process, in Prometheus text format.
+        """
+        resp.data, resp.content_type = metrics.render()
+        resp.status = falcon.HTTP_200
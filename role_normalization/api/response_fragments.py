@@ -0,0 +1,112 @@
+import falcon
+
+from role_normalization import settings
+from role_normalization.api.media import json_handler
+
+
+def normalized_role_object(norm_role, perfil_ids_filter: list = None) -> dict:
+    """
+    Build the part of a normalized role response object that depends only on the database role
+    matched and on the perfil IDs filter - everything but the match type, see NormalizedRoleTitle.
+
+    Parameters:
+    - norm_role         : ProcessedRole : Database role matched
+    - perfil_ids_filter : list          : Perfil IDs filter, if any
+
+    Returns:
+    - dict : Normalized role response object, without match type
+    """
+    norm_role_obj = {
+        'normalized_role': norm_role.title,
+        'role_id': norm_role.role_id,
+        'seniority': norm_role.seniorities,
+        'hierarchy': norm_role.hierarchies,
+        'areap_ids': norm_role.areap_ids,
+        'nivelh_ids': norm_role.nivelh_ids
+    }
+    if perfil_ids_filter:
+        norm_role_obj['perfil_ids'] = norm_role.perfil_ids
+    return norm_role_obj
+
+
+class ResponseFragments:
+
+    """
+    Encoded JSON of normalized roles, cached per database role and perfil IDs filter, so responses
+    are assembled by concatenating bytes instead of building and serializing objects.
+    """
+
+    def __init__(self, max_size: int = None) -> None:
+        """
+        Parameters:
+        - max_size : int : Max encoded roles kept, defaults to settings.response_fragments_max_size
+        """
+        self.max_size = max_size or settings.response_fragments_max_size
+        # Encoded roles, without their closing brace: {(ROLE_ID, 'TITLE', (PERFIL_ID, ...)): b'{...', ...}
+        # Catalog roles are finite, so once full new roles are encoded but not cached - dict reads and
+        # writes are atomic, so no lock is needed when used by many threads
+        self.roles = {}
+        # Encoded match types: {'MATCH_TYPE': b',"match_type":"MATCH_TYPE"}', ...}
+        self.match_types = {}
+        # Cache lookups, for metrics - approximate, as increments aren't atomic
+        self.hits = 0
+        self.misses = 0
+
+    def role(self, norm_role, match_type: str, include_match_type: bool, perfil_ids_filter: list) -> bytes:
+        """
+        Return a normalized role response object encoded as JSON.
+
+        Parameters:
+        - norm_role          : ProcessedRole : Database role matched
+        - match_type         : str           : Match type
+        - include_match_type : bool          : Include the match type
+        - perfil_ids_filter  : list          : Perfil IDs filter, if any
+
+        Returns:
+        - bytes : Encoded normalized role
+        """
+        key = (norm_role.role_id, norm_role.title, tuple(perfil_ids_filter) if perfil_ids_filter else ())
+        role_fragment = self.roles.get(key)
+        if role_fragment is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            role_fragment = self.encode(normalized_role_object(norm_role, perfil_ids_filter))[:-1]
+            if len(self.roles) < self.max_size:
+                self.roles[key] = role_fragment
+        if not include_match_type:
+            return role_fragment + b'}'
+        match_type_fragment = self.match_types.get(match_type)
+        if match_type_fragment is None:
+            match_type_fragment = self.match_types[match_type] = b',"match_type":' + self.encode(match_type) + b'}'
+        return role_fragment + match_type_fragment
+
+    def invalidate(self, role_ids: set) -> None:
+        """
+        Remove encoded roles of database roles that changed, as models were reloaded.
+
+        Parameters:
+        - role_ids : set : Role IDs of changed roles
+        """
+        for key in list(self.roles):
+            if key[0] in role_ids:
+                self.roles.pop(key, None)
+
+    def object(self, fragments: dict) -> bytes:
+        """
+        Encode an object whose values are lists of encoded normalized roles.
+
+        Parameters:
+        - fragments : dict : {'KEY': [b'{...}', ...], ...}
+
+        Returns:
+        - bytes : Encoded object
+        """
+        return b'{' + b','.join(
+            self.encode(key) + b':[' + b','.join(values) + b']'
+            for key, values in fragments.items()
+        ) + b'}'
+
+    @staticmethod
+    def encode(value: any) -> bytes:
+        return json_handler.serialize(value, falcon.MEDIA_JSON)
@@ -1,13 +1,22 @@
 import falcon
 import logbook
+import random
 import re2 as re
+import time
 from collections import OrderedDict
 from pydantic import BaseModel, Field, validator
 from spectree import Response
 from typing import List, Dict
 
 from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.component_loader import Component, component_loader
+from role_normalization.api.latency_budget import LatencyBudget
+from role_normalization.api.media import msgpack_handler, response_media_type
 from role_normalization.api.models.role_matcher import RoleMatcher
+from role_normalization.api.request_lanes import LaneFullError, RequestLanes
+from role_normalization.api.request_profiler import RequestProfiler
+from role_normalization.api.response_fragments import ResponseFragments, normalized_role_object
 
 
 logger = logbook.Logger(__name__)
@@ -33,6 +42,25 @@ class RequestParams(BaseModel):
             ' by comma.',
         example='1,4',
     )
+    latency_budget_ms: int = Field(
+        default=None,
+        title='Latency budget',
+        description='Time, in milliseconds, the request may spend normalizing roles. Once it is'
+            ' nearly used up, remaining roles are normalized skipping the most expensive steps and'
+            ' their titles are listed, by position, in the X-Degraded-Titles response header.'
+            ' Optional. Also accepted in the X-Latency-Budget-Ms request header.',
+        gt=0,
+        example=100,
+    )
+    ids_only: bool = Field(
+        default=None,
+        title='IDs only',
+        description='Return a compact response, for service-to-service callers: a list with one item'
+            ' per received title, by position, listing its normalized roles as'
+            ' [role_id, areap_ids, nivelh_ids], followed by perfil_ids and match_type if requested.'
+            ' Optional. Expects "true" or "false". Not supported by the bulk endpoint.',
+        example=True,
+    )
     @validator('perfil_ids')
     def perfil_ids_validation(cls, perfil_ids_str: str) -> list:
         if not perfil_ids_str:
@@ -148,14 +176,36 @@ class ResponsePayload(BaseModel):
     )
 
 
+def load_role_matcher() -> RoleMatcher:
+    """
+    Create the role normalizer, loading its models.
+    """
+    role_matcher = RoleMatcher()
+    metrics.model_load_time.set(role_matcher.load_time)
+    metrics.model_generation.set(role_matcher.generation)
+    return role_matcher
+
+
+component_loader.register('role_matcher', load_role_matcher)
+
+
 class RoleNormalization:
 
     """
     Handles Role Normalization requests.
     """
 
-    # Create a role normalizer
-    role_normalizer = RoleMatcher()
+    # Role normalizer, loaded by component_loader
+    role_normalizer = Component('role_matcher')
+
+    # Encoded JSON of normalized roles, used to assemble responses
+    response_fragments = ResponseFragments()
+
+    # Interactive and batch requests lanes, shared by every thread of the worker process
+    request_lanes = RequestLanes()
+
+    # Debug mode, profiling requests that ask for it
+    request_profiler = RequestProfiler()
 
     # Separators used to split received titles with multiple roles
     title_separators = [re.escape(separator) for separator in ['/', ',', ' ou ', ';', '|']]
@@ -163,14 +213,23 @@ class RoleNormalization:
     @spec.validate(
         json=RequestPayload,
         query=RequestParams,
-        resp=Response(HTTP_200=ResponsePayload, HTTP_403=None),
+        resp=Response(HTTP_200=ResponsePayload, HTTP_403=None, HTTP_503=None),
         tags=['role-normalization']
     )
     def on_post(self, req, resp):
         """
         Normalizes received role titles - associates them to database role IDs, if possible.
         """
-        self.normalize_roles(req, resp)
+        lane = self.request_lanes.lane(req.get_header(settings.request_lane_header), req.context.get('json').origin)
+        try:
+            with self.request_lanes.admit(lane):
+                self.normalize_roles(req, resp)
+        except LaneFullError as e:
+            logger.warning(f'Request refused: {e}')
+            raise falcon.HTTPServiceUnavailable(
+                title='Service Unavailable',
+                description=f'Too many {lane.name} requests being normalized, try again later',
+                retry_after=1)
 
     def normalize_roles(self, req, resp):
 
@@ -179,37 +238,107 @@ class RoleNormalization:
         request_params = req.context.get('query')
         include_match_type = request_params.match_type == True
         perfil_ids_filter = request_params.perfil_ids
+
+        latency_budget = LatencyBudget.from_request(req, request_params.latency_budget_ms)
+        profile = self.request_profiler.requested(req)
+
+        # Models generation in use, resolved once so the whole request is normalized with it, even
+        # if the next one is swapped in meanwhile - see ModelReloader
+        role_matcher = self.role_normalizer
+
+        # Split each received title into single roles
+        title_roles = self.split_titles(role_titles)
+
+        # Normalize each role and check if it matches a database role title, with the match quality
+        # the remaining latency budget affords - once it's used up, remaining roles are still matched
+        # at minimal quality, their cheapest stages only
+        matches = {}
+        degraded_roles = set()
+        role_profiles = {}
+        for roles in title_roles.values():
+            title_start_time = time.perf_counter()
+            for role in roles:
+                logger.info(f'Received role: {role}')
+                # Roles found in several titles are normalized once, keeping their match
+                if role in matches:
+                    continue
+                quality = latency_budget.quality()
+                if not profile:
+                    matches[role] = role_matcher.normalize_and_match(role, perfil_ids_filter, quality)
+                else:
+                    matches[role], role_profiles[role] = \
+                        role_matcher.profile_normalize_and_match(role, perfil_ids_filter, quality)
+                if quality != 'full':
+                    degraded_roles.add(role)
+            metrics.title_latency.observe(time.perf_counter() - title_start_time)
+
+        media_type = response_media_type(req)
+        if request_params.ids_only:
+            self.build_ids_response(resp, role_titles, title_roles, matches, include_match_type, perfil_ids_filter, media_type)
+        else:
+            self.build_response(resp, title_roles, matches, include_match_type, perfil_ids_filter, media_type)
+        self.set_degraded_titles(resp, role_titles, title_roles, degraded_roles)
+        if profile:
+            self.request_profiler.report(resp, title_roles, matches, role_profiles)
+
+        metrics.request_titles.labels('catho').observe(len(role_titles))
+        metrics.observe_matches(matches.values())
+        metrics.observe_caches(role_matcher, self.response_fragments)
+
+    def split_titles(self, role_titles: list) -> OrderedDict:
+        """
+        Split received titles into single roles.
+
+        Parameters:
+        - role_titles : list : Received role titles, each possibly with multiple roles
+
+        Returns:
+        - OrderedDict : Received role titles mapped to lists of single roles found in them
+        """
+        return OrderedDict(
+            (role_title, re.split('|'.join(self.title_separators), role_title))
+            for role_title in role_titles
+        )
+
+    def build_response(self, resp, title_roles: OrderedDict, matches: dict, include_match_type: bool, perfil_ids_filter: list,
+                       media_type: str = falcon.MEDIA_JSON) -> None:
+        """
+        Set response status and body from the normalization of each role found in received titles.
+
+        Parameters:
+        - resp               : falcon.Response : Response to be returned
+        - title_roles        : OrderedDict     : Received role titles mapped to their single roles
+        - matches            : dict            : Single roles mapped to normalize_and_match() results
+        - include_match_type : bool            : Include the match type of each normalized role
+        - perfil_ids_filter  : list            : Perfil IDs filter, if any
+        - media_type         : str             : Response media type, JSON or MessagePack
+        """
+        # Responses sampled for validation are built as objects, left for spectree to validate and
+        # Falcon to serialize, the others are assembled from encoded roles, skipping validation -
+        # spectree only validates resp.media. MessagePack responses are built as objects too, and
+        # serialized here unless sampled
+        validate_response = random.random() < settings.response_validation_sample_rate
+        build_objects = validate_response or media_type != falcon.MEDIA_JSON
+
         resp_obj = OrderedDict()
 
         # For each received title
-        for role_title in role_titles:
+        for role_title, roles in title_roles.items():
             norm_roles = []
-            # Split title into single roles
-            for role in re.split('|'.join(self.title_separators), role_title):
-                # Normalize title and check if it matches a database role title
-                logger.info(f'Received role: {role}')
-                norm_title, norm_role, match_type = self.role_normalizer.normalize_and_match(
-                    role,
-                    perfil_ids_filter
-                )
+            # For each single role found in the title
+            for role in roles:
+                norm_title, norm_role, match_type = matches[role]
                 logger.info(f'Processed role: {norm_title}')
-                # If so, add it to the list of normalized roles for the current title
+                # If it matches a database role, add it to the list of normalized roles for the current title
                 if norm_role is not None:
                     logger.info(f'Normalized role ID: {norm_role.role_id}')
                     logger.info(f'Normalized role title: {norm_role.title}')
-                    norm_role_resp = {
-                        'normalized_role': norm_role.title,
-                        'role_id': norm_role.role_id,
-                        'seniority': norm_role.seniorities,
-                        'hierarchy': norm_role.hierarchies,
-                        'areap_ids': norm_role.areap_ids,
-                        'nivelh_ids': norm_role.nivelh_ids
-                    }
-                    if include_match_type:
-                        norm_role_resp['match_type'] = match_type
-                    if perfil_ids_filter:
-                        norm_role_resp['perfil_ids'] = norm_role.perfil_ids
-                    norm_roles.append(norm_role_resp)
+                    if build_objects:
+                        norm_roles.append(
+                            self.normalized_role_response(norm_role, match_type, include_match_type, perfil_ids_filter))
+                    else:
+                        norm_roles.append(
+                            self.response_fragments.role(norm_role, match_type, include_match_type, perfil_ids_filter))
 
             # Add current title normalized roles to the response object
             if norm_roles:
@@ -222,4 +351,91 @@ class RoleNormalization:
         else:
             resp.status = falcon.HTTP_204
 
-        resp.media = resp_obj
+        resp.content_type = media_type
+        if validate_response:
+            resp.media = resp_obj
+        elif media_type != falcon.MEDIA_JSON:
+            resp.data = msgpack_handler.serialize(resp_obj, media_type)
+        else:
+            resp.data = self.response_fragments.object(resp_obj)
+
+    def build_ids_response(self, resp, role_titles: list, title_roles: OrderedDict, matches: dict, include_match_type: bool,
+                           perfil_ids_filter: list, media_type: str = falcon.MEDIA_JSON) -> None:
+        """
+        Set response status and compact body - IDs only, see RequestParams.ids_only - from the
+        normalization of each role found in received titles. Not validated, as it doesn't follow
+        ResponsePayload.
+
+        Parameters:
+        - resp               : falcon.Response : Response to be returned
+        - role_titles        : list            : Received role titles
+        - title_roles        : OrderedDict     : Received role titles mapped to their single roles
+        - matches            : dict            : Single roles mapped to normalize_and_match() results
+        - include_match_type : bool            : Include the match type of each normalized role
+        - perfil_ids_filter  : list            : Perfil IDs filter, if any
+        - media_type         : str             : Response media type, JSON or MessagePack
+        """
+        # title_norm_roles: {'ROLE_TITLE': [[ROLE_ID, [AREAP_ID, ...], [NIVELH_ID, ...]], ...], ...}
+        title_norm_roles = {}
+        for role_title, roles in title_roles.items():
+            norm_roles = []
+            for role in roles:
+                norm_title, norm_role, match_type = matches[role]
+                logger.info(f'Processed role: {norm_title}')
+                if norm_role is not None:
+                    logger.info(f'Normalized role ID: {norm_role.role_id}')
+                    norm_role_ids = [norm_role.role_id, norm_role.areap_ids, norm_role.nivelh_ids]
+                    if perfil_ids_filter:
+                        norm_role_ids.append(norm_role.perfil_ids)
+                    if include_match_type:
+                        norm_role_ids.append(match_type)
+                    norm_roles.append(norm_role_ids)
+            title_norm_roles[role_title] = norm_roles
+
+        # Titles received more than once are listed at each of their positions
+        resp_list = [title_norm_roles[role_title] for role_title in role_titles]
+
+        resp.status = falcon.HTTP_200 if any(resp_list) else falcon.HTTP_204
+        resp.content_type = media_type
+        if media_type != falcon.MEDIA_JSON:
+            resp.data = msgpack_handler.serialize(resp_list, media_type)
+        else:
+            resp.data = self.response_fragments.encode(resp_list)
+
+    def set_degraded_titles(self, resp, role_titles: list, title_roles: OrderedDict, degraded_roles: set) -> None:
+        """
+        List received titles with roles normalized below full match quality, by their position in
+        the request, in the settings.latency_budget_degraded_header response header.
+
+        Parameters:
+        - resp           : falcon.Response : Response to be returned
+        - role_titles    : list            : Received role titles
+        - title_roles    : OrderedDict     : Received role titles mapped to their single roles
+        - degraded_roles : set             : Single roles normalized below full match quality
+        """
+        if not degraded_roles:
+            return
+        degraded_titles = [
+            str(i) for i, role_title in enumerate(role_titles)
+            if not degraded_roles.isdisjoint(title_roles[role_title])
+        ]
+        logger.warning(f'Latency budget used up, {len(degraded_titles)} titles degraded')
+        resp.set_header(settings.latency_budget_degraded_header, ','.join(degraded_titles))
+
+    def normalized_role_response(self, norm_role, match_type: str, include_match_type: bool, perfil_ids_filter: list) -> dict:
+        """
+        Build the response object of a single normalized role - see NormalizedRoleTitle.
+
+        Parameters:
+        - norm_role          : ProcessedRole : Database role matched
+        - match_type         : str           : Match type
+        - include_match_type : bool          : Include the match type
+        - perfil_ids_filter  : list          : Perfil IDs filter, if any
+
+        Returns:
+        - dict : Normalized role response object
+        """
+        norm_role_resp = normalized_role_object(norm_role, perfil_ids_filter)
+        if include_match_type:
+            norm_role_resp['match_type'] = match_type
+        return norm_role_resp
@@ -0,0 +1,76 @@
+import falcon
+import logbook
+from spectree import Response
+
+from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.latency_budget import LatencyBudget
+from role_normalization.api.matcher_pool import MatcherPool, MatcherPoolFullError
+from role_normalization.api.media import response_media_type
+from role_normalization.api.role_norm import RequestParams, RequestPayload, ResponsePayload, RoleNormalization
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+asgi_spec = settings.asgi_spec
+
+
+class RoleNormalizationAsync(RoleNormalization):
+
+    """
+    Handles Role Normalization requests in the ASGI API. Same contract as RoleNormalization, but
+    roles are normalized by a pool of processes, so the event loop keeps serving other requests.
+    """
+
+    def __init__(self, matcher_pool: MatcherPool) -> None:
+        self.matcher_pool = matcher_pool
+
+    @asgi_spec.validate(
+        json=RequestPayload,
+        query=RequestParams,
+        resp=Response(HTTP_200=ResponsePayload, HTTP_403=None, HTTP_503=None),
+        tags=['role-normalization']
+    )
+    async def on_post(self, req, resp):
+        """
+        Normalizes received role titles - associates them to database role IDs, if possible.
+        """
+        await self.normalize_roles_async(req, resp)
+
+    async def normalize_roles_async(self, req, resp):
+
+        request_payload = req.context.get('json')
+        role_titles = request_payload.titles
+        request_params = req.context.get('query')
+        include_match_type = request_params.match_type == True
+        perfil_ids_filter = request_params.perfil_ids
+        latency_budget = LatencyBudget.from_request(req, request_params.latency_budget_ms)
+
+        # Split each received title into single roles
+        title_roles = self.split_titles(role_titles)
+        roles = [role for roles in title_roles.values() for role in roles]
+        for role in roles:
+            logger.info(f'Received role: {role}')
+
+        # Normalize all roles at once in the process pool, along with roles from concurrent requests,
+        # with the match quality the latency budget affords when they are sent
+        quality = latency_budget.quality()
+        try:
+            matches = await self.matcher_pool.normalize_and_match(roles, perfil_ids_filter, quality)
+        except MatcherPoolFullError as e:
+            logger.warning(f'Request refused: {e}')
+            raise falcon.HTTPServiceUnavailable(
+                title='Service Unavailable',
+                description='Too many roles being normalized, try again later',
+                retry_after=1)
+
+        media_type = response_media_type(req)
+        if request_params.ids_only:
+            self.build_ids_response(resp, role_titles, title_roles, matches, include_match_type, perfil_ids_filter, media_type)
+        else:
+            self.build_response(resp, title_roles, matches, include_match_type, perfil_ids_filter, media_type)
+        self.set_degraded_titles(resp, role_titles, title_roles, set(roles) if quality != 'full' else set())
+
+        metrics.request_titles.labels('catho').observe(len(role_titles))
+        metrics.observe_matches(matches.values())
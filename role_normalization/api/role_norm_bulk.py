@@ -0,0 +1,155 @@
+import falcon
+import json
+import logbook
+import time
+
+from role_normalization import settings
+from role_normalization.api import metrics
+from role_normalization.api.component_loader import component_loader
+from role_normalization.api.role_norm import RequestParams, RoleNormalization
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+spec = settings.spec
+
+
+class RoleNormalizationBulk(RoleNormalization):
+
+    """
+    Handles bulk Role Normalization requests: titles are streamed in the request body and results
+    are streamed back, both as NDJSON, so memory used doesn't depend on the number of titles.
+    """
+
+    # Bytes read from the request body at a time
+    read_block_size = 64 * 1024
+
+    @spec.validate(
+        query=RequestParams,
+        tags=['role-normalization']
+    )
+    def on_post(self, req, resp):
+        """
+        Normalizes a stream of role titles. Request body is NDJSON, one title per line, either as a
+        JSON string - "recepcionista" - or as an object - {"title": "recepcionista"}. Response body
+        is NDJSON, one line per received title, in the same order -
+        {"title": "recepcionista", "normalized_roles": [...]} - or, for invalid lines,
+        {"line": LINE_NUMBER, "error": "DESCRIPTION"}. Same query parameters as the main endpoint.
+        """
+        request_params = req.context.get('query')
+        include_match_type = request_params.match_type == True
+        perfil_ids_filter = request_params.perfil_ids
+
+        # Refused with 503 while models are loading, before results start being streamed
+        component_loader.get('role_matcher')
+
+        # Chunked request bodies have no content length - read the input stream until it ends
+        stream = req.bounded_stream if req.content_length is not None else req.stream
+
+        resp.status = falcon.HTTP_200
+        resp.content_type = 'application/x-ndjson'
+        resp.stream = self.normalize_stream(stream, include_match_type, perfil_ids_filter)
+
+    def normalize_stream(self, stream, include_match_type: bool, perfil_ids_filter: list):
+        """
+        Read titles from a stream and yield normalized results, one chunk of NDJSON lines at a time.
+
+        Parameters:
+        - stream             : file-like : Request body stream
+        - include_match_type : bool      : Include the match type of each normalized role
+        - perfil_ids_filter  : list      : Perfil IDs filter, if any
+
+        Returns:
+        - Generator of bytes : NDJSON lines of each chunk of titles
+        """
+        start_time = time.time()
+        num_titles = 0
+        chunk = []
+        for line_number, title, error in self._read_titles(stream):
+            chunk.append((line_number, title, error))
+            if len(chunk) >= settings.bulk_chunk_size:
+                yield self._normalize_chunk(chunk, include_match_type, perfil_ids_filter)
+                num_titles += len(chunk)
+                chunk = []
+        if chunk:
+            yield self._normalize_chunk(chunk, include_match_type, perfil_ids_filter)
+            num_titles += len(chunk)
+        logger.info(f'Bulk request with {num_titles} titles normalized in {time.time() - start_time:.3f}s')
+
+    def _read_titles(self, stream):
+        # Yield (LINE_NUMBER, 'TITLE', None) for each valid line and (LINE_NUMBER, None, 'ERROR')
+        # for invalid ones, skipping blank lines
+        for line_number, line in enumerate(self._read_lines(stream), start=1):
+            if line is None:
+                yield line_number, None, f'Line longer than {settings.bulk_max_line_length} bytes'
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                value = json.loads(line)
+            except ValueError:
+                yield line_number, None, 'Invalid JSON'
+                continue
+            if isinstance(value, dict):
+                value = value.get('title')
+            if not isinstance(value, str):
+                yield line_number, None, 'Expected a JSON string or an object with a "title" string'
+                continue
+            yield line_number, value, None
+
+    def _read_lines(self, stream):
+        # Yield each line of a stream, or None for lines longer than the max length, which are
+        # discarded as they are read. Blocks are read instead of lines, as readline() of Falcon's
+        # bounded stream counts the size requested, not the size read, as consumed
+        buffer = b''
+        discarding = False
+        while True:
+            block = stream.read(self.read_block_size)
+            if not block:
+                break
+            lines = (buffer + block).split(b'\n')
+            buffer = lines.pop()
+            for line in lines:
+                if discarding:
+                    discarding = False
+                    yield None
+                else:
+                    yield line if len(line) <= settings.bulk_max_line_length else None
+            if len(buffer) > settings.bulk_max_line_length:
+                discarding = True
+                buffer = b''
+        if discarding:
+            yield None
+        elif buffer:
+            yield buffer if len(buffer) <= settings.bulk_max_line_length else None
+
+    def _normalize_chunk(self, chunk: list, include_match_type: bool, perfil_ids_filter: list) -> bytes:
+        # Normalize each distinct role of a chunk of titles only once and return NDJSON results,
+        # assembled from encoded roles
+        title_roles = self.split_titles([title for _, title, _ in chunk if title is not None])
+        # Models generation resolved once, so a chunk is normalized with a single one
+        role_matcher = self.role_normalizer
+        matches = {}
+        for roles in title_roles.values():
+            for role in roles:
+                if role not in matches:
+                    matches[role] = role_matcher.normalize_and_match(role, perfil_ids_filter)
+        logger.debug(f'Bulk chunk with {len(chunk)} titles and {len(matches)} distinct roles normalized')
+        metrics.request_titles.labels('bulk').observe(len(chunk))
+        metrics.observe_matches(matches.values())
+        metrics.observe_caches(role_matcher, self.response_fragments)
+
+        lines = []
+        for line_number, title, error in chunk:
+            if error:
+                lines.append(self.response_fragments.encode({'line': line_number, 'error': error}))
+            else:
+                lines.append(
+                    b'{"title":' + self.response_fragments.encode(title) + b',"normalized_roles":[' + b','.join(
+                        self.response_fragments.role(norm_role, match_type, include_match_type, perfil_ids_filter)
+                        for _, norm_role, match_type in (matches[role] for role in title_roles[title])
+                        if norm_role is not None
+                    ) + b']}')
+        return b'\n'.join(lines) + b'\n'
@@ -9,6 +9,7 @@ from spectree import Response
 from typing import List, Dict
 
 from role_normalization import settings
+from role_normalization.api.component_loader import Component, component_loader
 from role_normalization.api.models.role_matcher import RoleMatcher
 from role_normalization.api.events.role_normalizer_events import RoleNormalizerEvents
 
@@ -18,6 +19,10 @@ settings.logger_group.add_logger(logger)
 
 spec = settings.spec
 
+# Each resource has its own events normalizer, with its own database connections
+component_loader.register('job_role_normalizer_events', RoleNormalizerEvents)
+component_loader.register('user_role_normalizer_events', RoleNormalizerEvents)
+
 
 # URL parameters validation
 class RequestParams(BaseModel):
@@ -77,7 +82,7 @@ class JobRoleNormalizer:
     """
     Job Role Inference based on contacted/applied CV roles.
     """
-    rne = RoleNormalizerEvents()
+    rne = Component('job_role_normalizer_events')
 
     @spec.validate(json=JobRequestPayload, query=RequestParams, resp=Response(HTTP_200=ResponsePayload, HTTP_403=None), tags=['role-normalization'])
     def on_post(self, req, resp):
@@ -133,7 +138,7 @@ class UserRoleNormalizer:
     """
     User Role Inference based on applied job roles.
     """
-    rne = RoleNormalizerEvents()
+    rne = Component('user_role_normalizer_events')
 
     @spec.validate(json=UserRequestPayload, query=RequestParams, resp=Response(HTTP_200=ResponsePayload, HTTP_403=None), tags=['role-normalization'])
     def on_post(self, req, resp):
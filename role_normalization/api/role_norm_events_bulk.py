@@ -0,0 +1,192 @@
+import falcon
+import json
+import logbook
+from pydantic import BaseModel, Field
+from spectree import Response
+from typing import Optional
+
+from role_normalization import settings
+from role_normalization.api.component_loader import component_loader
+from role_normalization.api.events.bulk_jobs import BulkJobError, BulkJobRunner, bulk_job_store
+
+
+logger = logbook.Logger(__name__)
+settings.logger_group.add_logger(logger)
+
+spec = settings.spec
+
+# Bulk jobs run once the events normalizers are loaded, in the background
+if bulk_job_store is not None:
+    component_loader.register('events_bulk_runner', lambda: BulkJobRunner(bulk_job_store, {
+        'jobs': lambda ids: component_loader.get('job_role_normalizer_events').normalize_job_ids(ids),
+        'users': lambda ids: component_loader.get('user_role_normalizer_events').normalize_usr_ids(ids),
+    }).start())
+
+
+# URL parameters validation
+class BulkRequestParams(BaseModel):
+    origin: str = Field(
+        ...,
+        title='Request origin',
+        description="The system/app/page calling this api",
+        example='backfill',
+    )
+
+class BulkResultsParams(BaseModel):
+    offset: int = Field(
+        default=0,
+        ge=0,
+        title='Results offset',
+        description='Byte offset results are read from - X-Bulk-Next-Offset of the previous response.',
+    )
+    wait: float = Field(
+        default=0,
+        ge=0,
+        le=settings.events_bulk_max_wait,
+        title='Seconds to wait',
+        description='Seconds to wait for results after offset, if none yet and the bulk job is not finished.',
+    )
+
+# Response body validation
+class BulkStatus(BaseModel):
+    bulk_id: str = Field(..., title='Bulk job ID', example='3f1c0e7a9b5d4c2e8f6a1b0c9d8e7f6a')
+    kind: str = Field(..., title='Kind of IDs', description='"jobs" or "users".', example='jobs')
+    origin: str = Field(..., title='Request origin', example='backfill')
+    state: str = Field(..., title='State', description='"queued", "running", "retrying", "done" or "failed".', example='running')
+    total: int = Field(..., title='IDs submitted', example=2000000)
+    processed: int = Field(..., title='IDs processed', example=150000)
+    inferred: int = Field(..., title='IDs processed with inferred role', example=120000)
+    results_size: int = Field(..., title='Bytes of results available', example=5400000)
+    submitted_at: float = Field(..., title='Submission time, in seconds since epoch')
+    started_at: Optional[float] = Field(None, title='Start time, in seconds since epoch')
+    updated_at: Optional[float] = Field(None, title='Time of the last chunk processed, in seconds since epoch')
+    finished_at: Optional[float] = Field(None, title='Finish time, in seconds since epoch')
+    ids_per_second: Optional[float] = Field(None, title='IDs processed per second', example=850.0)
+    eta_seconds: Optional[int] = Field(None, title='Estimated seconds left', example=2176)
+    error: Optional[str] = Field(None, title='Error of a failed bulk job, or of its last attempt if retrying')
+    attempts: int = Field(0, title='Attempts failed in a row')
+    retry_at: Optional[float] = Field(None, title='Time of the next attempt, if retrying, in seconds since epoch')
+
+
+class EventsBulkSubmit:
+
+    """
+    Submits bulk jobs of job or user IDs, inferred in the background - see events/bulk_jobs.py.
+    """
+
+    # Bytes read from the request body at a time
+    read_block_size = 64 * 1024
+
+    def __init__(self, kind: str) -> None:
+        """
+        Parameters:
+        - kind : str : "jobs" or "users"
+        """
+        self.kind = kind
+        self.ids_field = 'job_ids' if kind == 'jobs' else 'user_ids'
+
+    @spec.validate(query=BulkRequestParams, resp=Response(HTTP_202=BulkStatus), tags=['role-normalization'])
+    def on_post(self, req, resp):
+        """
+        Submits a bulk job of any number of IDs, answered right away with its status. Request body is
+        either JSON - {"job_ids": [123, 456]} or {"user_ids": [...]} - or NDJSON, one ID per line,
+        which may be sent with chunked transfer encoding. Status is then polled at
+        /v1/role_normalization/events/bulk/BULK_ID, and results read at
+        /v1/role_normalization/events/bulk/BULK_ID/results.
+        """
+        if bulk_job_store is None:
+            raise falcon.HTTPNotFound(description='Bulk jobs not enabled')
+        request_params = req.context.get('query')
+
+        # Chunked request bodies have no content length - read the input stream until it ends
+        stream = req.bounded_stream if req.content_length is not None else req.stream
+        try:
+            if 'application/json' in req.content_type:
+                ids = self._read_json_ids(stream)
+            else:
+                ids = self._read_line_ids(stream)
+            status = bulk_job_store.submit(self.kind, ids, request_params.origin)
+        except BulkJobError as e:
+            raise falcon.HTTPBadRequest(title='Invalid bulk job', description=str(e))
+
+        resp.status = falcon.HTTP_202
+        resp.location = f'/v1/role_normalization/events/bulk/{status["bulk_id"]}'
+        resp.media = status
+
+    def _read_json_ids(self, stream):
+        try:
+            payload = json.load(stream)
+        except ValueError:
+            raise BulkJobError('Invalid JSON')
+        ids = payload.get(self.ids_field) if isinstance(payload, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(id, int) and not isinstance(id, bool) and id > 0 for id in ids):
+            raise BulkJobError(f'Expected an object with "{self.ids_field}", a list of IDs')
+        return ids
+
+    def _read_line_ids(self, stream):
+        # Yield the ID of each line, as a JSON number or string, skipping blank lines
+        buffer = b''
+        line_number = 0
+        while True:
+            block = stream.read(self.read_block_size)
+            lines = (buffer + block).split(b'\n')
+            buffer = lines.pop() if block else b''
+            for line in lines:
+                line_number += 1
+                line = line.strip().strip(b'"')
+                if not line:
+                    continue
+                if not line.isdigit() or len(line) > 20:
+                    raise BulkJobError(f'Line {line_number}: expected an ID')
+                yield int(line)
+            if not block:
+                break
+
+
+class EventsBulkStatus:
+
+    """
+    Status of a bulk job.
+    """
+
+    @spec.validate(resp=Response(HTTP_200=BulkStatus, HTTP_404=None), tags=['role-normalization'])
+    def on_get(self, req, resp, bulk_id):
+        """
+        Returns the state and progress of a bulk job: IDs processed, IDs per second and estimated
+        seconds left.
+        """
+        status = bulk_job_store.status(bulk_id) if bulk_job_store is not None else None
+        if status is None:
+            raise falcon.HTTPNotFound(description=f'Bulk job {bulk_id} not found')
+        resp.media = status
+        resp.status = falcon.HTTP_200
+
+
+class EventsBulkResults:
+
+    """
+    Results of a bulk job, as they're written.
+    """
+
+    @spec.validate(query=BulkResultsParams, tags=['role-normalization'])
+    def on_get(self, req, resp, bulk_id):
+        """
+        Returns results of a bulk job from a byte offset, as NDJSON - {"id": "123", "role_id": 1104}
+        per ID processed, role 0 if not inferred. Headers X-Bulk-State and X-Bulk-Next-Offset give
+        the state of the job and the offset of the next results: results are read incrementally by
+        requesting them again from that offset, until the job is done. With wait, the response waits
+        for results after offset while there are none yet.
+        """
+        request_params = req.context.get('query')
+        status = bulk_job_store.status(bulk_id) if bulk_job_store is not None else None
+        if status is None:
+            raise falcon.HTTPNotFound(description=f'Bulk job {bulk_id} not found')
+        if request_params.wait:
+            status = bulk_job_store.wait_results(bulk_id, request_params.offset, request_params.wait)
+
+        next_offset = max(status['results_size'], request_params.offset)
+        resp.status = falcon.HTTP_200
+        resp.content_type = 'application/x-ndjson'
+        resp.set_header('X-Bulk-State', status['state'])
+        resp.set_header('X-Bulk-Next-Offset', str(next_offset))
+        resp.stream = bulk_job_store.read_results(bulk_id, request_params.offset, status['results_size'])
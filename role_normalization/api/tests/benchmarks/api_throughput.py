@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import logging
+import os
+import random
+import requests
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from worker_memory import get_children, get_memory
+
+
+"""
+Run, with the API running on the same host:
+python3 role_normalization/api/tests/benchmarks/api_throughput.py \
+    -a API_AUTH \
+    -t titles.txt \
+    -c 32 \
+    -n 5000 \
+    -p /seek/role-norm-gunicorn.pid \
+    -o throughput_gthread.json
+
+Sends concurrent normalization requests and reports throughput, latency percentiles and, if a
+Gunicorn pidfile is given, memory used by the master and workers once the run is finished.
+
+Compare worker classes by running it against the API started with ROLE_NORM_API_WORKER_CLASS=sync
+and with ROLE_NORM_API_WORKER_CLASS=gthread (see ROLE_NORM_API_WORKERS and ROLE_NORM_API_THREADS).
+Use many distinct titles, one per line in the titles file, otherwise most requests are answered by
+the API caches instead of the models.
+"""
+
+
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+API_PATH = '/v1/role_normalization/catho'
+
+DEFAULT_TITLES = [
+    'analista de sistemas',
+    'auxiliar administrativo',
+    'recepcionista',
+    'vendedor externo',
+    'gerente comercial',
+    'motorista entregador',
+    'desenvolvedor python senior',
+    'assistente de recursos humanos',
+    'tecnico de enfermagem',
+    'operador de caixa',
+]
+
+
+def parse_args():
+    """
+    Parse command line arguments and return them.
+    """
+    args_parser = argparse.ArgumentParser(description='Measure Role Normalization API throughput and latency under concurrent requests.')
+    args_parser.add_argument(
+        '-u',
+        help='API URL prefix',
+        type=str,
+        metavar='API_URL',
+        default='http://localhost:8192',
+        dest='api_url')
+    args_parser.add_argument(
+        '-a',
+        help='Role Normalization API authentication, base64 encoded',
+        type=str,
+        metavar='BASE64_AUTH',
+        required=True,
+        dest='auth')
+    args_parser.add_argument(
+        '-t',
+        help='File with role titles, one per line - a small built-in list is used if missing',
+        type=str,
+        metavar='TITLES_FILE',
+        dest='titles_file')
+    args_parser.add_argument(
+        '-b',
+        help='Number of titles sent in each request',
+        type=int,
+        metavar='BATCH_SIZE',
+        default=1,
+        dest='batch_size')
+    args_parser.add_argument(
+        '-c',
+        help='Number of concurrent clients',
+        type=int,
+        metavar='CONCURRENCY',
+        default=16,
+        dest='concurrency')
+    args_parser.add_argument(
+        '-n',
+        help='Total number of requests',
+        type=int,
+        metavar='NUM_REQUESTS',
+        default=1000,
+        dest='requests')
+    args_parser.add_argument(
+        '-p',
+        help='Gunicorn pidfile, memory is reported only if given',
+        type=str,
+        metavar='PIDFILE',
+        dest='pidfile')
+    args_parser.add_argument(
+        '-o',
+        help='Save report to this JSON file',
+        type=str,
+        metavar='OUTPUT_FILE',
+        dest='output_file')
+    args_parser.add_argument(
+        '-s',
+        help='Random seed',
+        type=int,
+        metavar='RANDOM_SEED',
+        default=42,
+        dest='seed')
+    return args_parser.parse_args()
+
+
+def read_titles(titles_file: str) -> list:
+    """
+    Read role titles from a file, one per line, or return the built-in titles.
+    """
+    if not titles_file:
+        return DEFAULT_TITLES
+    with open(titles_file) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Return the value below which a given percentage of sorted values fall.
+    """
+    index = min(len(values) - 1, max(0, int(round(percent / 100 * len(values))) - 1))
+    return values[index]
+
+
+def main():
+
+    args = parse_args()
+    random.seed(args.seed)
+
+    titles = read_titles(args.titles_file)
+    payloads = [
+        json.dumps({'titles': random.sample(titles, min(args.batch_size, len(titles)))})
+        for _ in range(args.requests)
+    ]
+    url = args.api_url + API_PATH
+    headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'Authorization': f'Basic {args.auth}'
+    }
+
+    # One HTTP session per client thread, so connections are reused as a real client would
+    thread_data = threading.local()
+
+    def send_request(payload: str) -> tuple:
+        if not hasattr(thread_data, 'session'):
+            thread_data.session = requests.Session()
+        start_time = time.perf_counter()
+        response = thread_data.session.post(url, data=payload, headers=headers)
+        return time.perf_counter() - start_time, response.status_code
+
+    logger.info(f'Sending {args.requests} requests with {args.batch_size} titles each, {args.concurrency} at a time, to {url}')
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(send_request, payloads))
+    elapsed_time = time.perf_counter() - start_time
+
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    errors = sum(1 for _, status_code in results if status_code not in (200, 204))
+    report = {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'batch_size': args.batch_size,
+        'errors': errors,
+        'elapsed_s': elapsed_time,
+        'requests_per_s': args.requests / elapsed_time,
+        'titles_per_s': args.requests * args.batch_size / elapsed_time,
+        'latency_ms': {
+            'mean': statistics.mean(latencies),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1],
+        },
+    }
+
+    logger.info(f'Elapsed: {elapsed_time:.2f}s - {report["requests_per_s"]:.1f} requests/s, '
+                f'{report["titles_per_s"]:.1f} titles/s, {errors} errors')
+    logger.info('Latency (ms): ' + ', '.join(f'{key} {value:.1f}' for key, value in report['latency_ms'].items()))
+
+    if args.pidfile and os.path.isfile(args.pidfile):
+        with open(args.pidfile) as f:
+            master_pid = int(f.read().strip())
+        worker_pids = get_children(master_pid)
+        report['memory_kb'] = {
+            'master': get_memory(master_pid),
+            'workers': {str(pid): get_memory(pid) for pid in worker_pids},
+        }
+        report['memory_kb']['total'] = {
+            metric: report['memory_kb']['master'][metric] + sum(memory[metric] for memory in report['memory_kb']['workers'].values())
+            for metric in ['rss', 'pss', 'uss']
+        }
+        total = report['memory_kb']['total']
+        logger.info(f'Memory of master and {len(worker_pids)} workers (MB): RSS {total["rss"]/1024:.1f}, '
+                    f'PSS {total["pss"]/1024:.1f}, USS {total["uss"]/1024:.1f}')
+
+    if args.output_file:
+        with open(args.output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f'Report saved to file: {args.output_file}')
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
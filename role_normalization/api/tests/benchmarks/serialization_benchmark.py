@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import logging
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+
+"""
+Run:
+python3 role_normalization/api/tests/benchmarks/serialization_benchmark.py -t 1000 -n 20
+
+Measures, for a normalization response with a given number of titles, the time spent validating
+it against ResponsePayload, as spectree does, serializing it with the json module and with the API
+JSON media handler (orjson, if installed) and assembling it from encoded roles - and building it as
+MessagePack and as IDs only (ids_only=true), along with response sizes. Titles are database role
+titles, so all of them are normalized.
+"""
+
+
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    """
+    Parse command line arguments and return them.
+    """
+    args_parser = argparse.ArgumentParser(description='Measure validation and serialization time of normalization responses.')
+    args_parser.add_argument(
+        '-t',
+        help='Number of titles in each response',
+        type=int,
+        metavar='NUM_TITLES',
+        default=1000,
+        dest='titles')
+    args_parser.add_argument(
+        '-n',
+        help='Number of runs',
+        type=int,
+        metavar='NUM_RUNS',
+        default=20,
+        dest='runs')
+    args_parser.add_argument(
+        '-m',
+        help='Include match type and filter by these perfil IDs, comma separated',
+        type=str,
+        metavar='PERFIL_IDS',
+        dest='perfil_ids')
+    return args_parser.parse_args()
+
+
+def measure(function, runs: int) -> float:
+    """
+    Run a function several times and return its median elapsed time, in milliseconds.
+    """
+    elapsed_times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        function()
+        elapsed_times.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(elapsed_times)
+
+
+def main():
+
+    args = parse_args()
+    random.seed(42)
+
+    # Imported here, as models are loaded below
+    import falcon
+    from role_normalization import settings
+    from role_normalization.api.component_loader import component_loader
+    from role_normalization.api.media import json_handler, msgpack_handler, orjson
+    from role_normalization.api.role_norm import ResponsePayload, RoleNormalization
+
+    component_loader.start(background=False)
+    resource = RoleNormalization()
+    perfil_ids_filter = [int(perfil_id) for perfil_id in args.perfil_ids.split(',')] if args.perfil_ids else None
+    role_titles = random.sample(resource.role_normalizer.db_role_titles, args.titles)
+
+    # Build the response object as the API does, keeping it in resp.media
+    settings.response_validation_sample_rate = 1.0
+    title_roles = resource.split_titles(role_titles)
+    matches = {
+        role: resource.role_normalizer.normalize_and_match(role, perfil_ids_filter)
+        for roles in title_roles.values() for role in roles
+    }
+    resp = SimpleNamespace()
+    resource.build_response(resp, title_roles, matches, bool(args.perfil_ids), perfil_ids_filter)
+    resp_obj = resp.media
+    logger.info(f'Response with {len(resp_obj)} titles and {sum(len(roles) for roles in resp_obj.values())} normalized roles')
+
+    build_ms = measure(
+        lambda: resource.build_response(SimpleNamespace(), title_roles, matches, bool(args.perfil_ids), perfil_ids_filter),
+        args.runs)
+    validation_ms = measure(lambda: ResponsePayload.parse_obj(resp_obj), args.runs)
+    json_ms = measure(lambda: json.dumps(resp_obj, ensure_ascii=False).encode('utf-8'), args.runs)
+    handler_ms = measure(lambda: json_handler.serialize(resp_obj, falcon.MEDIA_JSON), args.runs)
+
+    # Response assembled from encoded roles, as done for responses not sampled for validation
+    settings.response_validation_sample_rate = 0.0
+    fragments_ms = measure(
+        lambda: resource.build_response(SimpleNamespace(), title_roles, matches, bool(args.perfil_ids), perfil_ids_filter),
+        args.runs)
+
+    # Compact responses, for service-to-service callers, with their sizes
+    media_types = [falcon.MEDIA_JSON] + ([falcon.MEDIA_MSGPACK] if msgpack_handler is not None else [])
+    compact = {}
+    for media_type in media_types:
+        for ids_only in [False, True]:
+            if ids_only:
+                build = lambda: resource.build_ids_response(
+                    resp, role_titles, title_roles, matches, bool(args.perfil_ids), perfil_ids_filter, media_type)
+            else:
+                build = lambda: resource.build_response(
+                    resp, title_roles, matches, bool(args.perfil_ids), perfil_ids_filter, media_type)
+            resp = SimpleNamespace()
+            compact[(media_type, ids_only)] = (measure(build, args.runs), len(resp.data))
+
+    logger.info(f'Build response object          : {build_ms:.2f} ms')
+    logger.info(f'Validation (pydantic)          : {validation_ms:.2f} ms')
+    logger.info(f'Serialization (json)           : {json_ms:.2f} ms')
+    logger.info(f'Serialization ({"orjson" if orjson else "json"} handler) : {handler_ms:.2f} ms')
+    logger.info(f'Validated + json               : {build_ms + validation_ms + json_ms:.2f} ms')
+    logger.info(f'Object + {"orjson" if orjson else "json"} handler        : {build_ms + handler_ms:.2f} ms')
+    logger.info(f'Encoded roles, assembled       : {fragments_ms:.2f} ms')
+    for (media_type, ids_only), (build_ms, size) in compact.items():
+        logger.info(f'{media_type + (", IDs only" if ids_only else ""):31}: {build_ms:.2f} ms, {size} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+
+
+"""
+Run:
+python3 role_normalization/api/tests/benchmarks/startup_benchmark.py -n 5
+
+Compares RoleMatcher startup time when models are created from gazetteers and pickles and when
+they are loaded from the model bundle. Each run happens in a new Python process, so imports and
+loading are measured as they happen when a Gunicorn worker starts.
+"""
+
+
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+# Code run in a new process for each measurement - prints elapsed times as JSON
+STARTUP_CODE = '''
+import json, time
+start_time = time.time()
+from role_normalization import settings
+from role_normalization.api.models.role_matcher import RoleMatcher
+import_time = time.time() - start_time
+RoleMatcher(use_model_bundle={use_model_bundle})
+print(json.dumps({{"import": import_time, "total": time.time() - start_time}}))
+'''
+
+
+def parse_args():
+    """
+    Parse command line arguments and return them.
+    """
+    args_parser = argparse.ArgumentParser(description='Measure RoleMatcher startup time with and without the model bundle.')
+    args_parser.add_argument(
+        '-n',
+        help='Number of runs for each startup mode',
+        type=int,
+        metavar='NUM_RUNS',
+        default=3,
+        dest='runs')
+    return args_parser.parse_args()
+
+
+def measure_startup(use_model_bundle: bool) -> dict:
+    """
+    Start a new Python process that creates a RoleMatcher and return its elapsed times.
+    """
+    env = dict(os.environ)
+    env['LOG_LEVEL'] = 'ERROR'
+    result = subprocess.run(
+        [sys.executable, '-c', STARTUP_CODE.format(use_model_bundle=use_model_bundle)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+
+    args = parse_args()
+
+    # Import settings only to find the bundle path, models are loaded in child processes
+    from role_normalization import settings
+    if not os.path.isfile(settings.model_bundle_path):
+        logger.error(f'Model bundle not found, run compile_model.py first: {settings.model_bundle_path}')
+        sys.exit(1)
+    logger.info(f'Model bundle size: {os.path.getsize(settings.model_bundle_path) / 1024 / 1024:.1f} MB')
+
+    for mode, use_model_bundle in [('sources', False), ('bundle', True)]:
+        totals = []
+        for i in range(args.runs):
+            elapsed = measure_startup(use_model_bundle)
+            totals.append(elapsed['total'])
+            logger.info(f'{mode} run {i+1}/{args.runs}: {elapsed["total"]:.3f}s (imports: {elapsed["import"]:.3f}s)')
+        logger.info(f'{mode}: min {min(totals):.3f}s, median {statistics.median(totals):.3f}s, max {max(totals):.3f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+
+"""
+Run, with the API running on the same host:
+python3 role_normalization/api/tests/benchmarks/worker_memory.py \
+    -p /seek/role-norm-gunicorn.pid \
+    -o memory_preload.json \
+    -c memory_no_preload.json
+
+Reports memory used by each Gunicorn worker:
+- RSS : resident memory, counting shared pages fully in every process
+- PSS : proportional memory, shared pages are split among the processes sharing them
+- USS : unique memory, pages used only by this process - freed if the process exits
+
+Run it once with ROLE_NORM_PRELOAD_APP=false and once with ROLE_NORM_PRELOAD_APP=true, preferably
+after replaying some traffic, saving the first report with -o and comparing the second one with -c.
+"""
+
+
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    """
+    Parse command line arguments and return them.
+    """
+    args_parser = argparse.ArgumentParser(description='Report PSS/USS memory of Gunicorn master and workers.')
+    args_parser.add_argument(
+        '-p',
+        help='Gunicorn pidfile',
+        type=str,
+        metavar='PIDFILE',
+        default='/seek/role-norm-gunicorn.pid',
+        dest='pidfile')
+    args_parser.add_argument(
+        '-o',
+        help='Save report to this JSON file',
+        type=str,
+        metavar='OUTPUT_FILE',
+        dest='output_file')
+    args_parser.add_argument(
+        '-c',
+        help='Compare with a report previously saved to this JSON file',
+        type=str,
+        metavar='BASELINE_FILE',
+        dest='baseline_file')
+    return args_parser.parse_args()
+
+
+def get_children(pid: int) -> list:
+    """
+    Return the IDs of the child processes of a given process.
+    """
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Process name may contain spaces, fields after it are space separated
+                stat_fields = f.read().rsplit(')', 1)[1].split()
+            if int(stat_fields[1]) == pid:
+                children.append(int(entry))
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return sorted(children)
+
+
+def get_memory(pid: int) -> dict:
+    """
+    Return RSS, PSS and USS of a given process, in kB, read from /proc/PID/smaps_rollup.
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            tokens = line.split()
+            if len(tokens) == 3 and tokens[2] == 'kB':
+                values[tokens[0].rstrip(':')] = int(tokens[1])
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+def print_report(report: dict, baseline: dict = None) -> None:
+    """
+    Print memory used by the master process, each worker and totals, in MB.
+    """
+    logger.info(f'{"process":>16} {"RSS MB":>10} {"PSS MB":>10} {"USS MB":>10}')
+    for name, memory in [('master', report['master'])] + [
+        (f'worker {pid}', memory) for pid, memory in report['workers'].items()
+    ]:
+        logger.info(f'{name:>16} {memory["rss"]/1024:>10.1f} {memory["pss"]/1024:>10.1f} {memory["uss"]/1024:>10.1f}')
+    for key in ['worker_avg', 'total']:
+        memory = report[key]
+        logger.info(f'{key:>16} {memory["rss"]/1024:>10.1f} {memory["pss"]/1024:>10.1f} {memory["uss"]/1024:>10.1f}')
+    if baseline:
+        for key in ['worker_avg', 'total']:
+            for metric in ['pss', 'uss']:
+                before = baseline[key][metric] / 1024
+                after = report[key][metric] / 1024
+                change = (after - before) / before * 100 if before else 0
+                logger.info(f'{key} {metric.upper()}: {before:.1f} MB -> {after:.1f} MB ({change:+.1f}%)')
+
+
+def main():
+
+    args = parse_args()
+
+    with open(args.pidfile) as f:
+        master_pid = int(f.read().strip())
+    worker_pids = get_children(master_pid)
+    if not worker_pids:
+        logger.error(f'No workers found for Gunicorn master process {master_pid}')
+        sys.exit(1)
+
+    report = {
+        'master': get_memory(master_pid),
+        'workers': {str(pid): get_memory(pid) for pid in worker_pids},
+    }
+    report['worker_avg'] = {
+        metric: sum(memory[metric] for memory in report['workers'].values()) / len(worker_pids)
+        for metric in ['rss', 'pss', 'uss']
+    }
+    report['total'] = {
+        metric: report['master'][metric] + sum(memory[metric] for memory in report['workers'].values())
+        for metric in ['rss', 'pss', 'uss']
+    }
+
+    baseline = None
+    if args.baseline_file:
+        with open(args.baseline_file) as f:
+            baseline = json.load(f)
+
+    print_report(report, baseline)
+
+    if args.output_file:
+        with open(args.output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f'Report saved to file: {args.output_file}')
+
+
+if __name__ == '__main__':
+    main()
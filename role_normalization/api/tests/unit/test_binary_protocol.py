@@ -0,0 +1,67 @@
+import falcon
+import falcon.testing
+import json
+import unittest
+from unittest import mock
+
+from role_normalization.api.media import msgpack, response_media_type
+from role_normalization.api.models.role_matcher import ProcessedRole
+from role_normalization.api.role_norm import RoleNormalization
+
+
+class BinaryProtocolTest(unittest.TestCase):
+
+    def setUp(self):
+        receptionist = ProcessedRole(1104, 'Recepcionista', 'recepcionista', [], [], [47, 73], [4, 5], [1])
+        self.resource = RoleNormalization()
+        self.role_titles = ['recepcionista', 'vendedor / recepcionista', 'astronauta', 'recepcionista']
+        self.title_roles = self.resource.split_titles(self.role_titles)
+        self.matches = {
+            'recepcionista': ('recepcionista', receptionist, 'database'),
+            'vendedor ': ('vendedor', None, None),
+            ' recepcionista': ('recepcionista', receptionist, 'database'),
+            'astronauta': ('astronauta', None, None),
+        }
+
+    def test_ids_response(self):
+        resp = falcon.Response()
+        self.resource.build_ids_response(resp, self.role_titles, self.title_roles, self.matches, False, None)
+        self.assertEqual(resp.status, falcon.HTTP_200)
+        # One item per received title, by position, repeated titles included
+        self.assertEqual(json.loads(resp.data), [
+            [[1104, [47, 73], [4, 5]]],
+            [[1104, [47, 73], [4, 5]]],
+            [],
+            [[1104, [47, 73], [4, 5]]],
+        ])
+
+        resp = falcon.Response()
+        self.resource.build_ids_response(resp, self.role_titles, self.title_roles, self.matches, True, [1])
+        self.assertEqual(json.loads(resp.data)[0], [[1104, [47, 73], [4, 5], [1], 'database']])
+
+    @unittest.skipIf(msgpack is None, 'msgpack not installed')
+    def test_msgpack_response_matches_json_response(self):
+        responses = {}
+        for media_type in [falcon.MEDIA_JSON, falcon.MEDIA_MSGPACK]:
+            resp = falcon.Response()
+            with mock.patch('random.random', return_value=1.0):
+                self.resource.build_response(resp, self.title_roles, self.matches, True, None, media_type)
+            self.assertEqual(resp.content_type, media_type)
+            responses[media_type] = resp.data
+        self.assertEqual(msgpack.unpackb(responses[falcon.MEDIA_MSGPACK]), json.loads(responses[falcon.MEDIA_JSON]))
+
+    @unittest.skipIf(msgpack is None, 'msgpack not installed')
+    def test_response_media_type(self):
+        for accept, media_type in [
+            ('*/*', falcon.MEDIA_JSON),
+            ('application/json, application/msgpack', falcon.MEDIA_JSON),
+            ('application/msgpack', falcon.MEDIA_MSGPACK),
+            ('application/x-msgpack', falcon.MEDIA_MSGPACK),
+            ('application/json;q=0.5, application/msgpack', falcon.MEDIA_MSGPACK),
+        ]:
+            req = falcon.testing.create_req(headers={'Accept': accept})
+            self.assertEqual(response_media_type(req), media_type, accept)
+
+
+if __name__ == '__main__':
+    unittest.main()
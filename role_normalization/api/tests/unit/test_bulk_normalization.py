@@ -0,0 +1,57 @@
+import functools
+import io
+import json
+import unittest
+from falcon.stream import BoundedStream
+from unittest import mock
+
+from role_normalization import settings
+from role_normalization.api.models.role_matcher import ProcessedRole
+from role_normalization.api.role_norm_bulk import RoleNormalizationBulk
+
+
+class BulkNormalizationTest(unittest.TestCase):
+
+    def setUp(self):
+        # Role matcher replaced, so results don't depend on models
+        receptionist = ProcessedRole(1104, 'Recepcionista', 'recepcionista', [], [], [47, 73], [4, 5], [1])
+        self.role_normalizer = mock.Mock()
+        self.role_normalizer.normalize_and_match.side_effect = lambda role, perfil_ids_filter: \
+            ('recepcionista', receptionist, 'database') if role.strip() == 'recepcionista' else (role, None, None)
+        cache_info = functools._CacheInfo(hits=0, misses=0, maxsize=8192, currsize=0)
+        self.role_normalizer.normalize_and_match.cache_info.return_value = cache_info
+        self.role_normalizer.normalizer.normalize.cache_info.return_value = cache_info
+        self.resource = RoleNormalizationBulk()
+        self.resource.role_normalizer = self.role_normalizer
+
+    def normalize(self, body: bytes) -> list:
+        # Request body as Falcon exposes it when content length is known
+        stream = BoundedStream(io.BytesIO(body), len(body))
+        output = b''.join(self.resource.normalize_stream(stream, False, None))
+        return [json.loads(line) for line in output.decode('utf-8').splitlines()]
+
+    def test_stream_results_in_order(self):
+        body = b'"recepcionista"\n\n{"title": "vendedor / recepcionista"}\n"recepcionista"\n'
+        results = self.normalize(body)
+        self.assertEqual([result['title'] for result in results], ['recepcionista', 'vendedor / recepcionista', 'recepcionista'])
+        self.assertEqual(results[0]['normalized_roles'][0]['role_id'], 1104)
+        self.assertEqual(len(results[1]['normalized_roles']), 1)
+        # Repeated roles are normalized once per chunk
+        self.assertEqual(self.role_normalizer.normalize_and_match.call_count, 3)
+
+    def test_report_invalid_lines(self):
+        body = b'"recepcionista"\nnot json\n{"name": "vendedor"}\n"' + b'a' * settings.bulk_max_line_length + b'"\n"recepcionista"'
+        results = self.normalize(body)
+        self.assertEqual([result.get('line') for result in results], [None, 2, 3, 4, None])
+        self.assertTrue(all('error' in result for result in results[1:4]))
+        self.assertEqual(results[4]['title'], 'recepcionista')
+
+    def test_chunks(self):
+        body = b'"recepcionista"\n' * (settings.bulk_chunk_size + 1)
+        chunks = list(self.resource.normalize_stream(io.BytesIO(body), False, None))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[1].count(b'\n'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
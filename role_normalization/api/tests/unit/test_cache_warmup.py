@@ -0,0 +1,69 @@
+import functools
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from role_normalization import settings
+from role_normalization.api.cache_warmup import CacheWarmup
+from role_normalization.api.component_loader import component_loader
+from role_normalization.api.role_norm import RoleNormalization
+
+
+class CacheWarmupTest(unittest.TestCase):
+
+    def setUp(self):
+        # Role matcher replaced, so warm-up doesn't depend on models
+        self.role_normalizer = mock.Mock()
+        self.role_normalizer.normalize_and_match.return_value = ('', None, None)
+        cache_info = functools._CacheInfo(hits=0, misses=3, maxsize=100, currsize=3)
+        self.role_normalizer.normalize_and_match.cache_info.return_value = cache_info
+        self.role_normalizer.normalizer.normalize.cache_info.return_value = cache_info
+        for patcher in [
+            mock.patch.object(RoleNormalization, 'role_normalizer', self.role_normalizer),
+            mock.patch.object(component_loader, 'wait', return_value=True),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        titles_file = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8')
+        titles_file.write('recepcionista / vendedor\n\nrecepcionista / vendedor\nanalista \nmotorista\n')
+        titles_file.close()
+        self.titles_path = titles_file.name
+        self.addCleanup(os.remove, self.titles_path)
+
+    def test_warmup(self):
+        cache_warmup = CacheWarmup(self.titles_path, max_titles=2)
+        self.assertFalse(cache_warmup.ready())
+        with mock.patch.object(settings, 'warmup_enabled', True):
+            cache_warmup.start()
+        cache_warmup.thread.join(timeout=10)
+
+        status = cache_warmup.status()
+        self.assertTrue(status['ready'])
+        self.assertEqual(status['state'], 'done')
+        # Blank and repeated titles skipped, up to max_titles
+        self.assertEqual(status['titles'], 2)
+        self.assertEqual(status['cache_fill'], {'normalize_and_match': 0.03, 'normalize': 0.03})
+        # Replayed with the arguments requests use, spaces kept, so the same cache entries are filled
+        self.assertEqual(
+            [call.args for call in self.role_normalizer.normalize_and_match.call_args_list],
+            [('recepcionista ', None, 'full'), (' vendedor', None, 'full'), ('analista ', None, 'full')])
+
+    def test_missing_titles_file(self):
+        cache_warmup = CacheWarmup(self.titles_path + '.missing')
+        cache_warmup.run()
+        self.assertTrue(cache_warmup.ready())
+        self.assertEqual(cache_warmup.titles, 0)
+
+    def test_disabled(self):
+        cache_warmup = CacheWarmup(self.titles_path)
+        with mock.patch.object(settings, 'warmup_enabled', False):
+            cache_warmup.start()
+        self.assertTrue(cache_warmup.ready())
+        self.assertIsNone(cache_warmup.thread)
+        self.role_normalizer.normalize_and_match.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
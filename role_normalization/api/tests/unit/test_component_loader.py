@@ -0,0 +1,55 @@
+import threading
+import unittest
+
+from role_normalization.api.component_loader import ComponentLoader, ComponentNotReadyError
+
+
+class ComponentLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.component_loader = ComponentLoader()
+        self.loaded = []
+        self.release_model = threading.Event()
+
+        def load_model():
+            self.release_model.wait(timeout=10)
+            self.loaded.append('model')
+            return 'model'
+
+        def load_connection():
+            self.loaded.append('connection')
+            raise ConnectionError('Database unreachable')
+
+        self.component_loader.register('model', load_model)
+        self.component_loader.register('connection', load_connection)
+
+    def test_background_loading(self):
+        self.component_loader.start()
+        # Refused while loading
+        with self.assertRaises(ComponentNotReadyError):
+            self.component_loader.get('model', timeout=0)
+        self.assertEqual(self.component_loader.status()['model'], {'state': 'loading', 'duration_s': None})
+        self.assertFalse(self.component_loader.ready())
+
+        # Requests waiting get the component once loaded
+        self.release_model.set()
+        self.assertEqual(self.component_loader.get('model', timeout=10), 'model')
+        self.assertFalse(self.component_loader.wait(timeout=10))
+        # Loaded in registration order, failures reported
+        self.assertEqual(self.loaded, ['model', 'connection'])
+        self.assertEqual(self.component_loader.failed(), ['connection'])
+        with self.assertRaises(ComponentNotReadyError):
+            self.component_loader.get('connection', timeout=0)
+
+    def test_blocking_loading(self):
+        self.release_model.set()
+        with self.assertRaises(ConnectionError):
+            self.component_loader.start(background=False)
+        self.assertEqual(self.component_loader.get('model', timeout=0), 'model')
+        # Loaded once
+        self.component_loader.start(background=False)
+        self.assertEqual(self.loaded, ['model', 'connection'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import threading
+import unittest
+from unittest import mock
+
+from role_normalization import settings
+from role_normalization.api.events.connection_pool import ConnectionPool, ConnectionPoolTimeoutError
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+        self.pool = ConnectionPool('test', self.connect, max_size=2)
+        self.now = 1000.0
+        patcher = mock.patch('time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self):
+        con = mock.Mock()
+        self.opened.append(con)
+        return con
+
+    def test_connections_reused(self):
+        with self.pool.connection() as con:
+            pass
+        with self.pool.connection() as reused_con:
+            with self.pool.connection() as other_con:
+                pass
+        self.assertIs(reused_con, con)
+        self.assertIsNot(other_con, con)
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(self.pool.size, 2)
+
+    def test_failed_connection_closed(self):
+        with self.assertRaises(ValueError):
+            with self.pool.connection() as con:
+                raise ValueError()
+        con.close.assert_called_once()
+        self.assertEqual(self.pool.size, 0)
+        with self.pool.connection() as other_con:
+            self.assertIsNot(other_con, con)
+
+    def test_size_bounded(self):
+        released = threading.Event()
+        def hold_connection():
+            with self.pool.connection():
+                released.wait(5)
+        threads = [threading.Thread(target=hold_connection) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        try:
+            with mock.patch.object(settings, 'events_db_pool_wait', 0.1):
+                with self.assertRaises(ConnectionPoolTimeoutError):
+                    with self.pool.connection():
+                        pass
+        finally:
+            released.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(self.opened), 2)
+
+    def test_idle_connections_checked_and_recycled(self):
+        with self.pool.connection() as con:
+            pass
+        # Idle for a while: pinged before being used
+        self.now += settings.events_db_health_check_idle + 1
+        with self.pool.connection() as reused_con:
+            pass
+        self.assertIs(reused_con, con)
+        con.ping.assert_called_once_with(reconnect=False)
+
+        # Not responding: closed and replaced
+        con.ping.side_effect = ConnectionError()
+        self.now += settings.events_db_health_check_idle + 1
+        with self.pool.connection() as other_con:
+            pass
+        self.assertIsNot(other_con, con)
+        con.close.assert_called_once()
+
+        # Idle for too long: closed
+        self.now += settings.events_db_max_idle + 1
+        with self.pool.connection() as new_con:
+            pass
+        other_con.close.assert_called_once()
+        other_con.ping.assert_not_called()
+        self.assertEqual((len(self.opened), self.pool.size), (3, 1))
+        self.assertIs(self.opened[-1], new_con)
+
+    def test_reset_in_forked_process(self):
+        with self.pool.connection() as con:
+            pass
+        # Connections of the parent process are left alone
+        with mock.patch('os.getpid', return_value=self.pool.pid + 1):
+            with self.pool.connection() as child_con:
+                pass
+        self.assertIsNot(child_con, con)
+        con.close.assert_not_called()
+        self.assertEqual(self.pool.size, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from role_normalization import settings
+from role_normalization.api.events.events_api_client import EventsApiClient, iter_json_object
+
+
+class StubEventsApi(BaseHTTPRequestHandler):
+
+    """
+    Answers applies of each requested user with 3 applies, after failing the first fail_first requests.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.requests.append((self.client_address, payload['user_ids']))
+            failing = server.fail_first > 0
+            server.fail_first -= 1
+        if failing:
+            body, status = b'{}', 503
+        else:
+            body, status = json.dumps({
+                usr_id: {'applies': [
+                    {'company_id': '1', 'job_id': f'{usr_id}{i}', 'timestamp': 0, 'user_id': usr_id, 'cv_id': 'ção'}
+                    for i in range(3)
+                ]} for usr_id in payload['user_ids']
+            }, indent=1).encode(), 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class EventsApiClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubEventsApi)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.fail_first = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/applies'
+        self.client = EventsApiClient()
+        self.addCleanup(self.client.executor.shutdown)
+
+    def get_applies(self, usr_ids):
+        return self.client.get_applies(self.url, 'user_ids', usr_ids, 0, 200)
+
+    def test_applies_by_concurrent_sub_requests(self):
+        with mock.patch.object(settings, 'events_api_batch_size', 2):
+            applies = self.get_applies(list(range(5)))
+        self.assertEqual(sorted(usr_ids for _, usr_ids in self.server.requests), [['0', '1'], ['2', '3'], ['4']])
+        # Only fields used to infer roles are kept
+        self.assertEqual(applies, {
+            str(usr_id): {'applies': [{'job_id': f'{usr_id}{i}', 'user_id': str(usr_id), 'timestamp': 0} for i in range(3)]}
+            for usr_id in range(5)
+        })
+
+    def test_connection_kept_alive(self):
+        self.get_applies([1])
+        self.get_applies([2])
+        self.assertEqual(len({client_address for client_address, _ in self.server.requests}), 1)
+
+    def test_unavailable_retried(self):
+        self.server.fail_first = 1
+        with mock.patch.object(settings, 'events_api_backoff', 0):
+            self.assertEqual(list(self.get_applies([1])), ['1'])
+            self.server.fail_first = settings.events_api_retries + 1
+            self.assertEqual(self.get_applies([1]), {})
+        self.assertEqual(len(self.server.requests), 2 + settings.events_api_retries + 1)
+
+    def test_json_object_parsed_by_chunks(self):
+        data = json.dumps({'1': {'applies': [{'job_id': 'ção', 'n': 12345, 'ok': True}]}, '2': [], '3': -1.5e3}).encode()
+        for chunk_size in [1, 7, len(data)]:
+            chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+            self.assertEqual(dict(iter_json_object(chunks)), json.loads(data))
+        self.assertEqual(list(iter_json_object([b' { } '])), [])
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_json_object([b'{"1": [1, 2']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import falcon
+import falcon.testing
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from role_normalization import settings
+from role_normalization.api import role_norm_events_bulk
+from role_normalization.api.events.bulk_jobs import BulkJobRunner, BulkJobStore
+from role_normalization.api.role_norm_events_bulk import EventsBulkResults, EventsBulkStatus, EventsBulkSubmit
+
+
+class RunnerStopped(BaseException):
+
+    """
+    Stops a runner as if its worker process exited.
+    """
+
+
+class BulkJobsTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.store = BulkJobStore(tmp_dir.name)
+        self.chunks = []
+        self.runner = BulkJobRunner(self.store, {'jobs': self.normalize, 'users': self.normalize})
+        patcher = mock.patch.object(settings, 'events_bulk_chunk_size', 1000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def normalize(self, ids):
+        self.chunks.append(ids)
+        return [[id, id % 3] for id in dict.fromkeys(ids)]
+
+    def results(self, bulk_id):
+        status = self.store.status(bulk_id)
+        return [json.loads(line) for line in b''.join(self.store.read_results(bulk_id, 0, status['results_size'])).splitlines()]
+
+    def test_run_by_chunks(self):
+        status = self.store.submit('jobs', range(1, 2501), 'test')
+        self.assertEqual((status['state'], status['total'], status['processed']), ('queued', 2500, 0))
+        self.runner.run_pending()
+
+        self.assertEqual([len(chunk) for chunk in self.chunks], [1000, 1000, 500])
+        status = self.store.status(status['bulk_id'])
+        self.assertEqual((status['state'], status['processed'], status['inferred']), ('done', 2500, 1667))
+        self.assertEqual(self.results(status['bulk_id']), [{'id': str(id), 'role_id': id % 3} for id in range(1, 2501)])
+        # Finished jobs aren't run again
+        self.runner.run_pending()
+        self.assertEqual(len(self.chunks), 3)
+
+    def test_resumed_from_last_chunk(self):
+        bulk_id = self.store.submit('users', range(1, 2501), 'test')['bulk_id']
+        normalize = self.normalize
+        def stop_on_second_chunk(ids):
+            if len(self.chunks) == 1:
+                # Results of the chunk written, not committed
+                with open(self.store.job_file(bulk_id, 'results.ndjson'), 'ab') as f:
+                    f.write(b'{"id": "1001", "ro')
+                raise RunnerStopped()
+            return normalize(ids)
+        self.runner.normalize['users'] = stop_on_second_chunk
+        with self.assertRaises(RunnerStopped):
+            self.runner.run_pending()
+        status = self.store.status(bulk_id)
+        self.assertEqual((status['state'], status['processed']), ('running', 1000))
+        self.assertEqual(len(self.results(bulk_id)), 1000)
+
+        # Another runner takes over once the lock is released
+        self.runner.normalize['users'] = normalize
+        self.runner.run_pending()
+        self.assertEqual([chunk[0] for chunk in self.chunks], [1, 1001, 2001])
+        self.assertEqual(self.results(bulk_id), [{'id': str(id), 'role_id': id % 3} for id in range(1, 2501)])
+
+    def test_failed_chunks_retried(self):
+        bulk_id = self.store.submit('jobs', [1, 2], 'test')['bulk_id']
+        self.runner.normalize['jobs'] = mock.Mock(side_effect=[ConnectionError('Unavailable'), [[1, 1], [2, 2]]])
+        with mock.patch('time.sleep'):
+            self.runner.run_pending()
+        self.assertEqual(self.store.status(bulk_id)['state'], 'done')
+
+        # Retried later from its last chunk once every attempt of a chunk failed, failed after
+        # events_bulk_job_attempts in a row
+        bulk_id = self.store.submit('jobs', [1, 2, 3], 'test')['bulk_id']
+        self.runner.normalize['jobs'] = mock.Mock(side_effect=[[[1, 1], [2, 2]]] + [ConnectionError('Unavailable')] * 9)
+        with mock.patch.object(settings, 'events_bulk_chunk_size', 2), \
+                mock.patch.object(settings, 'events_bulk_job_attempts', 3), mock.patch('time.sleep'):
+            self.runner.run_pending()
+            status = self.store.status(bulk_id)
+            self.assertEqual((status['state'], status['processed'], status['attempts'], status['error']), ('retrying', 2, 1, 'Unavailable'))
+            self.assertAlmostEqual(status['retry_at'], time.time() + settings.events_bulk_retry_interval, delta=5)
+            # Not run again until retry_at
+            self.runner.run_pending()
+            self.assertEqual(self.runner.normalize['jobs'].call_count, 1 + settings.events_bulk_attempts)
+
+            for attempts in [2, 3]:
+                with mock.patch('time.time', return_value=status['retry_at'] + 1):
+                    self.runner.run_pending()
+                status = self.store.status(bulk_id)
+                self.assertEqual((status['processed'], status['attempts']), (2, attempts))
+        self.assertEqual(self.runner.normalize['jobs'].call_count, 1 + 3 * settings.events_bulk_attempts)
+        self.assertEqual((status['state'], status['error'], status['retry_at']), ('failed', 'Unavailable', None))
+        self.assertEqual(self.results(bulk_id), [{'id': '1', 'role_id': 1}, {'id': '2', 'role_id': 2}])
+
+    def test_expired_jobs_removed(self):
+        bulk_id = self.store.submit('jobs', [1], 'test')['bulk_id']
+        self.runner.run_pending()
+        self.store.remove_expired()
+        self.assertIsNotNone(self.store.status(bulk_id))
+        with mock.patch('time.time', return_value=time.time() + settings.events_bulk_retention + 1):
+            self.store.remove_expired()
+        self.assertIsNone(self.store.status(bulk_id))
+        self.assertEqual(os.listdir(self.store.path), [])
+
+    def test_api(self):
+        app = falcon.App()
+        app.add_route('/bulk/jobs', EventsBulkSubmit('jobs'))
+        app.add_route('/bulk/{bulk_id}', EventsBulkStatus())
+        app.add_route('/bulk/{bulk_id}/results', EventsBulkResults())
+        client = falcon.testing.TestClient(app)
+        ndjson = {'Content-Type': 'application/x-ndjson'}
+
+        with mock.patch.object(role_norm_events_bulk, 'bulk_job_store', self.store):
+            result = client.simulate_post('/bulk/jobs', params={'origin': 'test'}, headers=ndjson, body='1\n"2"\n\nx\n')
+            self.assertEqual((result.status_code, result.json['description']), (400, 'Line 4: expected an ID'))
+            result = client.simulate_post('/bulk/jobs', params={'origin': 'test'}, json={'job_ids': [1, 2, 3]})
+            self.assertEqual((result.status_code, result.json['total']), (202, 3))
+
+            result = client.simulate_post('/bulk/jobs', params={'origin': 'test'}, headers=ndjson, body='1\n"2"\n\n3')
+            self.assertEqual(result.status_code, 202)
+            bulk_id = result.json['bulk_id']
+            self.assertEqual(result.headers['Location'], f'/v1/role_normalization/events/bulk/{bulk_id}')
+            self.assertEqual(client.simulate_get(f'/bulk/{bulk_id}').json['state'], 'queued')
+            self.assertEqual(client.simulate_get('/bulk/0123').status_code, 404)
+
+            result = client.simulate_get(f'/bulk/{bulk_id}/results')
+            self.assertEqual((result.text, result.headers['X-Bulk-Next-Offset']), ('', '0'))
+
+            self.runner.run_pending()
+            self.assertEqual(client.simulate_get(f'/bulk/{bulk_id}').json['processed'], 3)
+            result = client.simulate_get(f'/bulk/{bulk_id}/results', params={'offset': 0, 'wait': 1})
+            self.assertEqual(result.headers['X-Bulk-State'], 'done')
+            self.assertEqual([json.loads(line) for line in result.text.splitlines()], [
+                {'id': '1', 'role_id': 1}, {'id': '2', 'role_id': 2}, {'id': '3', 'role_id': 0}])
+            # Read from the next offset, nothing left
+            result = client.simulate_get(f'/bulk/{bulk_id}/results', params={'offset': result.headers['X-Bulk-Next-Offset']})
+            self.assertEqual(result.text, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import falcon
+import falcon.testing
+import functools
+import json
+import unittest
+from unittest import mock
+
+from role_normalization import settings
+from role_normalization.api import latency_budget
+from role_normalization.api.latency_budget import LatencyBudget
+from role_normalization.api.models.role_matcher import ProcessedRole
+from role_normalization.api.role_norm import RequestParams, RequestPayload, RoleNormalization
+
+
+class LatencyBudgetTest(unittest.TestCase):
+
+    def test_quality_degrades_as_budget_is_used(self):
+        with mock.patch.object(latency_budget.time, 'perf_counter', return_value=100.0) as perf_counter:
+            budget = LatencyBudget(100)
+            self.assertEqual(budget.quality(), 'full')
+            perf_counter.return_value = 100.0 + (100 - settings.latency_budget_full_min_ms + 1) / 1000
+            self.assertEqual(budget.quality(), 'reduced')
+            perf_counter.return_value = 100.0 + (100 - settings.latency_budget_reduced_min_ms + 1) / 1000
+            self.assertEqual(budget.quality(), 'minimal')
+            self.assertFalse(budget.exhausted())
+            perf_counter.return_value = 200.0
+            self.assertEqual(budget.quality(), 'minimal')
+            self.assertTrue(budget.exhausted())
+
+    def test_unlimited_budget(self):
+        budget = LatencyBudget.from_request(falcon.testing.create_req())
+        self.assertIsNone(budget.budget_ms)
+        self.assertEqual(budget.quality(), 'full')
+        self.assertFalse(budget.exhausted())
+
+    def test_from_request(self):
+        headers = {settings.latency_budget_header: '50'}
+        self.assertEqual(LatencyBudget.from_request(falcon.testing.create_req(headers=headers)).budget_ms, 50)
+        # Query parameter takes precedence over header
+        self.assertEqual(LatencyBudget.from_request(falcon.testing.create_req(headers=headers), 80).budget_ms, 80)
+        for invalid_budget in ['0', '-10', 'fast']:
+            with self.assertRaises(falcon.HTTPInvalidHeader):
+                LatencyBudget.from_request(falcon.testing.create_req(headers={settings.latency_budget_header: invalid_budget}))
+
+    def test_roles_matched_once_budget_exhausted(self):
+        # Role matcher replaced, so results don't depend on models
+        roles = {
+            'Vendedor': ProcessedRole(1, 'Vendedor', 'vendedor', [], [], [], [], []),
+            'Caixa': ProcessedRole(2, 'Caixa', 'caixa', [], [], [], [], []),
+        }
+        role_normalizer = mock.Mock()
+        cache_info = functools._CacheInfo(hits=0, misses=0, maxsize=8192, currsize=0)
+        role_normalizer.normalize_and_match.cache_info.return_value = cache_info
+        role_normalizer.normalizer.normalize.cache_info.return_value = cache_info
+        resource = RoleNormalization()
+        resource.role_normalizer = role_normalizer
+
+        req = falcon.testing.create_req()
+        req.context['json'] = RequestPayload(titles=['Vendedor', 'Caixa/Vendedor'])
+        req.context['query'] = RequestParams(latency_budget_ms=100)
+        resp = falcon.Response()
+        with mock.patch.object(latency_budget.time, 'perf_counter', return_value=100.0) as perf_counter:
+            def normalize_and_match(role, perfil_ids_filter, quality):
+                # Budget used up once the first role is normalized
+                perf_counter.return_value = 200.0
+                return role.lower(), roles[role], 'database'
+            role_normalizer.normalize_and_match.side_effect = normalize_and_match
+            resource.normalize_roles(req, resp)
+        # Still matched, at minimal quality, Vendedor normalized once, keeping its match in both titles
+        self.assertEqual(role_normalizer.normalize_and_match.call_args_list, [
+            mock.call('Vendedor', None, 'full'), mock.call('Caixa', None, 'minimal')])
+        self.assertEqual({title: [role['role_id'] for role in roles] for title, roles in json.loads(resp.render_body()).items()},
+                         {'Vendedor': [1], 'Caixa/Vendedor': [2, 1]})
+        # Only the second title is degraded, by Caixa
+        self.assertEqual(resp.get_header(settings.latency_budget_degraded_header), '1')
+
+if __name__ == '__main__':
+    unittest.main()
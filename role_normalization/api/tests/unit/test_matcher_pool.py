@@ -0,0 +1,89 @@
+import asyncio
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from role_normalization.api import matcher_pool
+from role_normalization.api.matcher_pool import MatcherPool, MatcherPoolFullError
+
+
+def fake_normalize_and_match_batch(batch: list) -> list:
+    return [(role.lower(), None, None) for role, _, _ in batch]
+
+
+def crashing_normalize_and_match_batch(batch: list) -> list:
+    # Pool process killed, as by the OOM killer, by a batch with role "crash"
+    if any(role == 'crash' for role, _, _ in batch):
+        os._exit(1)
+    return fake_normalize_and_match_batch(batch)
+
+
+class MatcherPoolTest(unittest.TestCase):
+
+    def run_with_pool(self, coroutine_function, **pool_kwargs):
+        # Threads instead of processes, so models aren't needed
+        async def run():
+            pool = MatcherPool(workers=1, **pool_kwargs)
+            pool.executor = ThreadPoolExecutor(max_workers=1)
+            pool.batch_semaphore = asyncio.Semaphore(2)
+            try:
+                return await coroutine_function(pool)
+            finally:
+                await pool.shutdown()
+        return asyncio.run(run())
+
+    def test_coalesce_concurrent_requests(self):
+        batches = []
+        def normalize_and_match_batch(batch):
+            batches.append(batch)
+            return fake_normalize_and_match_batch(batch)
+
+        async def requests(pool):
+            return await asyncio.gather(
+                pool.normalize_and_match(['Recepcionista', 'Analista', 'Recepcionista']),
+                pool.normalize_and_match(['Analista', 'Vendedor']),
+            )
+
+        with mock.patch.object(matcher_pool, '_normalize_and_match_batch', normalize_and_match_batch):
+            first_matches, second_matches = self.run_with_pool(requests, batch_max_delay=0.01)
+
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(sorted(role for role, _, _ in batches[0]), ['Analista', 'Recepcionista', 'Vendedor'])
+        self.assertEqual(first_matches['Recepcionista'], ('recepcionista', None, None))
+        self.assertEqual(second_matches['Vendedor'], ('vendedor', None, None))
+
+    def test_refuse_requests_above_capacity(self):
+        async def requests(pool):
+            return await asyncio.gather(
+                pool.normalize_and_match(['Recepcionista', 'Analista']),
+                pool.normalize_and_match(['Vendedor']),
+                return_exceptions=True,
+            )
+
+        with mock.patch.object(matcher_pool, '_normalize_and_match_batch', fake_normalize_and_match_batch):
+            first_matches, second_matches = self.run_with_pool(requests, max_pending_roles=2)
+
+        self.assertEqual(first_matches['Analista'], ('analista', None, None))
+        self.assertIsInstance(second_matches, MatcherPoolFullError)
+
+    def test_recreate_broken_pool(self):
+        async def requests(pool):
+            # Processes instead of threads, without models
+            pool.executor = pool._create_executor()
+            broken_executor = pool.executor
+            crashed = await asyncio.gather(pool.normalize_and_match(['crash']), return_exceptions=True)
+            self.assertIsInstance(crashed[0], BrokenProcessPool)
+            self.assertIsNot(pool.executor, broken_executor)
+            return await pool.normalize_and_match(['Vendedor'])
+
+        with mock.patch.object(matcher_pool, '_normalize_and_match_batch', crashing_normalize_and_match_batch), \
+                mock.patch.object(matcher_pool, '_init_pool_worker', lambda: None):
+            matches = self.run_with_pool(requests, batch_max_delay=0.01)
+        # Later requests are normalized by the new pool
+        self.assertEqual(matches['Vendedor'], ('vendedor', None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import falcon
+import falcon.testing
+import unittest
+from prometheus_client import REGISTRY
+
+from role_normalization.api import metrics
+
+
+class PingResource:
+
+    def on_get(self, req, resp):
+        resp.media = {'status': 'OK'}
+
+
+class MetricsTest(unittest.TestCase):
+
+    def sample_value(self, name: str, labels: dict) -> float:
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def test_observe_matches(self):
+        before = {
+            match_type: self.sample_value('role_norm_matches_total', {'match_type': match_type})
+            for match_type in ['database', 'ahocorasick', 'none']
+        }
+        metrics.observe_matches([
+            ('recepcionista', object(), 'database'),
+            ('analista', object(), 'database'),
+            ('vendedor externo', object(), 'ahocorasick'),
+            ('xyz', None, None),
+        ])
+        self.assertEqual(self.sample_value('role_norm_matches_total', {'match_type': 'database'}) - before['database'], 2)
+        self.assertEqual(self.sample_value('role_norm_matches_total', {'match_type': 'ahocorasick'}) - before['ahocorasick'], 1)
+        self.assertEqual(self.sample_value('role_norm_matches_total', {'match_type': 'none'}) - before['none'], 1)
+
+    def test_request_latency(self):
+        app = falcon.App(middleware=[metrics.MetricsMiddleware()])
+        app.add_route('/ping', PingResource())
+        client = falcon.testing.TestClient(app)
+        labels = {'endpoint': '/ping', 'status': '200'}
+        before = self.sample_value('role_norm_request_duration_seconds_count', labels)
+        client.simulate_get('/ping')
+        client.simulate_get('/unknown')
+        self.assertEqual(self.sample_value('role_norm_request_duration_seconds_count', labels) - before, 1)
+        self.assertGreater(self.sample_value('role_norm_request_duration_seconds_count', {'endpoint': 'unmatched', 'status': '404'}), 0)
+
+        data, content_type = metrics.render()
+        self.assertTrue(content_type.startswith('text/plain'))
+        self.assertIn(b'role_norm_request_duration_seconds_bucket{endpoint="/ping"', data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from role_normalization.api.models.model_bundle import ModelBundle, ModelBundleError
+
+
+class ModelBundleTest(unittest.TestCase):
+
+    parts = {
+        'gazetteers': {'stopwords': {'de', 'da'}},
+        'dictionary': {'analista', 'recepcionista'},
+        'spell_checker': ['analista', 'recepcionista'],
+        'catalog': {'norm_main_roles_mapping': {'recepcionista': 1104}},
+        'automaton': b'automaton',
+    }
+
+    def test_write_and_load(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bundle_filepath = os.path.join(temp_dir, 'role_model.bundle')
+            written_bundle = ModelBundle.write(bundle_filepath, self.parts)
+            loaded_bundle = ModelBundle.load(bundle_filepath)
+            self.assertEqual(written_bundle.content_hash, loaded_bundle.content_hash)
+            self.assertEqual(loaded_bundle['catalog'], self.parts['catalog'])
+            self.assertNotIn('embeddings', loaded_bundle)
+
+    def test_missing_required_part(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            parts = {k: v for k, v in self.parts.items() if k != 'automaton'}
+            with self.assertRaises(ModelBundleError):
+                ModelBundle.write(os.path.join(temp_dir, 'role_model.bundle'), parts)
+
+    def test_refuse_corrupted_part(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bundle_filepath = os.path.join(temp_dir, 'role_model.bundle')
+            ModelBundle.write(bundle_filepath, self.parts)
+            with open(bundle_filepath, 'r+b') as f:
+                f.seek(-1, os.SEEK_END)
+                last_byte = f.read(1)
+                f.seek(-1, os.SEEK_END)
+                f.write(bytes([last_byte[0] ^ 1]))
+            with self.assertRaises(ModelBundleError):
+                ModelBundle.load(bundle_filepath)
+
+    def test_refuse_other_format_version(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bundle_filepath = os.path.join(temp_dir, 'role_model.bundle')
+            ModelBundle.write(bundle_filepath, self.parts)
+            format_version = ModelBundle.format_version
+            try:
+                ModelBundle.format_version = format_version + 1
+                with self.assertRaises(ModelBundleError):
+                    ModelBundle.load(bundle_filepath)
+            finally:
+                ModelBundle.format_version = format_version
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from symspellpy import SymSpell
+
+from role_normalization import settings
+from role_normalization.api.cache_warmup import cache_warmup
+from role_normalization.api.component_loader import component_loader
+from role_normalization.api.model_reloader import ModelReloader
+from role_normalization.api.models.aho_corasick_matcher import AhoCorasickMatcher
+from role_normalization.api.models.role_matcher import ProcessedRole, RoleMatcher
+from role_normalization.api.models.role_normalizer import RoleNormalizer
+from role_normalization.api.role_norm import RoleNormalization
+
+
+class ModelReloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        trigger_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(trigger_dir.cleanup)
+        patcher = mock.patch.object(settings, 'model_reload_trigger_path', trigger_dir.name + '/reload')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.model_reloader = ModelReloader()
+        self.model_reloader.trigger_mtime = self.model_reloader._trigger_mtime()
+        self.model_reloader.gazetteers_signature = self.model_reloader._gazetteers_signature()
+
+    def test_check_reloads_once_requested(self):
+        with mock.patch.object(self.model_reloader, 'reload') as reload:
+            self.model_reloader.check()
+            reload.assert_not_called()
+            self.model_reloader.request_reload()
+            self.model_reloader.check()
+            reload.assert_called_once_with(reread_gazetteers=False)
+            # Requested once, reloaded once
+            self.model_reloader.check()
+            self.assertEqual(reload.call_count, 1)
+
+    def test_reloads_limited_by_min_interval(self):
+        with mock.patch.object(self.model_reloader, 'reload') as reload:
+            self.model_reloader.swapped_at = time.monotonic()
+            self.model_reloader.request_reload()
+            self.model_reloader.check()
+            reload.assert_not_called()
+            # Changes found meanwhile are reloaded once it elapsed
+            with mock.patch.object(settings, 'model_reload_min_interval', 0):
+                self.model_reloader.check()
+            reload.assert_called_once_with(reread_gazetteers=False)
+
+    def normalizer(self, words: list) -> RoleNormalizer:
+        spell_checker = SymSpell()
+        for word in words:
+            spell_checker.create_dictionary_entry(word, 1)
+        gazetteers = {name: [] for name in ['special_character_mapping', 'thesaurus_mapping', 'conjugation_mapping',
+                                            'gender_mapping', 'plural_mapping', 'sorted_locations']}
+        gazetteers['stopwords'] = set()
+        return RoleNormalizer([], {'gazetteers': gazetteers, 'dictionary': set(words), 'spell_checker': spell_checker})
+
+    def test_updated_locations_use_reread_stopwords(self):
+        normalizer = self.normalizer(['vendedor'])
+        self.assertIn('abadia', normalizer.updated(['Vendedor']).sorted_locations)
+        gazetteers = dict(normalizer.gazetteers, stopwords={'abadia'})
+        with mock.patch.object(RoleNormalizer, '_read_gazetteers', return_value=gazetteers):
+            updated = normalizer.updated(['Vendedor'], reread_gazetteers=True)
+        # Words turned into stop words are no longer locations
+        self.assertIn('abadia', updated.stopwords)
+        self.assertNotIn('abadia', updated.sorted_locations)
+
+    def role_matcher(self, generation: int, normalizer: RoleNormalizer, roles: list) -> RoleMatcher:
+        role_matcher = object.__new__(RoleMatcher)
+        role_matcher.__dict__.update({
+            'generation': generation,
+            'normalizer': normalizer,
+            'norm_main_roles_mapping': {norm_role.processed_title: norm_role for norm_role in roles},
+            'norm_similar_roles_mapping': {},
+            'aho_corasick_matching_enabled': False,
+            'w2v_matching_enabled': False,
+        })
+        return role_matcher
+
+    def test_swap(self):
+        recepcionista = ProcessedRole(1104, 'Recepcionista', 'recepcionista', [], [], [47], [4], [1])
+        normalizer = self.normalizer(['recepcionista', 'vendedor'])
+        current = self.role_matcher(1, normalizer, [recepcionista, ProcessedRole(2, 'Vendedor', 'vendedor', [], [], [], [], [])])
+        # Vendedor changed role, barista was added along with its word
+        generation = self.role_matcher(2, self.normalizer(['recepcionista', 'vendedor', 'barista']), [
+            recepcionista, ProcessedRole(3, 'Vendedor', 'vendedor', [], [], [], [], []),
+            ProcessedRole(4, 'Barista', 'barista', [], [], [], [], [])])
+        for role in ['Recepcionista', 'Vendedor', 'Barista', 'Vendedr']:
+            current.normalize_and_match(role, None, 'full')
+        RoleNormalization.response_fragments.role(recepcionista, 'database', False, None)
+        RoleNormalization.response_fragments.role(current.normalize_and_match('Vendedor', None, 'full')[1], 'database', False, None)
+
+        with mock.patch.object(RoleMatcher, '_instance', current), \
+                mock.patch.object(component_loader, 'replace') as replace, \
+                mock.patch.object(settings, 'warmup_enabled', True), \
+                mock.patch.object(cache_warmup, 'replay', return_value=0) as replay:
+            self.model_reloader.swap(current, generation, {'changed_role_ids': [2, 3, 4], 'added_titles': 1})
+            self.assertIs(RoleMatcher._instance, generation)
+        replace.assert_called_once_with('role_matcher', generation)
+        # Dropped entries are refilled
+        replay.assert_called_once_with()
+        self.assertEqual([key[0] for key in RoleNormalization.response_fragments.roles].count(1104), 1)
+        self.assertNotIn(2, [key[0] for key in RoleNormalization.response_fragments.roles])
+
+        # Unaffected entries are still hits: the match of a role that didn't change, normalizations
+        # of titles without new words nor typos
+        match_info = RoleMatcher.normalize_and_match.cache_info()
+        normalize_info = RoleNormalizer.normalize.cache_info()
+        self.assertEqual(generation.normalize_and_match('Recepcionista', None, 'full')[1], recepcionista)
+        self.assertEqual(RoleMatcher.normalize_and_match.cache_info().hits, match_info.hits + 1)
+        self.assertEqual(generation.normalize_and_match('Vendedor', None, 'full')[1].role_id, 3)
+        self.assertEqual(generation.normalize_and_match('Barista', None, 'full')[1].role_id, 4)
+        self.assertEqual(RoleMatcher.normalize_and_match.cache_info().misses, match_info.misses + 2)
+        self.assertEqual(RoleNormalizer.normalize.cache_info().hits, normalize_info.hits + 1)
+        self.assertEqual(RoleNormalizer.normalize.cache_info().misses, normalize_info.misses + 1)
+        generation.normalize_and_match('Vendedr', None, 'full')
+        self.assertEqual(RoleNormalizer.normalize.cache_info().misses, normalize_info.misses + 2)
+
+        # Nothing dropped, nothing replayed
+        with mock.patch.object(component_loader, 'replace'), \
+                mock.patch.object(settings, 'warmup_enabled', True), \
+                mock.patch.object(cache_warmup, 'replay', return_value=0) as replay:
+            next_generation = self.role_matcher(3, generation.normalizer, list(generation.norm_main_roles_mapping.values()))
+            with mock.patch.object(RoleMatcher, '_instance', generation):
+                self.model_reloader.swap(generation, next_generation, {'changed_role_ids': [], 'added_titles': 0})
+        replay.assert_not_called()
+        self.assertEqual(next_generation.normalize_and_match('Vendedor', None, 'full')[1].role_id, 3)
+        self.assertEqual(RoleMatcher.normalize_and_match.cache_info().hits, match_info.hits + 2)
+
+    def test_patched_automaton(self):
+        aho_corasick_matcher = AhoCorasickMatcher({'analista dado': None, 'vendedor': None}, {})
+        patched = aho_corasick_matcher.patched({'analista sistema'}, {'vendedor'})
+        self.assertEqual(patched.match('analista sistema sr'), 'analista sistema')
+        self.assertIsNone(patched.match('vendedor externo'))
+        # The matcher patched is left unchanged
+        self.assertEqual(aho_corasick_matcher.match('vendedor externo'), 'vendedor')
+        self.assertIsNone(aho_corasick_matcher.match('analista sistema sr'))
+
+
+if __name__ == '__main__':
+    unittest.main()
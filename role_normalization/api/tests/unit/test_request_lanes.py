@@ -0,0 +1,75 @@
+import threading
+import unittest
+
+from role_normalization.api.request_lanes import LaneFullError, RequestLanes
+
+
+class RequestLanesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.request_lanes = RequestLanes(
+            lanes_settings={
+                'interactive': {'max_concurrency': 1, 'max_queued': 1, 'max_wait': 5.0, 'priority': 0},
+                'batch': {'max_concurrency': 1, 'max_queued': 1, 'max_wait': 0.05, 'priority': 1},
+            },
+            batch_origins=('routine_job_role',))
+
+    def hold_slot(self, lane) -> tuple:
+        # Hold a slot of a lane in another thread until the returned event is set
+        admitted = threading.Event()
+        release = threading.Event()
+        def run():
+            with self.request_lanes.admit(lane):
+                admitted.set()
+                release.wait()
+        thread = threading.Thread(target=run)
+        thread.start()
+        admitted.wait()
+        return release, thread
+
+    def test_lane_selection(self):
+        self.assertEqual(self.request_lanes.lane(origin='routine_job_role').name, 'batch')
+        self.assertEqual(self.request_lanes.lane(origin='user_cv_form').name, 'interactive')
+        self.assertEqual(self.request_lanes.lane(origin=None).name, 'interactive')
+        self.assertEqual(self.request_lanes.lane('batch', 'user_cv_form').name, 'batch')
+        self.assertEqual(self.request_lanes.lane('unknown', 'routine_job_role').name, 'batch')
+
+    def test_refuse_after_max_wait(self):
+        batch_lane = self.request_lanes.lanes['batch']
+        release, thread = self.hold_slot(batch_lane)
+        with self.assertRaises(LaneFullError):
+            with self.request_lanes.admit(batch_lane):
+                pass
+        release.set()
+        thread.join()
+        with self.request_lanes.admit(batch_lane):
+            pass
+        stats = self.request_lanes.stats()['batch']
+        self.assertEqual((stats['admitted'], stats['rejected'], stats['active'], stats['queued']), (2, 1, 0, 0))
+
+    def test_batch_refused_while_interactive_waits(self):
+        interactive_lane = self.request_lanes.lanes['interactive']
+        release, thread = self.hold_slot(interactive_lane)
+        # Second interactive request waits for the slot
+        def wait_for_slot():
+            with self.request_lanes.admit(interactive_lane):
+                pass
+        waiting = threading.Thread(target=wait_for_slot)
+        waiting.start()
+        while not interactive_lane.queued:
+            pass
+        with self.assertRaises(LaneFullError):
+            with self.request_lanes.admit(self.request_lanes.lanes['batch']):
+                pass
+        # Interactive queue is full too
+        with self.assertRaises(LaneFullError):
+            with self.request_lanes.admit(interactive_lane):
+                pass
+        release.set()
+        thread.join()
+        waiting.join()
+        self.assertEqual(self.request_lanes.stats()['batch']['rejected'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
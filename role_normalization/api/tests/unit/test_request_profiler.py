@@ -0,0 +1,53 @@
+import falcon
+import falcon.testing
+import json
+import unittest
+from collections import OrderedDict
+
+from role_normalization import settings
+from role_normalization.api.models.stage_timer import StageTimer
+from role_normalization.api.request_profiler import RequestProfiler
+
+
+class RequestProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.request_profiler = RequestProfiler()
+        self.request_profiler.debug_token = 'token'
+
+    def test_requested(self):
+        self.assertFalse(self.request_profiler.requested(falcon.testing.create_req()))
+        self.assertTrue(self.request_profiler.requested(falcon.testing.create_req(headers={settings.profile_header: 'token'})))
+        with self.assertRaises(falcon.HTTPForbidden):
+            self.request_profiler.requested(falcon.testing.create_req(headers={settings.profile_header: 'other'}))
+        # Disabled if no debug token is configured
+        self.request_profiler.debug_token = ''
+        with self.assertRaises(falcon.HTTPForbidden):
+            self.request_profiler.requested(falcon.testing.create_req(headers={settings.profile_header: ''}))
+
+    def test_report(self):
+        stage_timer = StageTimer()
+        stage_timer.lap('fold')
+        stage_timer.count('symspell_lookups', 2)
+        stage_timer.lap('typo_correction')
+        stage_timer.lap('fold')
+        role_report = stage_timer.report()
+        self.assertEqual(list(role_report['stages_ms']), ['fold', 'typo_correction'])
+        self.assertEqual(role_report['counters'], {'symspell_lookups': 2})
+
+        title_roles = OrderedDict([('recepcionista / vendedor', ['recepcionista ', ' vendedor'])])
+        matches = {'recepcionista ': ('recepcionista', object(), 'database'), ' vendedor': ('', None, None)}
+        resp = falcon.Response()
+        # ' vendedor' wasn't normalized, as if the latency budget was used up
+        profile = self.request_profiler.report(resp, title_roles, matches, {'recepcionista ': role_report})
+
+        title_profile = profile['titles']['recepcionista / vendedor']
+        self.assertEqual(title_profile['total_ms'], role_report['total_ms'])
+        self.assertEqual(title_profile['roles']['recepcionista ']['match_type'], 'database')
+        self.assertEqual(title_profile['roles'][' vendedor'], {'total_ms': 0.0, 'match_type': None})
+        self.assertEqual(resp.get_header('X-Profile-Id'), profile['profile_id'])
+        self.assertEqual(json.loads(resp.get_header('X-Profile')), profile)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import json
+import unittest
+
+from role_normalization.api.models.role_matcher import ProcessedRole
+from role_normalization.api.response_fragments import ResponseFragments, normalized_role_object
+
+
+class ResponseFragmentsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.norm_role = ProcessedRole(1104, 'Recepcionista Júnior', 'recepcionista', ['junior'], [], [47, 73], [4, 5], [1, 4])
+        self.response_fragments = ResponseFragments()
+
+    def test_role_matches_response_object(self):
+        for include_match_type in [False, True]:
+            for perfil_ids_filter in [None, [1, 4]]:
+                expected = normalized_role_object(self.norm_role, perfil_ids_filter)
+                if include_match_type:
+                    expected['match_type'] = 'database'
+                fragment = self.response_fragments.role(self.norm_role, 'database', include_match_type, perfil_ids_filter)
+                self.assertEqual(json.loads(fragment), json.loads(json.dumps(expected)))
+
+    def test_role_cached_per_perfil_ids_filter(self):
+        self.response_fragments.role(self.norm_role, 'database', False, None)
+        self.response_fragments.role(self.norm_role, 'ahocorasick', True, None)
+        self.response_fragments.role(self.norm_role, 'database', False, [1])
+        self.assertEqual(len(self.response_fragments.roles), 2)
+
+    def test_object(self):
+        fragment = self.response_fragments.role(self.norm_role, 'database', False, None)
+        encoded = self.response_fragments.object({'recepcionista "jr"': [fragment, fragment], 'outro': [fragment]})
+        decoded = json.loads(encoded)
+        self.assertEqual(list(decoded), ['recepcionista "jr"', 'outro'])
+        self.assertEqual(decoded['recepcionista "jr"'][1]['role_id'], 1104)
+        self.assertEqual(json.loads(self.response_fragments.object({})), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from role_normalization import settings
+from role_normalization.api.events.role_cache import RoleCache, SharedRoleCache
+
+
+class RoleCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fetched = []
+        self.now = 1000.0
+        patcher = mock.patch('time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, ids):
+        self.fetched.append(ids)
+        return {str(id): int(id) * 10 for id in ids if int(id) < 100}
+
+    def test_expired_and_least_recently_used_dropped(self):
+        cache = RoleCache('test')
+        self.assertEqual(cache.get_roles([1, 2, 100], self.fetch), {'1': 10, '2': 20})
+        self.now += settings.events_roles_cache_negative_ttl + 1
+        # IDs without role expire first
+        self.assertEqual(cache.get_roles([1, 2, 100], self.fetch), {'1': 10, '2': 20})
+        self.assertEqual(self.fetched, [[1, 2, 100], [100]])
+
+        self.now += settings.events_roles_cache_ttl + 1
+        with mock.patch.object(settings, 'events_roles_cache_max_size', 2):
+            cache.get_roles([3], self.fetch)
+            self.assertEqual(list(cache.roles), ['100', '3'])
+        self.assertEqual(cache.get_roles([1], self.fetch), {'1': 10})
+        self.assertEqual(self.fetched[-1], [1])
+
+    def test_shared_by_workers(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        shared = SharedRoleCache(os.path.join(tmp_dir.name, 'roles.db'))
+        worker_caches = [RoleCache('test', shared), RoleCache('test', shared)]
+
+        self.assertEqual(worker_caches[0].get_roles([1, 100], self.fetch), {'1': 10})
+        self.assertEqual(worker_caches[1].get_roles([1, 2, 100], self.fetch), {'1': 10, '2': 20})
+        self.assertEqual(self.fetched, [[1, 100], [2]])
+        self.assertEqual((worker_caches[1].hits, worker_caches[1].shared_hits, worker_caches[1].misses), (2, 2, 1))
+
+        # Caches of another name aren't shared
+        self.assertEqual(RoleCache('other', shared).get_roles([1], self.fetch), {'1': 10})
+        self.assertEqual(self.fetched[-1], [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,283 @@
+from concurrent import futures
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from role_normalization import settings
+from role_normalization.api.events import role_normalizer_events
+from role_normalization.api.events.role_cache import RoleCache
+from role_normalization.api.events.role_normalizer_events import DbConnection, RoleNormalizerEvents
+from role_normalization.api.events.role_snapshot import RoleSnapshots
+from role_normalization.api.events.vote_counters import VoteCounters
+
+
+class RoleNormalizerEventsTest(unittest.TestCase):
+
+    def setUp(self):
+        # Database connections and secrets replaced, lookups stubbed below
+        with mock.patch.object(role_normalizer_events, 'DbConnection'), \
+                mock.patch.multiple(settings, mysql_user=str, mysql_passwd=str, mysql_read_host=str, mysql_read_applies_host=str):
+            self.rne = RoleNormalizerEvents()
+        self.addCleanup(self.rne.executor.shutdown)
+        self.usr_roles = {'10': 100, '11': 100, '20': 200, '21': 300, '22': 300}
+        self.rne._get_usrs_roles = lambda usr_ids: {
+            str(usr_id): self.usr_roles[str(usr_id)] for usr_id in usr_ids if str(usr_id) in self.usr_roles}
+        self.rne._get_jobs_roles = lambda job_ids: {'1': 100, '2': 200}
+
+    def normalize_job_ids(self, job_ids: list, concurrent: bool) -> list:
+        with mock.patch.object(settings, 'events_concurrent_lookups', concurrent):
+            return self.rne.normalize_job_ids(job_ids)
+
+    def test_job_lookups_run_concurrently(self):
+        # Contacts and applies are only returned once both are being retrieved
+        both_started = threading.Barrier(2, timeout=5)
+        def get_jobs_contacts(job_ids, limit):
+            both_started.wait()
+            return {1: ['10', '11']}
+        def get_last_job_applies(job_ids, limit_days, limit_applies):
+            both_started.wait()
+            return {str(job_id): {'applies': [{'user_id': '20'}, {'user_id': '21'}, {'user_id': '22'}]} for job_id in job_ids}
+        self.rne._get_jobs_contacts = get_jobs_contacts
+        self.rne._get_last_job_applies = get_last_job_applies
+
+        self.assertEqual(self.normalize_job_ids([1, 2], True), [[1, 100], [2, 300]])
+
+    def test_same_results_sequentially(self):
+        self.rne._get_jobs_contacts = lambda job_ids, limit: {1: ['10', '11']}
+        self.rne._get_last_job_applies = lambda job_ids, limit_days, limit_applies: {
+            str(job_id): {'applies': [{'user_id': '20'}]} for job_id in job_ids if job_id != 3}
+        self.assertEqual(self.normalize_job_ids([1, 2, 3], False), self.normalize_job_ids([1, 2, 3], True))
+
+    def test_one_result_per_job(self):
+        # Job 1 inferred from contacts, job 2 from applies, job 3 not inferred
+        self.rne._get_jobs_contacts = lambda job_ids, limit: {1: [10, 11]}
+        self.rne._get_last_job_applies = lambda job_ids, limit_days, limit_applies: {
+            str(job_id): {'applies': [{'user_id': '20'}, {'user_id': '21'}]} for job_id in job_ids if job_id != 3}
+        for concurrent in [False, True]:
+            self.assertEqual(self.normalize_job_ids([3, 1, 2, 3], concurrent), [[3, 0], [1, 100], [2, 200]])
+
+        with mock.patch.object(settings, 'events_combine_contacts_applies', True), \
+                mock.patch.object(settings, 'events_vote_weights', {'contact': 1.0, 'apply': 3.0}):
+            self.assertEqual(self.normalize_job_ids([1], False), [[1, 200]])
+
+    def test_counted_jobs_not_inferred_again(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        contacts_requests = []
+        def get_jobs_contacts(job_ids, limit):
+            contacts_requests.append(list(job_ids))
+            return {1: ['10', '11']}
+        self.rne._get_jobs_contacts = get_jobs_contacts
+        self.rne._get_last_job_applies = lambda job_ids, limit_days, limit_applies: {}
+
+        with mock.patch.object(role_normalizer_events, 'vote_counters', VoteCounters(os.path.join(tmp_dir.name, 'counters.db'))):
+            self.assertEqual(self.normalize_job_ids([1, 2], False), [[1, 100], [2, 0]])
+            # Job 1 counted from its votes, job 2 without votes inferred from scratch again
+            self.assertEqual(self.normalize_job_ids([2, 1], False), [[2, 0], [1, 100]])
+        self.assertEqual(contacts_requests, [[1, 2], [2]])
+
+    def test_users_looked_up_by_chunks(self):
+        applies_requests = []
+        def get_last_users_applies(usr_ids, limit_days, limit_applies):
+            applies_requests.append(list(usr_ids))
+            return {str(usr_id): {'applies': [{'job_id': '1' if usr_id % 2 else '2'}]} for usr_id in usr_ids}
+        self.rne._get_last_users_applies_from_api = get_last_users_applies
+
+        with mock.patch.object(settings, 'events_users_chunk_size', 2):
+            with mock.patch.object(settings, 'events_concurrent_lookups', True):
+                inferred_roles = self.rne.normalize_usr_ids([1, 2, 3, 4, 5])
+            self.assertEqual(sorted(applies_requests), [[1, 2], [3, 4], [5]])
+            with mock.patch.object(settings, 'events_concurrent_lookups', False):
+                self.assertEqual(self.rne.normalize_usr_ids([1, 2, 3, 4, 5]), inferred_roles)
+        self.assertEqual(inferred_roles, [['1', 100], ['2', 200], ['3', 100], ['4', 200], ['5', 100]])
+
+    def test_concurrent_lookups_time_out(self):
+        released = threading.Event()
+        self.addCleanup(released.set)
+        applies_requests = []
+        def get_last_users_applies(usr_ids, limit_days, limit_applies):
+            applies_requests.append(list(usr_ids))
+            released.wait(5)
+            return {}
+        self.rne._get_last_users_applies_from_api = get_last_users_applies
+        self.rne._get_jobs_contacts = lambda job_ids, limit: released.wait(5) and {}
+        self.rne._get_last_job_applies = lambda job_ids, limit_days, limit_applies: {}
+
+        with mock.patch.object(settings, 'events_concurrent_lookups_timeout', 0.1):
+            # Requests fail, as if a sequential lookup timed out
+            with self.assertRaises(futures.TimeoutError):
+                self.normalize_job_ids([1, 2], True)
+            with mock.patch.object(settings, 'events_users_chunk_size', 1), \
+                    self.assertRaises(futures.TimeoutError):
+                self.rne.normalize_usr_ids(list(range(2 * settings.events_lookup_threads)))
+        released.set()
+        self.rne.executor.shutdown()
+        # Chunks waiting for a thread were cancelled, those running ended on their own
+        self.assertEqual(len(applies_requests), settings.events_lookup_threads - 1)
+
+
+class DbConnectionTest(unittest.TestCase):
+
+    """
+    Lookups by IDs against SQLite databases standing in for MySQL schemas.
+    """
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        def connect(_):
+            con = sqlite3.connect(os.path.join(tmp_dir.name, 'main.db'), check_same_thread=False)
+            for schema in ['conline', 'Data_Warehouse']:
+                con.execute(f"ATTACH DATABASE '{os.path.join(tmp_dir.name, schema)}.db' AS {schema}")
+            return con
+        self.connect = connect
+
+        with mock.patch.object(DbConnection, '_connect', connect):
+            self.db_con = DbConnection(user='test', password='', host=tmp_dir.name)
+        self.db_con.placeholder = '?'
+        self.addCleanup(self.db_con.pool.executor.shutdown)
+
+        con = connect(None)
+        con.executescript("""
+            CREATE TABLE conline.vag (vag_id INTEGER);
+            CREATE TABLE conline.vag_cargo (vag_id INTEGER, cargo_id INTEGER);
+            CREATE TABLE conline.cargo (cargo_id INTEGER);
+            CREATE TABLE conline.cur (cur_id INTEGER, usr_id INTEGER, data_alteracao TEXT);
+            CREATE TABLE conline.cur_cargo (cur_id INTEGER, cargo_id INTEGER);
+            CREATE TABLE Data_Warehouse.f_contatos (vag_id INTEGER, usr_id INTEGER, dim_data_contato_id INTEGER);
+            CREATE TABLE Data_Warehouse.dim_data (dim_data_id INTEGER);
+        """)
+        self.job_ids = list(range(1, 2501))
+        con.executemany('INSERT INTO conline.vag VALUES (?)', [(job_id,) for job_id in self.job_ids])
+        con.executemany('INSERT INTO conline.vag_cargo VALUES (?, ?)', [(job_id, job_id % 7) for job_id in self.job_ids])
+        con.executemany('INSERT INTO conline.cur VALUES (?, ?, ?)', [
+            (usr_id, usr_id, '2024-01-01 00:00:00' if usr_id == 2500 else '2023-01-01 00:00:00') for usr_id in self.job_ids])
+        con.executemany('INSERT INTO conline.cur_cargo VALUES (?, ?)', [(usr_id, usr_id % 5) for usr_id in self.job_ids])
+        con.executemany('INSERT INTO Data_Warehouse.f_contatos VALUES (?, ?, 1)', [
+            (job_id, usr_id) for job_id in self.job_ids if job_id % 3 == 0 for usr_id in range(job_id, job_id + 3)])
+        con.commit()
+        con.close()
+
+        self.rne = RoleNormalizerEvents.__new__(RoleNormalizerEvents)
+        self.rne.db_con = self.rne.dw_con = self.db_con
+        for cache_name in ['job_roles_cache', 'user_roles_cache']:
+            patcher = mock.patch.object(role_normalizer_events, cache_name, RoleCache(cache_name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_lookups_by_chunks(self):
+        queries = []
+        fetch_all = self.db_con.fetch_all
+        def count_fetch_all(query, args=None):
+            queries.append(args)
+            return fetch_all(query, args)
+        self.db_con.fetch_all = count_fetch_all
+
+        with mock.patch.object(settings, 'events_db_batch_size', 100):
+            jobs_roles = self.rne._get_jobs_roles(self.job_ids)
+            usrs_roles = self.rne._get_usrs_roles(self.job_ids + [9999])
+            jobs_contacts = self.rne._get_jobs_contacts(self.job_ids, 10)
+
+        self.assertEqual(len(queries), 25 + 26 + 25)
+        self.assertTrue(all(len(args) <= 100 for args in queries))
+        self.assertEqual(jobs_roles, {str(job_id): job_id % 7 for job_id in self.job_ids})
+        self.assertEqual(usrs_roles, {str(usr_id): usr_id % 5 for usr_id in self.job_ids})
+        self.assertEqual(jobs_contacts, {
+            job_id: [job_id, job_id + 1, job_id + 2] for job_id in self.job_ids if job_id % 3 == 0})
+
+    def test_roles_cached(self):
+        queries = []
+        fetch_all = self.db_con.fetch_all
+        def count_fetch_all(query, args=None):
+            queries.append(list(args))
+            return fetch_all(query, args)
+        self.db_con.fetch_all = count_fetch_all
+
+        self.assertEqual(self.rne._get_jobs_roles([1, 2, 9999]), {'1': 1, '2': 2})
+        # Only misses fetched, IDs without role cached too
+        self.assertEqual(self.rne._get_jobs_roles(['1', 3, 9999]), {'1': 1, '3': 3})
+        self.assertEqual(queries, [[1, 2, 9999], [3]])
+        self.assertEqual((role_normalizer_events.job_roles_cache.hits, role_normalizer_events.job_roles_cache.misses), (2, 4))
+
+        # IDs without role expire first
+        with mock.patch('time.monotonic', return_value=time.monotonic() + settings.events_roles_cache_negative_ttl + 1):
+            self.rne._get_jobs_roles([1, 9999])
+        self.assertEqual(queries[-1], [9999])
+
+    def test_contacts_limited_to_most_recent(self):
+        con = self.connect(None)
+        con.executemany('INSERT INTO Data_Warehouse.dim_data VALUES (?)', [(1,), (2,), (3,)])
+        con.executemany('INSERT INTO Data_Warehouse.f_contatos VALUES (3, ?, ?)', [(10, 3), (11, 2), (12, 3)])
+        con.commit()
+        con.close()
+
+        # Most recent first, rows beyond the limit not fetched
+        self.assertEqual(self.rne._get_jobs_contacts([3, 6], 2), {3: [10, 12], 6: [6, 7]})
+        self.assertEqual(len(self.rne._get_jobs_contacts([3], 10)[3]), 6)
+
+    def test_jobs_inferred_from_contacts(self):
+        # Users contacted are fetched as int IDs, their roles keyed by user ID string
+        con = self.connect(None)
+        con.execute('INSERT INTO Data_Warehouse.f_contatos VALUES (6, 11, 1)')
+        con.commit()
+        con.close()
+        self.rne.executor = futures.ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.rne.executor.shutdown)
+        self.rne._get_last_job_applies = lambda job_ids, limit_days, limit_applies: {}
+
+        self.assertEqual(self.rne._get_jobs_contacts([6], 10), {6: [6, 7, 8, 11]})
+        for concurrent in [False, True]:
+            with mock.patch.object(settings, 'events_concurrent_lookups', concurrent):
+                # Roles 1, 2, 3 and 1 of the users contacted
+                self.assertEqual(self.rne.normalize_job_ids([6, 1]), [[6, 1], [1, 0]])
+
+    def test_roles_snapshot(self):
+        queries = []
+        fetch_all = self.db_con.fetch_all
+        def count_fetch_all(query, args=None):
+            queries.append(list(args))
+            return fetch_all(query, args)
+        self.db_con.fetch_all = count_fetch_all
+
+        with mock.patch.object(settings, 'events_snapshot_dir', self.tmp_dir), \
+                mock.patch.object(settings, 'events_snapshot_page_size', 700):
+            snapshots = RoleSnapshots()
+            snapshots.user_roles.refresh(self.db_con)
+            # Built by pages of IDs, rows of the last ID of full pages read again with the next one
+            self.assertEqual([args[-1] for args in queries], [-1, 699, 1398, 2097, 2500])
+
+            # Only IDs newer than the snapshot are looked up in the database, users without role aren't
+            queries.clear()
+            with mock.patch.object(role_normalizer_events, 'role_snapshots', snapshots):
+                self.assertEqual(self.rne._get_usrs_roles([1, 5, 2501]), {'1': 1})
+            self.assertEqual(queries, [[2501]])
+
+            # New users and users modified since added
+            con = self.connect(None)
+            con.execute("INSERT INTO conline.cur VALUES (2501, 2501, '2024-01-02 00:00:00')")
+            con.execute("INSERT INTO conline.cur_cargo VALUES (2501, 7)")
+            con.execute("UPDATE conline.cur_cargo SET cargo_id = 8 WHERE cur_id = 5")
+            con.execute("UPDATE conline.cur SET data_alteracao = '2024-01-02 00:00:00' WHERE cur_id = 5")
+            con.commit()
+            con.close()
+            queries.clear()
+            snapshots.user_roles.refresh(self.db_con)
+            # New users by ID, modified users since the last modification date snapshotted, by index
+            self.assertEqual(queries, [[2500, -1], [2500, 2501], ['2024-01-01 00:00:00', -1], ['2024-01-01 00:00:00', 2501]])
+            roles, newer_ids = snapshots.user_roles.lookup([1, '5', 2501, 2502])
+            self.assertEqual((roles, newer_ids), ({'1': 1, '5': 8, '2501': 7}, [2502]))
+
+    def test_batch_fetch_all(self):
+        query = 'SELECT vag_id FROM conline.vag WHERE vag_id IN ({}) ORDER BY vag_id'
+        rows = self.db_con.batch_fetch_all(query, [5, 1, 3, 2500, 2501], 2)
+        self.assertEqual(sorted(rows), [(1,), (3,), (5,), (2500,)])
+        self.assertEqual(self.db_con.batch_fetch_all(query, []), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
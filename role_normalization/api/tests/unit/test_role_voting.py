@@ -0,0 +1,37 @@
+import unittest
+from unittest import mock
+
+from role_normalization import settings
+from role_normalization.api.events.role_voting import vote_roles
+
+
+class RoleVotingTest(unittest.TestCase):
+
+    def test_most_voted_roles(self):
+        votes = [
+            ('1', 10, None, 'apply'), ('1', 20, None, 'apply'), ('1', 20, None, 'apply'),
+            # Ties won by the role voted first, votes without role ignored
+            ('2', 30, None, 'apply'), ('2', 0, None, 'apply'), ('2', 40, None, 'apply'), ('2', None, None, 'apply'),
+            ('3', 0, None, 'apply'),
+        ]
+        self.assertEqual(vote_roles(votes), {'1': 20, '2': 30})
+        self.assertEqual(vote_roles([]), {})
+
+    def test_weighted_votes(self):
+        day = 86400
+        now = 100 * day
+        votes = [
+            (1, 10, now - 30 * day, 'apply'), (1, 10, now - 30 * day, 'apply'),
+            # Timestamps in milliseconds
+            (1, 20, now * 1000, 'apply'),
+            (2, 10, None, 'contact'), (2, 20, None, 'apply'), (2, 20, None, 'apply'),
+        ]
+        self.assertEqual(vote_roles(votes, now), {1: 10, 2: 20})
+
+        with mock.patch.object(settings, 'events_vote_half_life_days', 10), \
+                mock.patch.object(settings, 'events_vote_weights', {'contact': 3.0, 'apply': 1.0}):
+            self.assertEqual(vote_roles(votes, now), {1: 20, 2: 10})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from role_normalization import settings
+from role_normalization.api.events.role_voting import vote_roles
+from role_normalization.api.events.vote_counters import (
+    LocalEventsQueue, VoteCounters, VoteEventsConsumer, histogram_dtype, parse_events, top_role)
+
+
+class StubNormalizer:
+
+    """
+    Roles of users and jobs of events, as looked up by RoleNormalizerEvents.
+    """
+
+    usr_roles = {'10': 100, '11': 200, '12': 200}
+    job_roles = {'1': 300, '2': 400}
+
+    def _get_usrs_roles(self, usr_ids):
+        return {str(usr_id): self.usr_roles[str(usr_id)] for usr_id in usr_ids if str(usr_id) in self.usr_roles}
+
+    def _get_jobs_roles(self, job_ids):
+        return {str(job_id): self.job_roles[str(job_id)] for job_id in job_ids if str(job_id) in self.job_roles}
+
+
+class VoteCountersTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.counters = VoteCounters(os.path.join(tmp_dir.name, 'counters.db'))
+        self.events_queue = LocalEventsQueue()
+        self.consumer = VoteEventsConsumer(self.counters, self.events_queue)
+        self.consumer.normalizer = StubNormalizer()
+
+    def consume(self, *events):
+        for event in events:
+            self.events_queue.publish(event)
+        self.events_queue.close()
+        self.events_queue.consume(self.consumer.handle)
+
+    def test_top_role(self):
+        histogram = np.array([(1, 300, 2.0), (0, 100, 1.0), (0, 200, 1.0)], dtype=histogram_dtype)
+        # Only contacts, unless combined with applies, ties won by the role voted first
+        self.assertEqual(top_role(histogram), 100)
+        with mock.patch.object(settings, 'events_combine_contacts_applies', True):
+            self.assertEqual(top_role(histogram), 300)
+            with mock.patch.object(settings, 'events_vote_weights', {'contact': 3.0, 'apply': 1.0}):
+                self.assertEqual(top_role(histogram), 100)
+        self.assertEqual(top_role(histogram[:1]), 300)
+        self.assertEqual(top_role(histogram[:0]), 0)
+
+    def test_counted_then_updated_by_events(self):
+        self.counters.count('job', [(1, 100, None, 'apply'), (1, None, None, 'apply'), (3, None, None, 'apply')])
+        self.counters.count('user', [('10', 300, None, 'apply')])
+        # IDs without votes with role aren't counted
+        self.assertEqual(self.counters.get_roles('job', [1, 2, 3]), {'1': 100})
+
+        self.consume(
+            {'type': 'apply', 'job_id': 1, 'user_id': 11, 'timestamp': 0},
+            [{'type': 'apply', 'job_id': 1, 'user_id': 12}, {'type': 'apply', 'job_id': 2, 'user_id': 10}],
+            {'type': 'apply', 'job_id': 2, 'user_id': 10},
+            {'type': 'view', 'job_id': 1, 'user_id': 10})
+        # Job 1 now voted for by more users of role 200, job 2 and user 11 not counted yet
+        self.assertEqual(self.counters.get_roles('job', [1, 2]), {'1': 200})
+        self.assertEqual(self.counters.get_roles('user', [10, 11]), {'10': 400})
+
+        # A contact outweighs applies, unless combined
+        self.consume({'type': 'contact', 'job_id': 1, 'user_id': 10})
+        self.assertEqual(self.counters.get_roles('job', [1]), {'1': 100})
+
+    def test_counters_expire(self):
+        self.counters.count('job', [(1, 100, None, 'contact')])
+        with mock.patch.object(settings, 'events_vote_counters_max_age', 0):
+            self.assertEqual(self.counters.get_roles('job', [1]), {})
+            self.consume({'type': 'contact', 'job_id': 1, 'user_id': 11})
+        self.assertEqual(self.counters.get_roles('job', [1]), {'1': 100})
+
+    def test_votes_decay(self):
+        now = time.time()
+        with mock.patch.object(settings, 'events_vote_half_life_days', 1), \
+                mock.patch.object(settings, 'events_vote_counters_max_age', 7 * 86400):
+            with mock.patch('time.time', return_value=now):
+                self.counters.count('job', [(1, 100, now, 'apply')])
+            # Two days later, a vote a day old: the counted vote decayed further, by 2 days in all
+            with mock.patch('time.time', return_value=now + 2 * 86400):
+                self.consume({'type': 'apply', 'job_id': 1, 'user_id': 11, 'timestamp': now + 86400})
+                votes = [(1, 100, now, 'apply'), (1, 200, now + 86400, 'apply')]
+                self.assertEqual(vote_roles(votes), {1: 200})
+                self.assertEqual(self.counters.get_roles('job', [1]), {'1': 200})
+            histogram, decayed_at = self.counters._connection().execute(
+                'SELECT histogram, decayed_at FROM counters WHERE id = ?', ['1']).fetchone()
+            np.testing.assert_allclose(np.frombuffer(histogram, dtype=histogram_dtype)['weight'], [0.25, 0.5], rtol=1e-5)
+            self.assertEqual(decayed_at, now + 2 * 86400)
+
+    def test_malformed_events_skipped(self):
+        self.assertEqual(parse_events(b'{"type": "apply"'), [])
+        self.assertEqual(parse_events(b'[{"type": "apply", "job_id": 1}, 2, {"type": "contact", "job_id": 1, "user_id": 2}]'), [
+            {'type': 'contact', 'job_id': 1, 'user_id': 2}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -705,6 +705,10 @@ def _get_normalized_roles(roles: List[Role]) -> List[Role]:
         response = requests.post(role_norm_api_url, headers=headers, data=json.dumps(payload))
         _log(f'Role Normalization API response: {response.text}', 'debug')
 
+        # Refused while the API is busy with interactive requests - raise, so the request is retried
+        if response.status_code == 503:
+            response.raise_for_status()
+
         if response.status_code == 200:
 
             api_normalized_roles = response.json()
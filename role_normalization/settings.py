@@ -8,7 +8,7 @@ from functools import wraps
 from spectree import SpecTree
 
 
-# Decorator to be used with lru_cache decorator in functions that have dict and/or list arguments
+# Decorator to be used with lru_cache (or method_cache) decorator in functions that have dict and/or list arguments
 # Usage:
 #   @lru_hash_mutable
 #   @lru_cache
@@ -17,6 +17,8 @@ from spectree import SpecTree
 def lru_hash_mutable(func):
     """
     Transform mutable dicts and lists into immutable, so they are compatible with lru_cache decorator.
+    The lru_cache underneath is thread safe - its lookups and updates happen atomically - so decorated
+    functions can be called by many threads at once.
     """
     class HashableDict(dict):
         def __hash__(self):
@@ -28,9 +30,9 @@ def lru_hash_mutable(func):
     def wrapped(*args, **kwargs):
         args = tuple([HashableDict(arg) if isinstance(arg, dict) else HashableList(arg) if isinstance(arg, list) else arg for arg in args])
         kwargs = {k: HashableDict(v) if isinstance(v, dict) else HashableList(v) if isinstance(v, list) else v for k, v in kwargs.items()}
-        wrapped.cache_info = func.cache_info
-        wrapped.cache_clear = func.cache_clear
         return func(*args, **kwargs)
+    wrapped.cache_info = func.cache_info
+    wrapped.cache_clear = func.cache_clear
     return wrapped
 builtins.lru_hash_mutable = lru_hash_mutable
 
@@ -108,10 +110,38 @@ mysql_read_applies_table = lambda: get_secret(aws_sm_prefix, 'MySQL', env, 'read
 # Docs available at /doc/redoc and /doc/swagger
 spec = SpecTree('falcon', title='Role Normalization API', version='v1', path='v1/role_normalization/catho/doc')
 
+# Same docs and validation for the ASGI variant of the API, served by asgi_api.py
+asgi_spec = SpecTree('falcon-asgi', title='Role Normalization API', version='v1', path='v1/role_normalization/catho/doc')
+
+# Fraction of normalization responses validated against their schema, from 0.0 to 1.0 - responses
+# not sampled are serialized directly, skipping pydantic validation of each normalized role
+response_validation_sample_rate = float(os.getenv(
+    'ROLE_NORM_RESPONSE_VALIDATION_SAMPLE_RATE',
+    default='1.0' if env != 'prod' else '0.01'))
+
+# Max normalized roles whose encoded JSON is cached, per perfil IDs filter, to assemble responses
+response_fragments_max_size = 200000
+
+# Per request latency budget, in milliseconds, sent in this header or in the latency_budget_ms query
+# parameter - roles normalized once less than latency_budget_full_min_ms is left skip Word2Vec and
+# correct typos with edit distance 1 only, and once less than latency_budget_reduced_min_ms is left
+# skip typo correction too, as they do once it's used up - roles are never left unmatched. Titles degraded
+# are listed in latency_budget_degraded_header
+latency_budget_header = 'X-Latency-Budget-Ms'
+latency_budget_degraded_header = 'X-Degraded-Titles'
+latency_budget_full_min_ms = int(os.getenv('ROLE_NORM_LATENCY_BUDGET_FULL_MIN_MS', default=20))
+latency_budget_reduced_min_ms = int(os.getenv('ROLE_NORM_LATENCY_BUDGET_REDUCED_MIN_MS', default=5))
+
+# Requests with this header, set to the debug token, are normalized bypassing caches and profiled,
+# see RequestProfiler - profiles up to this size, in bytes, are also returned in a response header
+profile_header = 'X-Debug-Profile'
+profile_response_header_max_size = 4096
+
 role_norm_api_host = lambda: get_secret(aws_sm_prefix, 'RoleNormalizationApi', env, 'host')
 role_norm_api_auth = lambda: get_secret(aws_sm_prefix, 'RoleNormalizationApi', env, 'auth')
 role_norm_api_user = lambda: get_secret(aws_sm_prefix, 'RoleNormalizationApi', env, 'user')
 role_norm_api_password = lambda: get_secret(aws_sm_prefix, 'RoleNormalizationApi', env, 'password')
+role_norm_api_debug_token = lambda: get_secret(aws_sm_prefix, 'RoleNormalizationApi', env, 'debug_token')
 
 
 
@@ -125,6 +155,94 @@ events_job_applies_url = lambda: get_secret(aws_sm_prefix, 'EventsApi', env, 'jo
 # events_api_user = lambda: get_secret(aws_sm_prefix, 'EventsApi', env, 'user')
 # events_api_password = lambda: get_secret(aws_sm_prefix, 'EventsApi', env, 'password')
 
+# Lookups of events normalization that don't depend on each other - contacts and applies of the same
+# jobs, applies of chunks of events_users_chunk_size users - run concurrently, in events_lookup_threads
+# threads, each followed by the lookups depending on it as soon as its results arrive. Sequential if
+# disabled, see RoleNormalizerEvents
+events_concurrent_lookups = os.getenv('ROLE_NORM_EVENTS_CONCURRENT_LOOKUPS', default='true').lower() == 'true'
+events_lookup_threads = 4
+events_users_chunk_size = 250
+# Seconds concurrent lookups of a request may take altogether - once elapsed, lookups not started yet
+# are cancelled and the request fails, as sequential lookups do once one times out. Lookups already
+# running still end on their own, after at most events_lookup_timeout per request or query attempt
+events_concurrent_lookups_timeout = float(os.getenv('ROLE_NORM_EVENTS_CONCURRENT_LOOKUPS_TIMEOUT', default=180))
+# Seconds each Events API request, or each database query attempt, may take
+events_lookup_timeout = float(os.getenv('ROLE_NORM_EVENTS_LOOKUP_TIMEOUT', default=60))
+# Database connections of each worker process are pooled by host, see events/connection_pool.py: at most
+# events_db_pool_size per host, waiting up to events_db_pool_wait seconds for a free one. Connections idle
+# for longer than events_db_health_check_idle seconds are pinged before use, and closed once idle for longer
+# than events_db_max_idle seconds
+events_db_pool_size = int(os.getenv('ROLE_NORM_EVENTS_DB_POOL_SIZE', default=4))
+events_db_pool_wait = 30
+events_db_health_check_idle = 30
+events_db_max_idle = int(os.getenv('ROLE_NORM_EVENTS_DB_MAX_IDLE', default=300))
+events_db_connect_timeout = 10
+# IDs per query of lookups by IDs, queries of the same lookup run concurrently, see DbConnection.batch_fetch()
+events_db_batch_size = int(os.getenv('ROLE_NORM_EVENTS_DB_BATCH_SIZE', default=1000))
+# Events API requests of each worker process keep up to events_api_pool_size connections alive, and are
+# retried events_api_retries times if failing to connect or unavailable, backing off exponentially from
+# events_api_backoff seconds. Applies of many IDs are requested by concurrent sub-requests of
+# events_api_batch_size IDs, see events/events_api_client.py
+events_api_pool_size = int(os.getenv('ROLE_NORM_EVENTS_API_POOL_SIZE', default=8))
+events_api_retries = 2
+events_api_backoff = 0.2
+events_api_batch_size = int(os.getenv('ROLE_NORM_EVENTS_API_BATCH_SIZE', default=100))
+events_api_connect_timeout = 5
+# Roles of jobs and users are inferred by weighted votes of the roles of users contacted or who applied, or of
+# jobs applied to, see events/role_voting.py - weighted by source, "contact" or "apply", and halving every
+# events_vote_half_life_days days since the apply, if set. Applies are only used for jobs without roles from
+# contacts, unless events_combine_contacts_applies
+events_vote_weights = {'contact': 1.0, 'apply': 1.0}
+events_vote_half_life_days = float(os.getenv('ROLE_NORM_EVENTS_VOTE_HALF_LIFE_DAYS', default=0))
+events_combine_contacts_applies = os.getenv('ROLE_NORM_EVENTS_COMBINE_CONTACTS_APPLIES', default='false').lower() == 'true'
+# Most recent contacts of each job retrieved to infer its role, limited by the query itself
+events_contacts_limit = int(os.getenv('ROLE_NORM_EVENTS_CONTACTS_LIMIT', default=200))
+# Roles of jobs and users are cached by each worker process for events_roles_cache_ttl seconds, 0 disables
+# caching, up to events_roles_cache_max_size of them - IDs without role for events_roles_cache_negative_ttl
+# seconds. If events_shared_cache_path is set, they're also cached in a SQLite database shared by every
+# worker of the host, ideally under /dev/shm. See events/role_cache.py
+events_roles_cache_ttl = int(os.getenv('ROLE_NORM_EVENTS_ROLES_CACHE_TTL', default=600))
+events_roles_cache_negative_ttl = 60
+events_roles_cache_max_size = 200000
+events_shared_cache_path = os.getenv('ROLE_NORM_EVENTS_SHARED_CACHE_PATH')
+# If events_snapshot_dir is set, roles of every job and user are kept in local snapshot files there, mapped by
+# every worker, so only IDs newer than the snapshot are looked up in the database - see events/role_snapshot.py.
+# One worker refreshes them every events_snapshot_refresh_interval seconds, reading events_snapshot_page_size
+# rows per query, and rebuilds them every events_snapshot_rebuild_interval seconds. Workers check for refreshed
+# snapshots every events_snapshot_check_interval seconds
+events_snapshot_dir = os.getenv('ROLE_NORM_EVENTS_SNAPSHOT_DIR')
+events_snapshot_refresh_interval = int(os.getenv('ROLE_NORM_EVENTS_SNAPSHOT_REFRESH_INTERVAL', default=300))
+events_snapshot_rebuild_interval = 24 * 60 * 60
+events_snapshot_check_interval = 10
+events_snapshot_page_size = 100000
+# If events_vote_counters_path is set, votes of every job and user whose role is inferred from scratch are kept
+# as counters of votes per role, in a SQLite database shared by every worker of the host, and updated from apply
+# and contact events of RabbitMQ fanout exchange events_votes_exchange as they happen - consumed by one worker of
+# the host, events_votes_batch_size events at a time. Roles of counted jobs and users are read from their counters,
+# until inferred from scratch again after events_vote_counters_max_age seconds. See events/vote_counters.py
+events_vote_counters_path = os.getenv('ROLE_NORM_EVENTS_VOTE_COUNTERS_PATH')
+events_vote_counters_max_age = int(os.getenv('ROLE_NORM_EVENTS_VOTE_COUNTERS_MAX_AGE', default=24 * 60 * 60))
+events_votes_exchange = os.getenv('ROLE_NORM_EVENTS_VOTES_EXCHANGE', default='role_norm_events_votes')
+events_votes_batch_size = 500
+# If events_bulk_dir is set, IDs of any number of jobs or users can be submitted as bulk jobs, kept there - a shared
+# filesystem if several hosts serve the events API - and inferred in the background, events_bulk_chunk_size IDs at
+# a time, by at most events_bulk_runners workers sharing the directory. Chunks failing are retried events_bulk_attempts
+# times, then the job is retried from its last chunk after events_bulk_retry_interval seconds, doubled by each attempt
+# up to events_bulk_max_retry_interval, and failed after events_bulk_job_attempts attempts in a row without progress.
+# Results are kept for events_bulk_retention seconds once done, and clients may wait up to events_bulk_max_wait seconds
+# for new results - a few seconds, as a waiting request holds a whole sync Gunicorn worker of the events API, which
+# would otherwise be taken from interactive requests. See events/bulk_jobs.py
+events_bulk_dir = os.getenv('ROLE_NORM_EVENTS_BULK_DIR')
+events_bulk_chunk_size = int(os.getenv('ROLE_NORM_EVENTS_BULK_CHUNK_SIZE', default=1000))
+events_bulk_runners = int(os.getenv('ROLE_NORM_EVENTS_BULK_RUNNERS', default=1))
+events_bulk_attempts = 3
+events_bulk_job_attempts = int(os.getenv('ROLE_NORM_EVENTS_BULK_JOB_ATTEMPTS', default=8))
+events_bulk_retry_interval = 60
+events_bulk_max_retry_interval = 60 * 60
+events_bulk_retention = 7 * 24 * 60 * 60
+events_bulk_max_wait = 5
+events_bulk_max_ids = 50000000
+
 #
 # AB test settings
 #
@@ -146,6 +264,129 @@ rabbitmq_password = lambda: get_secret(aws_sm_prefix, 'RabbitMQ', env, 'password
 rabbitmq_index_users_es_queue = 'indexer_users'
 rabbitmq_index_jobs_es_queue = 'indexer_jobs'
 
+#
+# Model bundle settings
+#
+
+# Single file with every model part used by the Role Normalization API, created with:
+#   python3 role_normalization/api/models/compile_model.py
+# If enabled but not found, models are created from gazetteers, pickles and database roles
+model_bundle_enabled = True
+model_bundle_path = os.getenv(
+    'ROLE_NORM_MODEL_BUNDLE',
+    default=os.path.dirname(os.path.realpath(__file__)) + '/api/models/load/role_model.bundle')
+# Check each model part's hash when loading the bundle
+model_bundle_verify_hashes = True
+
+#
+# Background loading settings
+#
+
+# Load models and database connections in a background thread once the worker process starts, instead
+# of when the app module is imported, so workers listen right away. Incompatible with Gunicorn's
+# preload_app, which is disabled when enabled
+background_loading = os.getenv('ROLE_NORM_BACKGROUND_LOADING', default='false').lower() == 'true'
+# Seconds requests wait for components still loading before being answered with 503 - 0 answers right away
+component_wait = float(os.getenv('ROLE_NORM_COMPONENT_WAIT', default=0))
+# Retry-After, in seconds, of requests answered with 503 while components are loading
+component_retry_after = 5
+
+#
+# Bulk normalization settings
+#
+
+# Titles streamed to the bulk endpoint are normalized, and results streamed back, in chunks of this size
+bulk_chunk_size = 1000
+# Max length, in bytes, of each NDJSON line received by the bulk endpoint
+bulk_max_line_length = 4096
+
+#
+# Cache warm-up settings
+#
+
+# Titles most often received, one per line, replayed through RoleMatcher.normalize_and_match() by each
+# API worker when it starts, before /readiness reports it ready. Created from API logs with:
+#   python3 role_normalization/api/models/extract_warmup_titles.py -n 5000 LOG_FILE [LOG_FILE ...]
+# If not found, workers report ready right away
+warmup_enabled = os.getenv('ROLE_NORM_WARMUP_ENABLED', default='true').lower() == 'true'
+warmup_titles_path = os.getenv(
+    'ROLE_NORM_WARMUP_TITLES',
+    default=os.path.dirname(os.path.realpath(__file__)) + '/api/models/load/warmup_titles.txt')
+# Max titles replayed - keep it below the normalize_and_match() cache size, 8192
+warmup_max_titles = int(os.getenv('ROLE_NORM_WARMUP_MAX_TITLES', default=5000))
+
+#
+# Model reload settings
+#
+
+# Each API worker checks, every model_reload_poll_interval seconds, if the reload trigger file - touched
+# by POST /admin/reload - or gazetteer files changed, and if so reloads models in the background and
+# swaps them in, see api/model_reloader.py. 0 disables reloads
+model_reload_poll_interval = float(os.getenv('ROLE_NORM_MODEL_RELOAD_POLL_INTERVAL', default=30))
+# Shared by every worker of an instance - each instance behind the load balancer has its own
+model_reload_trigger_path = os.getenv('ROLE_NORM_MODEL_RELOAD_TRIGGER', default='/tmp/role-norm-reload')
+# Gazetteer files watched - mapping_cargo_id.json only changes role IDs, the others change normalization
+model_reload_gazetteers = (
+    'mapping_cargo_id.json',
+    'mapping_thesaurus.txt',
+    'mapping_special_character_terms.txt',
+    'mapping_gender.txt',
+    'mapping_plural.txt',
+    'mapping_conjugation.txt',
+    'stopwords.txt',
+    'locations.txt',
+)
+# Seconds between checksums of database catalog tables (conline.cargo and conline.cargo_titulo), which
+# reload models if changed. 0 disables checks - catalog changes are then loaded with POST /admin/reload
+model_reload_catalog_check_interval = float(os.getenv('ROLE_NORM_MODEL_RELOAD_CATALOG_CHECK_INTERVAL', default=0))
+# Reloads undo preload_app sharing: each worker builds its own models generation, so the models it replaces -
+# the role normalizer and spell checker if words changed, mappings, automaton - are no longer shared copy-on-write
+# with the other workers, and each worker holds a private copy of them until restarted. Swaps are at most one per
+# model_reload_min_interval seconds per worker; for large changes, restart workers with a rebuilt model bundle instead
+model_reload_min_interval = float(os.getenv('ROLE_NORM_MODEL_RELOAD_MIN_INTERVAL', default=15 * 60))
+
+#
+# Request lanes settings
+#
+
+# Normalization requests are served in separate lanes, each with its own concurrency and queue limits
+# within a worker process - requests refused are answered with 503. Sent to the lane named in this
+# header or, if missing, to the batch lane if their origin is one of request_lane_batch_origins and to
+# the interactive lane otherwise. Lanes need gthread workers: sync workers serve one request at a time
+request_lane_header = 'X-Request-Lane'
+request_lane_batch_origins = ('routine_job_role', 'routine_cv_role', 'routine_work_exp_role')
+# max_concurrency - requests normalized at once, max_queued - requests waiting for a slot, max_wait -
+# seconds a request waits for a slot, priority - lower is higher, lanes are refused new requests while
+# a higher priority lane has requests waiting. Requests waiting hold a Gunicorn thread, so the batch
+# lane's max_concurrency plus max_queued should stay well below ROLE_NORM_API_THREADS
+request_lanes = {
+    'interactive': {
+        'max_concurrency': int(os.getenv('ROLE_NORM_INTERACTIVE_LANE_CONCURRENCY', default=8)),
+        'max_queued': 32,
+        'max_wait': 2.0,
+        'priority': 0,
+    },
+    'batch': {
+        'max_concurrency': int(os.getenv('ROLE_NORM_BATCH_LANE_CONCURRENCY', default=2)),
+        'max_queued': 2,
+        'max_wait': 10.0,
+        'priority': 1,
+    },
+}
+
+#
+# ASGI API settings
+#
+
+# Processes holding preloaded models, forked from the ASGI server process, that run normalization
+asgi_pool_workers = int(os.getenv('ROLE_NORM_ASGI_POOL_WORKERS', default=os.cpu_count()))
+# Roles received by concurrent requests are coalesced into batches sent to the pool: a batch is sent
+# once it has this many distinct roles or once its first role waited this long, in seconds
+asgi_batch_max_size = 64
+asgi_batch_max_delay = 0.005
+# Max roles waiting for, or being normalized by, the pool - requests above it are answered with 503
+asgi_max_pending_roles = int(os.getenv('ROLE_NORM_ASGI_MAX_PENDING_ROLES', default=20000))
+
 #
 # Aho-Corasick matching settings
 #